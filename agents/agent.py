@@ -7,6 +7,9 @@ from typing import Any
 
 from openai import OpenAI
 
+from llm import estimate_request_tokens, get_limiter
+from telemetry import get_telemetry
+
 from .tools.base import Tool
 from .utils.connections import setup_mcp_connections
 from .utils.history_util import MessageHistory
@@ -76,7 +79,15 @@ class Agent:
             self.history.truncate()
             params = self._prepare_api_params()
 
-            completion = self.client.chat.completions.create(**params)
+            # Share the process-wide quota and AIMD concurrency limit with the workflows.
+            with get_telemetry().call(self.config.model, kind="agent") as record:
+                async with get_limiter().alimit(
+                    estimate_request_tokens(params["messages"], params)
+                ) as slot:
+                    record.attempts += 1
+                    completion = self.client.chat.completions.create(**params)
+                    slot.record_usage(completion.usage)
+                record.record_usage(completion.usage)
             
             output = completion.model_dump()
             response = output["choices"][0]["message"]
@@ -126,6 +137,10 @@ class Agent:
 
     async def run_async(self, user_input: str) -> list[dict[str, Any]]:
         """Run agent with MCP tools asynchronously."""
+        with get_telemetry().span("agent", agent=self.name):
+            return await self._run_with_tools(user_input)
+
+    async def _run_with_tools(self, user_input: str) -> list[dict[str, Any]]:
         async with AsyncExitStack() as stack:
             original_tools = list(self.tools)
 
@@ -1,50 +1,378 @@
-from typing import List, Dict
-from llm import llm_call, extract_xml
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Iterator, List, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+from llm import llm_call, llm_stream, llm_extract, print_stream, allm_call, allm_extract, allm_stream, StreamStats
+from batch_job import BatchJob
+from checkpoint import ChainCheckpoints, chain_key, step_key
+from prerouter import PreRouter, RouteDecision, Speculation
+from rate_limiter import estimate_tokens
+from telemetry import bind, span
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import threading
+import asyncio
+import time
+import weakref
+import queue
 import re
 
-def chain(input: str, prompts: List[str]) -> str:
+class ItemResult(NamedTuple):
+    """Outcome of one parallel_iter input: output is None when the call raised error."""
+    index: int
+    input: str
+    output: Optional[str]
+    error: Optional[BaseException]
+
+def chain(
+    input: str,
+    prompts: List[str],
+    stream: bool = False,
+    checkpoints: Optional[ChainCheckpoints] = None,
+    **llm_kwargs: Any,
+) -> str:
     """
     Chain multiple LLM calls sequentially, passing results between steps.
     Args:
         input (str): The input to the first prompt.
         prompts (List[str]): A list of prompts to chain together.
+        stream (bool, optional): Stream each step with llm_stream and print tokens as they arrive.
+        checkpoints (ChainCheckpoints, optional): Store each step's output keyed by the input, the call
+            settings and the prompts up to that step. A rerun reuses every step whose key is unchanged
+            and resumes from the first one that failed or whose prompt was edited.
+        **llm_kwargs: Extra keyword arguments for llm_call, e.g. cache=ResponseCache(...).
     Returns:
         str: The output of the last LLM in the chain.
     """
     result = input
-    for i, prompt in enumerate(prompts):
-        print(f"Step {i + 1}:")
-        result = llm_call(f'{prompt}\nInput: {result}')
-        print(f"Output: {result}\n")
+    key = chain_key(input, **llm_kwargs) if checkpoints is not None else None
+    run = key
+    with span("chain", steps=len(prompts)):
+        for i, prompt in enumerate(prompts):
+            print(f"Step {i + 1}:")
+            step_prompt = f'{prompt}\nInput: {result}'
+            if checkpoints is not None:
+                key = step_key(key, prompt)
+                saved = checkpoints.get(key)
+                if saved is not None:
+                    result = saved
+                    print(f"Output (checkpoint): {result}\n")
+                    continue
+            with span("chain.step", step=i):
+                if stream:
+                    print("Output: ", end="")
+                    result = print_stream(llm_stream(step_prompt, **llm_kwargs))
+                    print()
+                else:
+                    result = llm_call(step_prompt, **llm_kwargs)
+                    print(f"Output: {result}\n")
+            if checkpoints is not None:
+                checkpoints.set(key, run, i, prompt, result)
     return result
 
-def parallel(inputs: List[str], prompt: str, n_workers: int = 3) -> List[str]:
+_DONE = object()
+
+def chain_many(
+    inputs: Iterable[str],
+    prompts: List[str],
+    n_workers: Union[int, Sequence[int]] = 3,
+    queue_size: Optional[int] = None,
+    **llm_kwargs: Any,
+) -> Iterator[ItemResult]:
+    """
+    Run chain over many inputs as a pipeline: each step is a stage with its own worker threads, and
+    bounded queues between stages let different inputs occupy different steps at the same time.
+    Args:
+        inputs (Iterable[str]): The inputs; pulled lazily as the first stage has room.
+        prompts (List[str]): The prompts to chain together, one stage each.
+        n_workers (int | Sequence[int], optional): Worker threads per stage, or one count for every stage.
+        queue_size (int, optional): Capacity of the queue in front of each stage and of the output queue.
+            Defaults to the stage's worker count (the last stage's for the output), so at most about twice
+            the total workers' worth of inputs is in memory, however slowly the results are consumed.
+        **llm_kwargs: Extra keyword arguments for llm_call, e.g. cache=ResponseCache(...).
+    Returns:
+        Iterator[ItemResult]: One result per input in completion order; output is the last step's output.
+            A failed step yields its error and skips the remaining steps for that input.
+    """
+    workers = [n_workers] * len(prompts) if isinstance(n_workers, int) else list(n_workers)
+    if not prompts or len(workers) != len(prompts):
+        raise ValueError(f"need one worker count per prompt, got {len(workers)} for {len(prompts)} prompts")
+    # The output queue is bounded too, so a slow or idle consumer stalls the pipeline instead of the inputs
+    # piling up in it.
+    queues = [queue.Queue(maxsize=queue_size or n) for n in workers + workers[-1:]]
+    remaining = list(workers)
+    feed_errors: List[BaseException] = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def put(q: queue.Queue, item: Any) -> None:
+        # Give up once the consumer has gone away, so no thread stays blocked on a full queue.
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def feed() -> None:
+        try:
+            for i, x in enumerate(inputs):
+                if stop.is_set():
+                    break
+                put(queues[0], (i, x, x, None))
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            for _ in range(workers[0]):
+                put(queues[0], _DONE)
+
+    def stage(step: int) -> None:
+        prompt = prompts[step]
+        while not stop.is_set():
+            try:
+                item = queues[step].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                break
+            i, x, result, error = item
+            if error is None:
+                try:
+                    with span("chain.step", step=step, index=i):
+                        result = llm_call(f'{prompt}\nInput: {result}', **llm_kwargs)
+                except Exception as e:
+                    result, error = None, e
+            put(queues[step + 1], (i, x, result, error))
+        with lock:
+            remaining[step] -= 1
+            last = remaining[step] == 0
+        if last:
+            # The last worker of a stage to finish closes the next one.
+            for _ in range(workers[step + 1] if step + 1 < len(prompts) else 1):
+                put(queues[step + 1], _DONE)
+
+    threads = [threading.Thread(target=bind(feed), daemon=True)]
+    for step, n in enumerate(workers):
+        threads += [threading.Thread(target=bind(stage), args=(step,), daemon=True) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            yield ItemResult(*item)
+        if feed_errors:
+            raise feed_errors[0]
+    finally:
+        stop.set()
+
+def parallel(inputs: List[str], prompt: str, n_workers: int = 3, **llm_kwargs: Any) -> List[str]:
     """
     Run multiple LLM calls in parallel, processing each input independently.
     Args:
         inputs (List[str]): A list of inputs to process.
         prompt (str): The prompt to use for each LLM call.
+        n_workers (int, optional): Number of worker threads.
+        **llm_kwargs: Extra keyword arguments for llm_call, e.g. cache=ResponseCache(...).
     Returns:
         List[str]: A list of outputs from each LLM call.
     """
-    with ThreadPoolExecutor(max_workers=n_workers) as executor:
-        futures = [executor.submit(llm_call, f"{prompt}\nInput: {x}") for x in inputs]
+    def run(i: int, x: str) -> str:
+        with span("parallel.item", index=i):
+            return llm_call(f"{prompt}\nInput: {x}", **llm_kwargs)
+
+    with span("parallel", items=len(inputs)), ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(bind(run), i, x) for i, x in enumerate(inputs)]
         return [f.result() for f in futures]
 
-def route(input: str, routes: Dict[str, str]) -> str:
+def parallel_iter(
+    inputs: Iterable[str],
+    prompt: str,
+    n_workers: int = 3,
+    window: Optional[int] = None,
+    ordered: bool = False,
+    reorder_buffer: Optional[int] = None,
+    **llm_kwargs: Any,
+) -> Iterator[ItemResult]:
+    """
+    Streaming variant of parallel: pull inputs lazily and yield results as they complete.
+    Args:
+        inputs (Iterable[str]): The inputs; consumed only as fast as results are taken.
+        prompt (str): The prompt to use for each LLM call.
+        n_workers (int, optional): Number of worker threads.
+        window (int, optional): Maximum calls in flight. Defaults to 2 * n_workers.
+        ordered (bool, optional): Yield in input order. A slow item then holds back later results in a
+            reorder buffer; no new inputs are pulled while it is full, so memory stays bounded.
+        reorder_buffer (int, optional): Completed-but-not-yet-yielded results allowed in ordered mode
+            beyond the window. Defaults to window.
+        **llm_kwargs: Extra keyword arguments for llm_call, e.g. cache=ResponseCache(...).
+    Returns:
+        Iterator[ItemResult]: One result per input; a failed call yields its error instead of raising.
+    """
+    window = window or 2 * n_workers
+    reorder_buffer = window if reorder_buffer is None else reorder_buffer
+
+    def run(i: int, x: str) -> str:
+        with span("parallel.item", index=i):
+            return llm_call(f"{prompt}\nInput: {x}", **llm_kwargs)
+
+    items = enumerate(inputs)
+    exhausted = False
+    in_flight: Dict[Future, Tuple[int, str]] = {}
+    buffered: Dict[int, ItemResult] = {}
+    submitted = next_index = 0
+    executor = ThreadPoolExecutor(max_workers=n_workers)
+    try:
+        while True:
+            while (not exhausted and len(in_flight) < window
+                   and (not ordered or submitted - next_index < window + reorder_buffer)):
+                try:
+                    i, x = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight[executor.submit(bind(run), i, x)] = (i, x)
+                submitted += 1
+            if not in_flight:
+                return
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, x = in_flight.pop(future)
+                error = future.exception()
+                result = ItemResult(i, x, None if error else future.result(), error)
+                if ordered:
+                    buffered[i] = result
+                else:
+                    yield result
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+    finally:
+        # Closing the generator early drops the queued calls; running ones finish in the background.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def parallel_batch(inputs: Iterable[str], prompt: str, workdir: str, **batch_kwargs: Any) -> Iterator[Optional[str]]:
+    """
+    Batch-API variant of parallel for large jobs: cheaper, and resumable from `workdir`.
+    Args:
+        inputs (Iterable[str]): The inputs, e.g. batch_job.iter_jsonl("items.jsonl", "text").
+        prompt (str): The prompt to use for each input.
+        workdir (str): Directory for the job state; rerun with the same workdir to resume.
+        **batch_kwargs: Extra keyword arguments for BatchJob, e.g. model, chunk_size or poll_interval.
+    Returns:
+        Iterator[Optional[str]]: Outputs in input order as they complete; None for inputs that failed.
+    """
+    return BatchJob(workdir, prompt, **batch_kwargs).run(inputs)
+
+def route(
+    input: str,
+    routes: Dict[str, str],
+    prerouter: Optional[PreRouter] = None,
+    speculation: Optional[Speculation] = None,
+    **llm_kwargs: Any,
+) -> str:
     """
     Route the input to the appropriate LLM based on a dictionary of routes.
     Args:
         input (str): The input to route.
         routes (Dict[str, str]): A dictionary mapping keywords to LLM names.
+        prerouter (PreRouter, optional): Local routers tried before the selector LLM call; the call is only
+            made when none of them is confident, and its decision is fed back to train them.
+        speculation (Speculation, optional): While the selector runs, start the handler call for the routes
+            it is likely to pick; the matching one is kept and the others are cancelled.
+        **llm_kwargs: Extra keyword arguments for llm_call, e.g. cache=ResponseCache(...).
     Returns:
         str: The output of the selected LLM.
     """
 
     # First determine appropriate route using LLM with chain-of-thought
     print(f"\nAvailable routes: {list(routes.keys())}")
-    selector_prompt = f"""
+    with span("route"):
+        speculative: Dict[str, _Speculative] = {}
+        decision = prerouter.decide(input, routes) if prerouter is not None else None
+        if decision is not None:
+            route_key = _prerouted(decision)
+        else:
+            if speculation is not None:
+                speculative = _speculate(input, routes, speculation, prerouter, **llm_kwargs)
+            started = time.perf_counter()
+            route_key = None
+            try:
+                # Stop the selector as soon as </selection> arrives; nothing after it is needed.
+                with span("route.selector"):
+                    route_tags = llm_extract(_selector_prompt(input, routes), ['reasoning', 'selection'], required=['selection'], **llm_kwargs)
+                route_key = _selected_route(route_tags)
+            finally:
+                # Whatever was not picked (or everything, if the selector failed) is cancelled.
+                _cancel_speculation(speculative, route_key, speculation)
+            if prerouter is not None and route_key in routes:
+                prerouter.record(input, route_key, time.perf_counter() - started)
+            if speculation is not None:
+                speculation.settle(list(speculative), route_key)
+
+        # Process input with selected specialized prompt
+        if route_key in speculative:
+            try:
+                result = speculative[route_key].future.result()
+                print("Speculative handler call matched the selection.")
+                return result
+            except Exception:
+                pass  # Fall back to a regular call below.
+        selected_prompt = routes[route_key]
+        with span("route.handler", route=route_key):
+            return llm_call(f"{selected_prompt}\nInput: {input}", **llm_kwargs)
+
+class _Speculative(NamedTuple):
+    """A handler call started before the selector finished."""
+    future: Any  # concurrent.futures.Future, or asyncio.Task in aroute
+    cancelled: threading.Event
+    stats: StreamStats
+    prompt: str
+
+def _speculative_handler(route_key: str, prompt: str, cancelled: threading.Event, stats: StreamStats, **llm_kwargs: Any) -> Optional[str]:
+    # Streamed, so that a cancelled call stops generating at the next delta instead of running to the end.
+    with span("route.handler", route=route_key, speculative=True):
+        deltas = llm_stream(prompt, stats=stats, **llm_kwargs)
+        parts = []
+        try:
+            for delta in deltas:
+                if cancelled.is_set():
+                    return None
+                parts.append(delta)
+        finally:
+            deltas.close()
+        return "".join(parts)
+
+def _speculate(input: str, routes: Dict[str, str], speculation: Speculation, prerouter: Optional[PreRouter], **llm_kwargs: Any) -> Dict[str, _Speculative]:
+    candidates = speculation.candidates(input, routes, prerouter)
+    if not candidates:
+        return {}
+    print(f"Speculating on: {candidates}")
+    speculative = {}
+    executor = ThreadPoolExecutor(max_workers=len(candidates))
+    for key in candidates:
+        prompt, cancelled, stats = f"{routes[key]}\nInput: {input}", threading.Event(), StreamStats()
+        future = executor.submit(bind(_speculative_handler), key, prompt, cancelled, stats, **llm_kwargs)
+        speculative[key] = _Speculative(future, cancelled, stats, prompt)
+    executor.shutdown(wait=False)
+    return speculative
+
+def _cancel_speculation(speculative: Dict[str, _Speculative], route_key: Optional[str], speculation: Optional[Speculation]) -> None:
+    for key, call in speculative.items():
+        if key == route_key:
+            continue
+        call.cancelled.set()
+        call.future.cancel()
+
+        def charge(future: Any, call: _Speculative = call) -> None:
+            if not future.cancelled():
+                future.exception()  # Retrieved, so a failed speculative call is not reported as unhandled.
+            # Usage when the stream finished before the cancel; otherwise prompt plus deltas received.
+            if call.stats.started:
+                speculation.waste(call.stats.total_tokens or estimate_tokens(call.prompt) + call.stats.chunks)
+
+        call.future.add_done_callback(charge)
+
+def _selector_prompt(input: str, routes: Dict[str, str]) -> str:
+    return f"""
     Analyze the input and select the most appropriate support team from these options: {list(routes.keys())}
     First explain your reasoning, then provide your selection in this XML format:
 
@@ -58,15 +386,163 @@ def route(input: str, routes: Dict[str, str]) -> str:
     </selection>
 
     Input: {input}""".strip()
-    
-    route_response = llm_call(selector_prompt)
-    reasoning = extract_xml(route_response, 'reasoning')
-    route_key = extract_xml(route_response, 'selection').strip().lower()
-    
+
+def _selected_route(route_tags: Dict[str, str]) -> str:
+    route_key = route_tags['selection'].strip().lower()
     print("Routing Analysis:")
-    print(reasoning)
+    print(route_tags['reasoning'])
     print(f"\nSelected route: {route_key}")
-    
-    # Process input with selected specialized prompt
-    selected_prompt = routes[route_key]
-    return llm_call(f"{selected_prompt}\nInput: {input}")
\ No newline at end of file
+    return route_key
+
+def _prerouted(decision: RouteDecision) -> str:
+    print(f"Selected route: {decision.route} ({decision.source}, confidence {decision.confidence:.2f})")
+    return decision.route
+
+
+# Async engine: the same workflows on AsyncOpenAI, so thousands of requests can be in flight on one
+# event loop instead of one thread each. Requests from all async workflows on a loop share one semaphore.
+_async_concurrency = 1000
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def set_async_concurrency(limit: int) -> None:
+    """Set how many requests the async workflows may have in flight per event loop (default 1000)."""
+    global _async_concurrency
+    _async_concurrency = limit
+    _semaphores.clear()
+
+def _semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(_async_concurrency)
+    return semaphore
+
+async def _acall(prompt: str, **llm_kwargs: Any) -> str:
+    async with _semaphore():
+        return await allm_call(prompt, **llm_kwargs)
+
+async def achain(
+    input: str,
+    prompts: List[str],
+    checkpoints: Optional[ChainCheckpoints] = None,
+    **llm_kwargs: Any,
+) -> str:
+    """
+    Async variant of chain.
+    Args:
+        input (str): The input to the first prompt.
+        prompts (List[str]): A list of prompts to chain together.
+        checkpoints (ChainCheckpoints, optional): Reuse and store step outputs as chain does.
+        **llm_kwargs: Extra keyword arguments for allm_call, e.g. client=get_async_client(...).
+    Returns:
+        str: The output of the last LLM in the chain.
+    """
+    result = input
+    key = chain_key(input, **llm_kwargs) if checkpoints is not None else None
+    run = key
+    with span("chain", steps=len(prompts)):
+        for i, prompt in enumerate(prompts):
+            print(f"Step {i + 1}:")
+            if checkpoints is not None:
+                key = step_key(key, prompt)
+                saved = checkpoints.get(key)
+                if saved is not None:
+                    result = saved
+                    print(f"Output (checkpoint): {result}\n")
+                    continue
+            with span("chain.step", step=i):
+                result = await _acall(f'{prompt}\nInput: {result}', **llm_kwargs)
+            print(f"Output: {result}\n")
+            if checkpoints is not None:
+                checkpoints.set(key, run, i, prompt, result)
+    return result
+
+async def aparallel(inputs: List[str], prompt: str, **llm_kwargs: Any) -> List[str]:
+    """
+    Async variant of parallel. Concurrency is bounded by the shared semaphore (see set_async_concurrency)
+    rather than a thread count.
+    Args:
+        inputs (List[str]): A list of inputs to process.
+        prompt (str): The prompt to use for each LLM call.
+        **llm_kwargs: Extra keyword arguments for allm_call, e.g. client=get_async_client(...).
+    Returns:
+        List[str]: A list of outputs from each LLM call.
+    """
+    async def run(i: int, x: str) -> str:
+        with span("parallel.item", index=i):
+            return await _acall(f"{prompt}\nInput: {x}", **llm_kwargs)
+
+    with span("parallel", items=len(inputs)):
+        return list(await asyncio.gather(*(run(i, x) for i, x in enumerate(inputs))))
+
+async def aroute(
+    input: str,
+    routes: Dict[str, str],
+    prerouter: Optional[PreRouter] = None,
+    speculation: Optional[Speculation] = None,
+    **llm_kwargs: Any,
+) -> str:
+    """
+    Async variant of route.
+    Args:
+        input (str): The input to route.
+        routes (Dict[str, str]): A dictionary mapping keywords to LLM names.
+        prerouter (PreRouter, optional): Local routers tried before the selector, as in route.
+        speculation (Speculation, optional): Start likely handler calls alongside the selector, as in route.
+        **llm_kwargs: Extra keyword arguments for allm_call, e.g. client=get_async_client(...).
+    Returns:
+        str: The output of the selected LLM.
+    """
+    print(f"\nAvailable routes: {list(routes.keys())}")
+    with span("route"):
+        speculative: Dict[str, _Speculative] = {}
+        decision = prerouter.decide(input, routes) if prerouter is not None else None
+        if decision is not None:
+            route_key = _prerouted(decision)
+        else:
+            if speculation is not None:
+                speculative = _aspeculate(input, routes, speculation, prerouter, **llm_kwargs)
+            started = time.perf_counter()
+            route_key = None
+            try:
+                with span("route.selector"):
+                    async with _semaphore():
+                        route_tags = await allm_extract(_selector_prompt(input, routes), ['reasoning', 'selection'], required=['selection'], **llm_kwargs)
+                route_key = _selected_route(route_tags)
+            finally:
+                _cancel_speculation(speculative, route_key, speculation)
+            if prerouter is not None and route_key in routes:
+                prerouter.record(input, route_key, time.perf_counter() - started)
+            if speculation is not None:
+                speculation.settle(list(speculative), route_key)
+
+        if route_key in speculative:
+            try:
+                result = await speculative[route_key].future
+                print("Speculative handler call matched the selection.")
+                return result
+            except Exception:
+                pass
+        with span("route.handler", route=route_key):
+            return await _acall(f"{routes[route_key]}\nInput: {input}", **llm_kwargs)
+
+async def _aspeculative_handler(route_key: str, prompt: str, stats: StreamStats, **llm_kwargs: Any) -> str:
+    with span("route.handler", route=route_key, speculative=True):
+        async with _semaphore():
+            deltas = allm_stream(prompt, stats=stats, **llm_kwargs)
+            try:
+                return "".join([delta async for delta in deltas])
+            finally:
+                await deltas.aclose()
+
+def _aspeculate(input: str, routes: Dict[str, str], speculation: Speculation, prerouter: Optional[PreRouter], **llm_kwargs: Any) -> Dict[str, _Speculative]:
+    candidates = speculation.candidates(input, routes, prerouter)
+    if candidates:
+        print(f"Speculating on: {candidates}")
+    speculative = {}
+    for key in candidates:
+        # Tasks are cancelled directly; the event is only there to share _cancel_speculation with route.
+        prompt, stats = f"{routes[key]}\nInput: {input}", StreamStats()
+        task = asyncio.ensure_future(_aspeculative_handler(key, prompt, stats, **llm_kwargs))
+        speculative[key] = _Speculative(task, threading.Event(), stats, prompt)
+    return speculative
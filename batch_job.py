@@ -0,0 +1,242 @@
+# Batch-job mode: run one prompt over a large input through the OpenAI-style Batch API (files + batches)
+# instead of thousands of interactive calls. Job state lives in a work directory, so an interrupted job
+# resumes where it stopped and only unfinished requests are resubmitted.
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from openai import OpenAI
+from llm import get_client, _build_messages
+import hashlib
+import json
+import time
+import os
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def iter_jsonl(path: str, field: Optional[str] = None) -> Iterator[Any]:
+    """Yield the records of a JSONL file, or record[field] when field is given."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record if field is None else record[field]
+
+
+def _error_message(record: Dict[str, Any]) -> str:
+    """Error text of a failed line in a batch output or error file."""
+    if record.get("error"):
+        return record["error"].get("message") or str(record["error"])
+    response = record.get("response") or {}
+    error = (response.get("body") or {}).get("error") or {}
+    return error.get("message") or f"HTTP {response.get('status_code')}"
+
+
+class BatchJob:
+    """
+    Run `prompt` over every input through the Batch API and stream the outputs back in input order.
+
+    The input is split into chunks of `chunk_size` requests, one batch per chunk. Everything needed to
+    resume (request files, batch ids, downloaded results) is kept under `workdir`; run the same job with
+    the same workdir again to pick up after an interruption. Requests that fail are resubmitted up to
+    `max_resubmits` times; inputs that still fail yield None and their error is kept in `errors`.
+    """
+
+    def __init__(
+        self,
+        workdir: str,
+        prompt: str,
+        system_prompt: str = 'Answer in Chinese',
+        model: str = 'qwen-plus',
+        client: Optional[OpenAI] = None,
+        chunk_size: int = 50_000,
+        poll_interval: float = 30.0,
+        max_resubmits: int = 3,
+        completion_window: str = "24h",
+        **params: Any,
+    ):
+        """
+        Initialize the job.
+
+        Args:
+            workdir (str): Directory holding the job state; created if missing.
+            prompt (str): The prompt for every input, sent as f"{prompt}\\nInput: {input}" like parallel.
+            system_prompt (str, optional): The system prompt.
+            model (str, optional): The model name.
+            client (OpenAI, optional): Client to submit with. Defaults to the shared pooled client.
+            chunk_size (int, optional): Requests per batch (providers cap this, typically at 50,000).
+            poll_interval (float, optional): Seconds between batch status checks.
+            max_resubmits (int, optional): How often failed requests are resubmitted in a new batch.
+            completion_window (str, optional): Batch completion window.
+            **params: Extra request parameters, e.g. temperature or max_tokens.
+        """
+        self.workdir = workdir
+        self.prompt = prompt
+        self.system_prompt = system_prompt
+        self.model = model
+        self.client = client or get_client()
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.max_resubmits = max_resubmits
+        self.completion_window = completion_window
+        self.params = params
+        self.errors: Dict[int, str] = {}
+        self._state: Dict[str, Any] = {}
+        os.makedirs(workdir, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.workdir, name)
+
+    def _save_state(self) -> None:
+        tmp = self._path("state.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._state, f)
+        os.replace(tmp, self._path("state.json"))
+
+    def _request_line(self, index: int, input: str) -> str:
+        body = {
+            "model": self.model,
+            "messages": _build_messages(f"{self.prompt}\nInput: {input}", self.system_prompt),
+            **self.params,
+        }
+        return json.dumps(
+            {"custom_id": f"request-{index}", "method": "POST", "url": "/v1/chat/completions", "body": body},
+            ensure_ascii=False,
+        )
+
+    def _prepare(self, inputs: Iterable[str]) -> None:
+        """Write one request file per chunk, or check that an existing workdir belongs to these inputs."""
+        state_path = self._path("state.json")
+        existing = None
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                existing = json.load(f)
+
+        digest = hashlib.sha256()
+        chunks: List[Dict[str, Any]] = []
+        out = None
+        index = 0
+        try:
+            for index, input in enumerate(inputs):
+                if index % self.chunk_size == 0:
+                    if out is not None:
+                        out.close()
+                        out = None
+                    chunks.append({"start": index, "end": index, "batch_id": None, "attempts": 0, "done": False})
+                    if existing is None:
+                        out = open(self._path(f"requests-{len(chunks) - 1:05d}.jsonl"), "w", encoding="utf-8")
+                line = self._request_line(index, input)
+                digest.update(line.encode())
+                chunks[-1]["end"] = index + 1
+                if out is not None:
+                    out.write(line + "\n")
+        finally:
+            if out is not None:
+                out.close()
+
+        fingerprint = digest.hexdigest()
+        if existing is not None:
+            if existing["fingerprint"] != fingerprint:
+                raise ValueError(f"{self.workdir} holds a different batch job; use a new workdir")
+            self._state = existing
+            return
+        self._state = {"fingerprint": fingerprint, "chunks": chunks}
+        self._save_state()
+
+    def _load_results(self, number: int) -> Dict[int, Dict[str, Any]]:
+        """Results downloaded so far for a chunk; a success replaces an earlier error."""
+        results: Dict[int, Dict[str, Any]] = {}
+        path = self._path(f"results-{number:05d}.jsonl")
+        if os.path.exists(path):
+            for record in iter_jsonl(path):
+                if "content" in record or record["index"] not in results:
+                    results[record["index"]] = record
+        return results
+
+    def _submit(self, number: int, chunk: Dict[str, Any]) -> None:
+        """Submit the unfinished requests of a chunk as a new batch, or mark the chunk done."""
+        results = self._load_results(number)
+        missing = [i for i in range(chunk["start"], chunk["end"]) if "content" not in results.get(i, {})]
+        if not missing or chunk["attempts"] > self.max_resubmits:
+            chunk["done"] = True
+            self._save_state()
+            return
+
+        requests_path = self._path(f"requests-{number:05d}.jsonl")
+        if len(missing) == chunk["end"] - chunk["start"]:
+            with open(requests_path, "rb") as f:
+                uploaded = self.client.files.create(file=f, purpose="batch")
+        else:
+            wanted = {f"request-{i}" for i in missing}
+            with open(requests_path, "rb") as f:
+                data = b"".join(line for line in f if json.loads(line)["custom_id"] in wanted)
+            uploaded = self.client.files.create(file=(os.path.basename(requests_path), data), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+        )
+        chunk["batch_id"] = batch.id
+        chunk["attempts"] += 1
+        self._save_state()
+
+    def _collect(self, number: int, chunk: Dict[str, Any]) -> bool:
+        """Poll a chunk's batch; once it has finished, download its results. Returns True when finished."""
+        batch = self.client.batches.retrieve(chunk["batch_id"])
+        if batch.status not in TERMINAL_STATUSES:
+            return False
+
+        records = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                records.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        with open(self._path(f"results-{number:05d}.jsonl"), "a", encoding="utf-8") as f:
+            for record in records:
+                index = int(record["custom_id"].rsplit("-", 1)[1])
+                response = record.get("response") or {}
+                if response.get("status_code") == 200 and not record.get("error"):
+                    content = response["body"]["choices"][0]["message"]["content"]
+                    f.write(json.dumps({"index": index, "content": content}, ensure_ascii=False) + "\n")
+                else:
+                    f.write(json.dumps({"index": index, "error": _error_message(record)}, ensure_ascii=False) + "\n")
+        chunk["batch_id"] = None
+        self._save_state()
+        return True
+
+    def run(self, inputs: Iterable[str]) -> Iterator[Optional[str]]:
+        """
+        Submit the job (or resume it) and yield one output per input, in input order.
+
+        Outputs of a chunk are yielded once it and all chunks before it have finished; only one
+        chunk of results is held in memory at a time.
+
+        Args:
+            inputs (Iterable[str]): The inputs; pass the same inputs again to resume.
+
+        Returns:
+            Iterator[Optional[str]]: The outputs, None for inputs that failed (see `errors`).
+        """
+        self._prepare(inputs)
+        chunks = self._state["chunks"]
+        next_chunk = 0
+        while next_chunk < len(chunks):
+            waiting = False
+            for number, chunk in enumerate(chunks):
+                if chunk["done"]:
+                    continue
+                if chunk["batch_id"] is None:
+                    self._submit(number, chunk)
+                if chunk["batch_id"] is not None and not self._collect(number, chunk):
+                    waiting = True
+
+            while next_chunk < len(chunks) and chunks[next_chunk]["done"]:
+                chunk = chunks[next_chunk]
+                results = self._load_results(next_chunk)
+                for index in range(chunk["start"], chunk["end"]):
+                    record = results.get(index, {"error": "no result returned"})
+                    if "content" not in record:
+                        self.errors[index] = record["error"]
+                    yield record.get("content")
+                next_chunk += 1
+
+            if waiting:
+                time.sleep(self.poll_interval)
@@ -0,0 +1,51 @@
+from basic_workflow import parallel_batch
+from batch_job import BatchJob, iter_jsonl
+from llm import get_client
+from mock_llm_server import MockLLMServer
+import itertools
+import json
+import pytest
+
+INPUTS = [f"item {i}" for i in range(10)]
+EXPECTED = [f"echo: Classify\nInput: item {i}" for i in range(10)]
+
+def test_parallel_batch_in_order(tmp_path):
+    with MockLLMServer() as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        outputs = parallel_batch(INPUTS, "Classify", str(tmp_path), client=client, chunk_size=3, poll_interval=0.01)
+        assert list(outputs) == EXPECTED
+        assert len(server.batches) == 4
+
+def test_resume_after_interruption(tmp_path):
+    with MockLLMServer(batch_delay=0.05) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        first = BatchJob(str(tmp_path), "Classify", client=client, chunk_size=3, poll_interval=0.01).run(INPUTS)
+        assert list(itertools.islice(first, 3)) == EXPECTED[:3]
+        first.close()
+
+        resumed = BatchJob(str(tmp_path), "Classify", client=client, chunk_size=3, poll_interval=0.01)
+        assert list(resumed.run(INPUTS)) == EXPECTED
+        # Batches submitted before the interruption are collected, not resubmitted.
+        assert server.request_count == len(INPUTS)
+        assert len(server.batches) == 4
+
+        with pytest.raises(ValueError):
+            list(BatchJob(str(tmp_path), "Summarize", client=client, chunk_size=3).run(INPUTS))
+
+def test_failed_requests_are_resubmitted(tmp_path):
+    with MockLLMServer(error_rate=0.3) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        job = BatchJob(str(tmp_path / "retry"), "Classify", client=client, chunk_size=4, poll_interval=0.01, max_resubmits=20)
+        assert list(job.run(INPUTS)) == EXPECTED
+        assert not job.errors
+
+        server.error_rate = 1.0
+        job = BatchJob(str(tmp_path / "fail"), "Classify", client=client, chunk_size=4, poll_interval=0.01, max_resubmits=1)
+        assert list(job.run(INPUTS)) == [None] * len(INPUTS)
+        assert sorted(job.errors) == list(range(len(INPUTS)))
+        assert server.rejected_count >= 2 * len(INPUTS)
+
+def test_iter_jsonl(tmp_path):
+    path = tmp_path / "items.jsonl"
+    path.write_text("".join(json.dumps({"text": text}) + "\n" for text in INPUTS[:2]))
+    assert list(iter_jsonl(str(path), "text")) == INPUTS[:2]
@@ -0,0 +1,4 @@
+"""Benchmarks that run against the local mock LLM server.
+
+Run from the repository root, e.g. `python -m benchmarks.client_pool`.
+"""
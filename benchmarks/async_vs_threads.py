@@ -0,0 +1,109 @@
+# Throughput and memory of parallel (one thread per in-flight request) vs aparallel (one event loop)
+# at increasing concurrency, against the mock server.
+from contextlib import contextmanager
+from typing import Callable, Iterator, Tuple
+import subprocess
+import argparse
+import asyncio
+import threading
+import socket
+import time
+import sys
+
+from basic_workflow import aparallel, parallel, set_async_concurrency
+from llm import get_async_client, get_client, set_limiter
+from rate_limiter import AdaptiveLimiter
+
+
+def rss_mb() -> float:
+    """Resident set size of this process (Linux)."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(run: Callable[[], None]) -> Tuple[float, float, int]:
+    """Run and return (seconds, peak RSS growth in MB, peak thread count)."""
+    baseline = rss_mb()
+    peak = [baseline, threading.active_count()]
+    stop = threading.Event()
+
+    def sample() -> None:
+        while not stop.wait(0.01):
+            peak[0] = max(peak[0], rss_mb())
+            peak[1] = max(peak[1], threading.active_count())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        run()
+    finally:
+        elapsed = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+    return elapsed, peak[0] - baseline, peak[1]
+
+
+@contextmanager
+def mock_server_process(latency: float) -> Iterator[str]:
+    """Run the mock server in its own process, so it does not compete with the clients for the GIL."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, "mock_llm_server.py", "--port", str(port), "--latency", str(latency)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests-per-worker", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock latency per request in seconds")
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'engine':>8} {'requests':>9} {'req/s':>8} {'ideal req/s':>12} {'RSS +MB':>8} {'threads':>8}")
+    with mock_server_process(args.latency) as base_url:
+        for concurrency in args.concurrency:
+            inputs = [str(i) for i in range(concurrency * args.requests_per_worker)]
+            # Let the shared limiter and the connection pools admit the full concurrency.
+            set_limiter(AdaptiveLimiter(initial_concurrency=concurrency, max_concurrency=concurrency))
+            set_async_concurrency(concurrency)
+            # Keep-alive stays at the default pool size: the mock's threading server slows down
+            # sharply when hundreds of idle connections are parked on it.
+            api_key = f"mock-{concurrency}"
+            client = get_client(base_url=base_url, api_key=api_key, max_connections=concurrency)
+
+            async def run_async() -> None:
+                aclient = get_async_client(base_url=base_url, api_key=api_key, max_connections=concurrency)
+                await aparallel(inputs, "Echo", client=aclient)
+
+            engines = {
+                "threads": lambda: parallel(inputs, "Echo", n_workers=concurrency, client=client),
+                "asyncio": lambda: asyncio.run(run_async()),
+            }
+            for name, run in engines.items():
+                elapsed, rss, threads = measure(run)
+                print(
+                    f"{concurrency:>11} {name:>8} {len(inputs):>9} {len(inputs) / elapsed:>8.0f} "
+                    f"{concurrency / args.latency:>12.0f} {rss:>8.1f} {threads:>8}"
+                )
+
+
+if __name__ == "__main__":
+    main()
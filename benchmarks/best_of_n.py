@@ -0,0 +1,56 @@
+# Wall-clock time and tokens to a passing answer in the evaluator-optimizer loop, by candidates per round.
+from contextlib import redirect_stdout
+import argparse
+import random
+import time
+import io
+
+from evaluator_optimizer_workflow import LoopLimitExceeded, loop
+from llm import get_client
+from mock_llm_server import MockLLMServer, last_user_message
+from telemetry import Telemetry, get_telemetry, set_telemetry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--pass-rate", type=float, default=0.25, help="chance that a generation passes evaluation")
+    parser.add_argument("--latency", type=float, default=0.1, help="mock latency per request in seconds")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+
+    def responder(body):
+        prompt = last_user_message(body)
+        if "Content to evaluate:" in prompt:
+            if prompt.endswith("good"):
+                return "<evaluation>PASS</evaluation><feedback>Done.</feedback>"
+            return "<evaluation>NEEDS_IMPROVEMENT</evaluation><feedback>Handle the empty stack.</feedback>"
+        quality = "good" if rng.random() < args.pass_rate else "flawed"
+        return f"<thoughts>Use an auxiliary min stack.</thoughts><response>class MinStack: ... # {quality}</response>"
+
+    print(f"{'candidates':>10} {'mean s':>7} {'max s':>6} {'mean tokens':>12} {'gave up':>8}")
+    previous = get_telemetry()
+    with MockLLMServer(responder=responder, latency=args.latency) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        for n in args.candidates:
+            telemetry = Telemetry()
+            set_telemetry(telemetry)
+            seconds, gave_up = [], 0
+            with redirect_stdout(io.StringIO()):
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    try:
+                        loop("Implement a MinStack", "Evaluate", "Generate", n_candidates=n, max_rounds=10, client=client)
+                    except LoopLimitExceeded:
+                        gave_up += 1
+                    seconds.append(time.perf_counter() - start)
+                time.sleep(args.latency * 3)  # Abandoned candidates finish and report their tokens.
+            tokens = telemetry.counter("llm_tokens_total", type="prompt") + telemetry.counter("llm_tokens_total", type="completion")
+            print(f"{n:>10} {sum(seconds) / len(seconds):>7.2f} {max(seconds):>6.2f} {tokens / args.runs:>12.0f} {gave_up:>8}")
+    set_telemetry(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Throughput of chain over many inputs run one after another vs pipelined with chain_many.
+from contextlib import redirect_stdout
+import argparse
+import time
+import io
+
+from basic_workflow import chain, chain_many
+from llm import get_client
+from mock_llm_server import MockLLMServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--inputs", type=int, default=40)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="workers per stage")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock latency per request in seconds")
+    args = parser.parse_args()
+
+    inputs = [f"document {i}" for i in range(args.inputs)]
+    prompts = [f"Step {s}" for s in range(args.steps)]
+    with MockLLMServer(latency=args.latency) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        # chain prints every step; keep the table readable.
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for x in inputs:
+                chain(x, prompts, client=client)
+            sequential = time.perf_counter() - start
+
+            pipelined = {}
+            for n in args.workers:
+                start = time.perf_counter()
+                for _ in chain_many(inputs, prompts, n_workers=n, client=client):
+                    pass
+                pipelined[n] = time.perf_counter() - start
+
+    print(f"{args.inputs} inputs x {args.steps} steps, {args.latency * 1000:.0f} ms per call")
+    print(f"{'engine':>22} {'seconds':>8} {'inputs/s':>9} {'speedup':>8}")
+    print(f"{'chain, sequential':>22} {sequential:>8.2f} {args.inputs / sequential:>9.1f} {1:>7.2f}x")
+    for n, elapsed in pipelined.items():
+        name = f"chain_many, {n}/stage"
+        print(f"{name:>22} {elapsed:>8.2f} {args.inputs / elapsed:>9.1f} {sequential / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
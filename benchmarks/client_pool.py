@@ -0,0 +1,50 @@
+# Compare calls/sec of a fresh OpenAI client per call against the pooled client from llm.get_client.
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI
+import argparse
+import time
+
+from llm import llm_call, get_client, close_clients
+from mock_llm_server import MockLLMServer
+
+
+def _run(n_calls: int, n_workers: int, make_client) -> float:
+    """Return calls/sec for n_calls spread over n_workers threads."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(llm_call, f"ping {i}", client=make_client())
+            for i in range(n_calls)
+        ]
+        for f in futures:
+            f.result()
+    return n_calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+
+    with MockLLMServer() as server:
+        def fresh_client() -> OpenAI:
+            return OpenAI(base_url=server.base_url, api_key="mock")
+
+        def pooled_client() -> OpenAI:
+            return get_client(base_url=server.base_url, api_key="mock")
+
+        # Warm up the pooled client so its first connection is not counted.
+        _run(10, 1, pooled_client)
+
+        print(f"{'workers':>8} {'fresh calls/s':>14} {'pooled calls/s':>15} {'speedup':>8}")
+        for n_workers in args.workers:
+            fresh = _run(args.calls, n_workers, fresh_client)
+            pooled = _run(args.calls, n_workers, pooled_client)
+            print(f"{n_workers:>8} {fresh:>14.1f} {pooled:>15.1f} {pooled / fresh:>7.2f}x")
+
+    close_clients()
+
+
+if __name__ == "__main__":
+    main()
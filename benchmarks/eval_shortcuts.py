@@ -0,0 +1,77 @@
+# Evaluator calls and time spent evaluating in the evaluator-optimizer loop, with and without the evaluation
+# cache and the streaming early exit, against a mock generator that often repeats an earlier attempt.
+from contextlib import redirect_stdout
+import argparse
+import random
+import time
+import io
+
+from evaluator_optimizer_workflow import LoopLimitExceeded, loop
+from llm import get_client
+from llm_cache import ResponseCache
+from mock_llm_server import MockLLMServer, last_user_message
+from telemetry import Telemetry, get_telemetry, set_telemetry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--repeat-rate", type=float, default=0.5, help="chance that a generation repeats the last one")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock latency per request in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="mock seconds per streamed token")
+    args = parser.parse_args()
+
+    def evaluation(body):
+        if last_user_message(body).rstrip().endswith("v5"):
+            return "<evaluation>PASS</evaluation><feedback>" + "Every requirement is met. " * 40 + "</feedback>"
+        return "<evaluation>NEEDS_IMPROVEMENT</evaluation><feedback>Handle the empty stack.</feedback>"
+
+    def responder(body):
+        prompt = last_user_message(body)
+        if "Content to evaluate:" in prompt:
+            text = evaluation(body)
+            if not body.get("stream"):
+                # The mock delays streamed tokens only; a blocking call waits for the whole generation too.
+                time.sleep(len(text.split()) * args.token_delay)
+            return text
+        nonlocal version
+        if rng.random() >= args.repeat_rate:
+            version += 1
+        # Repeats come back with different trailing whitespace, as sampled output does.
+        return f"<thoughts>Revise.</thoughts><response>class MinStack: ... # v{version}{' ' * rng.randint(0, 2)}</response>"
+
+    configs = {
+        "baseline": {},
+        "eval cache": {"eval_cache": True},
+        "early exit": {"early_exit": True},
+        "cache + early exit": {"eval_cache": True, "early_exit": True},
+    }
+
+    print(f"{'mode':>20} {'evaluator calls':>16} {'cache hits':>11} {'early exits':>12} {'eval s/run':>11}")
+    previous = get_telemetry()
+    with MockLLMServer(responder=responder, latency=args.latency, token_delay=args.token_delay) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        for name, config in configs.items():
+            rng = random.Random(0)
+            telemetry = Telemetry()
+            set_telemetry(telemetry)
+            with redirect_stdout(io.StringIO()):
+                for _ in range(args.runs):
+                    version = 0
+                    eval_cache = ResponseCache() if config.get("eval_cache") else None
+                    try:
+                        loop("Implement a MinStack", "Evaluate", "Generate", max_rounds=30, eval_cache=eval_cache,
+                             early_exit=config.get("early_exit", False), client=client)
+                    except LoopLimitExceeded:
+                        pass
+            hits = telemetry.counter("llm_cache_hits_total", span="loop.evaluate")
+            calls = telemetry.counter("llm_requests_total", span="loop.evaluate") - hits
+            seconds = telemetry.histogram("workflow_span_duration_seconds", span="loop.evaluate").sum
+            print(f"{name:>20} {calls / args.runs:>16.1f} {hits / args.runs:>11.1f} "
+                  f"{telemetry.counter('llm_cancelled_total', span='loop.evaluate') / args.runs:>12.1f} "
+                  f"{seconds / args.runs:>11.2f}")
+    set_telemetry(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Tail latency of llm_call with and without hedged requests, against a mock server with a long-tail latency distribution.
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import argparse
+import time
+
+from llm import llm_call, get_client
+from mock_llm_server import MockLLMServer, long_tail_latency
+from retry import HedgePolicy
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(base_url: str, n_calls: int, n_workers: int, hedge: HedgePolicy = None) -> List[float]:
+    client = get_client(base_url=base_url, api_key="mock")
+
+    def timed_call(i: int) -> float:
+        start = time.perf_counter()
+        llm_call(f"request {i}", client=client, hedge=hedge)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(timed_call, range(n_calls)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--base", type=float, default=0.02, help="typical latency in seconds")
+    parser.add_argument("--slow", type=float, default=0.5, help="latency of slow requests in seconds")
+    parser.add_argument("--slow-fraction", type=float, default=0.02)
+    args = parser.parse_args()
+
+    latency = long_tail_latency(args.base, args.slow, args.slow_fraction)
+    with MockLLMServer(latency=latency) as server:
+        baseline = run(server.base_url, args.calls, args.workers)
+        before = server.request_count
+        hedge = HedgePolicy(quantile=0.95)
+        hedged = run(server.base_url, args.calls, args.workers, hedge)
+        extra = (server.request_count - before - args.calls) / args.calls
+
+    print(f"{'':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'p99.9 (ms)':>11}")
+    for name, samples in (("baseline", baseline), ("hedged", hedged)):
+        row = [percentile(samples, q) * 1000 for q in (0.5, 0.99, 0.999)]
+        print(f"{name:>10} {row[0]:>10.1f} {row[1]:>10.1f} {row[2]:>11.1f}")
+    print(f"hedges sent: {hedge.hedges} ({extra:.1%} extra requests), hedge wins: {hedge.hedge_wins}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Load test: drive chain, parallel, FlexibleOrchestrator and Agent concurrently against the mock server
+# and report throughput and latency percentiles per workflow.
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List
+import argparse
+import io
+import time
+
+from agents.agent import Agent, ModelConfig
+from agents.tools.think import ThinkTool
+from basic_workflow import chain, parallel
+from benchmarks.hedging import percentile
+from llm import get_client
+from mock_llm_server import MockLLMServer, ScriptedResponder
+from orchestrator_workers_workflow import FlexibleOrchestrator
+from telemetry import get_telemetry
+
+N_SUBTASKS = 3
+
+ORCHESTRATOR_PROMPT = "Break this task into approaches.\nTask: {task}"
+WORKER_PROMPT = "Task: {original_task}\nStyle: {task_type}\nGuidelines: {task_description}"
+
+ORCHESTRATOR_REPLY = "<analysis>Several styles are useful.</analysis>\n<tasks>\n" + "\n".join(
+    f"<task>\n<type>style{i}</type>\n<description>Write it in style {i}</description>\n</task>"
+    for i in range(N_SUBTASKS)
+) + "\n</tasks>"
+
+SCRIPT = ScriptedResponder(rules=[
+    (r"^Break this task", ORCHESTRATOR_REPLY),
+    (r"^Task: .*Style:", lambda body: "<response>Done in the requested style.</response>"),
+    (r"^Question:", {"content": "", "tool_calls": [{"name": "think", "arguments": {"thought": "plan"}}]}),
+])
+
+
+def scenarios(client) -> Dict[str, Callable[[int], None]]:
+    """One unit of work per workflow; each returns after the whole workflow completed."""
+    orchestrator = FlexibleOrchestrator(ORCHESTRATOR_PROMPT, WORKER_PROMPT, client=client)
+
+    def run_chain(i: int) -> None:
+        chain(f"report {i}", ["Extract", "Convert", "Sort", "Format"], client=client)
+
+    def run_parallel(i: int) -> None:
+        parallel([f"stakeholder {i}.{j}" for j in range(4)], "Analyze impact on:", n_workers=4, client=client)
+
+    def run_orchestrator(i: int) -> None:
+        orchestrator.process(f"product description {i}")
+
+    def run_agent(i: int) -> None:
+        agent = Agent(
+            name="load",
+            system="You are a helpful assistant.",
+            tools=[ThinkTool()],
+            config=ModelConfig(model="mock", max_tokens=256),
+            client=client,
+        )
+        agent.run(f"Question: {i}")
+
+    return {
+        "chain": run_chain,
+        "parallel": run_parallel,
+        "orchestrator": run_orchestrator,
+        "agent": run_agent,
+    }
+
+
+def drive(unit: Callable[[int], None], iterations: int, concurrency: int) -> List[float]:
+    """Run `iterations` units on `concurrency` threads and return per-unit latencies."""
+    def timed(i: int) -> float:
+        start = time.perf_counter()
+        unit(i)
+        return time.perf_counter() - start
+
+    # One untimed run first: connection setup and lazily built pydantic serializers (whose first
+    # concurrent use can race) stay out of the measurements.
+    unit(-1)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(timed, range(iterations)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200, help="workflow runs per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="workflow runs in flight")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock latency per request in seconds")
+    parser.add_argument("--scenarios", nargs="+", default=["chain", "parallel", "orchestrator", "agent"])
+    args = parser.parse_args()
+
+    with MockLLMServer(responder=SCRIPT, latency=args.latency) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        units = scenarios(client)
+        print(f"{'scenario':>12} {'runs/s':>8} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+        for name in args.scenarios:
+            before = server.request_count
+            start = time.perf_counter()
+            # The workflows print their intermediate results; keep the report readable.
+            with redirect_stdout(io.StringIO()):
+                latencies = drive(units[name], args.iterations, args.concurrency)
+            elapsed = time.perf_counter() - start
+            requests = server.request_count - before
+            row = [percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99)]
+            print(
+                f"{name:>12} {args.iterations / elapsed:>8.1f} {requests / elapsed:>8.1f} "
+                f"{row[0]:>9.1f} {row[1]:>9.1f} {row[2]:>9.1f}"
+            )
+
+    print(f"\n{'span':>22} {'calls':>7} {'p50 (ms)':>9} {'p95 (ms)':>9} {'time share':>11}")
+    spans = get_telemetry().snapshot()
+    total = sum(summary["latency_total"] for summary in spans.values()) or 1.0
+    for name, summary in spans.items():
+        print(
+            f"{name:>22} {summary['calls']:>7} {summary['latency_p50'] * 1000:>9.1f} "
+            f"{summary['latency_p95'] * 1000:>9.1f} {summary['latency_total'] / total:>11.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
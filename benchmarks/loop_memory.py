@@ -0,0 +1,68 @@
+# Generator prompt tokens and latency per round of the evaluator-optimizer loop, with the full history of
+# attempts vs compacted LoopMemory, against a scripted mock whose latency grows with the prompt (prefill).
+from contextlib import redirect_stdout
+import argparse
+import itertools
+import time
+import io
+
+from evaluator_optimizer_workflow import LoopLimitExceeded, loop
+from llm import get_client
+from loop_memory import LoopMemory, SUMMARY_PROMPT, llm_summarizer
+from mock_llm_server import MockLLMServer, last_user_message
+from telemetry import CallRecord, Telemetry, get_telemetry, set_telemetry
+
+CODE = "\n".join(f"    def method_{i}(self, x):\n        return self.items[{i}] + x" for i in range(30))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--prefill", type=float, default=0.0002, help="mock seconds per prompt token")
+    args = parser.parse_args()
+
+    def responder(body):
+        prompt = last_user_message(body)
+        time.sleep(len(prompt.split()) * args.prefill)
+        if prompt.startswith(SUMMARY_PROMPT):
+            return "Earlier attempts kept returning the wrong index from method_7 and ignored empty input."
+        if "Content to evaluate:" in prompt:
+            return "<evaluation>NEEDS_IMPROVEMENT</evaluation><feedback>method_7 is still wrong.</feedback>"
+        # Each round revises one method, as a real optimizer would.
+        n = next(revisions)
+        return f"<thoughts>Fix method_7.</thoughts><response>class Store:\n{CODE.replace('[7]', f'[7 + {n}]')}</response>"
+
+    previous = get_telemetry()
+    results = {}
+    with MockLLMServer(responder=responder) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        configs = {
+            "full history": None,
+            "last 2 + diffs": LoopMemory(keep_last=2),
+            "last 2 + diffs, 1500 ceiling": LoopMemory(keep_last=2, max_prompt_tokens=1500),
+            "last 1 + summary": LoopMemory(keep_last=1, summarize=llm_summarizer(client=client)),
+        }
+        for name, memory in configs.items():
+            revisions = itertools.count()
+            records = []
+            set_telemetry(Telemetry(sinks=[lambda r: records.append(r) if isinstance(r, CallRecord) and r.span == "loop.generate" else None]))
+            with redirect_stdout(io.StringIO()):
+                try:
+                    loop("Fix the Store class", "Evaluate", "Generate", max_rounds=args.rounds, memory=memory, client=client)
+                except LoopLimitExceeded:
+                    pass
+            results[name] = sorted((r.attributes["round"], r.prompt_tokens, r.latency) for r in records)
+    set_telemetry(previous)
+
+    names = list(results)
+    print("Generator prompt tokens (latency ms) per round")
+    print(f"{'round':>5} " + " ".join(f"{name:>26}" for name in names))
+    for i in range(args.rounds):
+        cells = [f"{results[n][i][1]:>6} ({results[n][i][2] * 1000:>5.0f} ms)" for n in names]
+        print(f"{i:>5} " + " ".join(f"{cell:>26}" for cell in cells))
+    totals = [f"{sum(r[1] for r in results[n]):>6} ({sum(r[2] for r in results[n]):>5.1f} s)" for n in names]
+    print(f"{'total':>5} " + " ".join(f"{cell:>26}" for cell in totals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# End-to-end time of FlexibleOrchestrator.process with the plan parsed after it is complete vs streamed, each
+# subtask dispatched as soon as its </task> arrives, for a few plan shapes.
+from contextlib import redirect_stdout
+import argparse
+import time
+import io
+
+from llm import get_client
+from mock_llm_server import MockLLMServer, last_user_message
+from orchestrator_workers_workflow import FlexibleOrchestrator
+
+
+def plan_text(tasks, analysis_words: int, description_words: int) -> str:
+    blocks = "".join(
+        f"<task>\n<id>{task_id}</id>\n<type>{task_id}</type>\n"
+        f"<description>{' '.join(['detail'] * description_words)}</description>\n"
+        f"<depends_on>{', '.join(deps)}</depends_on>\n</task>\n"
+        for task_id, deps in tasks
+    )
+    return f"<analysis>{' '.join(['reasoning'] * analysis_words)}</analysis>\n<tasks>\n{blocks}</tasks>"
+
+
+PLANS = {
+    "5 independent, 2 workers": ([(f"part{i}", []) for i in range(5)], 2),
+    "outline > 3 sections > summary": (
+        [("outline", []), *[(f"section{i}", ["outline"]) for i in range(3)], ("summary", ["section0", "section1", "section2"])],
+        None,
+    ),
+    "4 independent": ([(f"part{i}", []) for i in range(4)], None),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--analysis-words", type=int, default=100)
+    parser.add_argument("--description-words", type=int, default=40)
+    parser.add_argument("--token-delay", type=float, default=0.005, help="mock seconds per generated token")
+    parser.add_argument("--worker-latency", type=float, default=0.4)
+    args = parser.parse_args()
+
+    plans = {}
+
+    def responder(body):
+        prompt = last_user_message(body)
+        if prompt.startswith("Plan"):
+            text = plans[prompt.split(maxsplit=1)[1]]
+            if not body.get("stream"):
+                # The mock delays streamed tokens only; a blocking call waits for the whole generation too.
+                time.sleep(len(text.split()) * args.token_delay)
+            return text
+        time.sleep(args.worker_latency)
+        return "<response>Done.</response>"
+
+    print(f"{'plan':>32} {'after plan s':>13} {'streamed s':>11} {'saved':>6}")
+    with MockLLMServer(responder=responder, token_delay=args.token_delay) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        for name, (tasks, n_workers) in PLANS.items():
+            plans[name] = plan_text(tasks, args.analysis_words, args.description_words)
+            seconds = {}
+            for stream_tasks in (False, True):
+                orchestrator = FlexibleOrchestrator("Plan {task}", "Do {task_type}", n_workers=n_workers,
+                                                    stream_tasks=stream_tasks, client=client)
+                start = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    orchestrator.process(name)
+                seconds[stream_tasks] = time.perf_counter() - start
+            print(f"{name:>32} {seconds[False]:>13.2f} {seconds[True]:>11.2f} {1 - seconds[True] / seconds[False]:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Wall-clock time of FlexibleOrchestrator.process by number of subtasks, with workers run one at a time vs
+# concurrently, against the sum and the max of the worker latencies.
+from contextlib import redirect_stdout
+import argparse
+import random
+import time
+import io
+
+from llm import get_client
+from mock_llm_server import MockLLMServer, last_user_message
+from orchestrator_workers_workflow import FlexibleOrchestrator
+from telemetry import CallRecord, Telemetry, get_telemetry, set_telemetry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subtasks", type=int, nargs="+", default=[2, 5, 20])
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.1, 0.3], help="worker latency range in seconds")
+    parser.add_argument("--n-workers", type=int, default=None, help="concurrency limit (default: all subtasks)")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+
+    def responder(body):
+        prompt = last_user_message(body)
+        if prompt.startswith("Plan"):
+            n = int(prompt.split()[-1])
+            tasks = "".join(f"<task>\n<type>part{i}</type>\n<description>Part {i}</description>\n</task>\n" for i in range(n))
+            return f"<analysis>{n} parts.</analysis>\n<tasks>\n{tasks}</tasks>"
+        time.sleep(rng.uniform(*args.latency))
+        return "<response>Done.</response>"
+
+    print(f"{'subtasks':>8} {'mode':>10} {'wall s':>7} {'sum s':>6} {'max s':>6}")
+    previous = get_telemetry()
+    with MockLLMServer(responder=responder) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        for n in args.subtasks:
+            for mode, n_workers in (("sequential", 1), ("concurrent", args.n_workers)):
+                records = []
+                set_telemetry(Telemetry(sinks=[lambda r: records.append(r) if isinstance(r, CallRecord) and r.span == "orchestrator.worker" else None]))
+                orchestrator = FlexibleOrchestrator("Plan {task}", "Do {task_type}", n_workers=n_workers, client=client)
+                start = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    orchestrator.process(str(n))
+                wall = time.perf_counter() - start
+                latencies = [r.latency for r in records]
+                print(f"{n:>8} {mode:>10} {wall:>7.2f} {sum(latencies):>6.2f} {max(latencies):>6.2f}")
+    set_telemetry(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Share of prompt tokens a prefix-caching provider (simulated by the mock) can reuse: orchestrator workers with
+# the worker prompt formatted as written vs laid out with the per-subtask fields last, and the generator and
+# evaluator across the rounds of loop with the previous attempts before vs after the task.
+from contextlib import redirect_stdout
+import argparse
+import itertools
+import io
+
+from evaluator_optimizer_workflow import loop
+from llm import get_client
+from mock_llm_server import MockLLMServer, last_user_message
+from orchestrator_workers_workflow import FlexibleOrchestrator
+from telemetry import Telemetry, get_telemetry, set_telemetry
+
+WORKER_PROMPT = """Generate content based on:
+Task: {original_task}
+Style: {task_type}
+Guidelines: {task_description}
+
+{rules}
+
+Return your response in this format:
+<response>
+Your content here, maintaining the specified style and fully addressing requirements.
+</response>"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subtasks", type=int, nargs="+", default=[2, 5, 20])
+    parser.add_argument("--rule-words", type=int, default=300, help="static instructions in the worker prompt")
+    parser.add_argument("--task-words", type=int, default=200, help="task brief given to loop")
+    parser.add_argument("--rounds", type=int, default=5, help="loop rounds before the evaluator passes")
+    parser.add_argument("--block", type=int, default=64, help="mock cache block in tokens")
+    args = parser.parse_args()
+
+    rules = "House rules: " + " ".join(["rule"] * args.rule_words)
+    task = "Write the launch post. Brief: " + " ".join(["detail"] * args.task_words)
+    evaluations = itertools.count(1)
+
+    def responder(body):
+        prompt = last_user_message(body)
+        if prompt.startswith("Plan"):
+            n = int(prompt.split()[-1])
+            tasks = "".join(f"<task><type>part{i}</type><description>Cover part {i} of {n}</description></task>\n"
+                            for i in range(n))
+            return f"<analysis>{n} parts.</analysis>\n<tasks>\n{tasks}</tasks>"
+        if "Content to evaluate:" in prompt:
+            verdict = "PASS" if next(evaluations) % args.rounds == 0 else "NEEDS_IMPROVEMENT"
+            return f"<evaluation>{verdict}</evaluation><feedback>Tighten it.</feedback>"
+        if prompt.startswith("Generate"):
+            return "<thoughts>Revise.</thoughts><response>" + " ".join(["draft"] * 50) + "</response>"
+        return "<response>Done.</response>"
+
+    def cached_ratio(run, span_name):
+        telemetry = Telemetry()
+        set_telemetry(telemetry)
+        with MockLLMServer(responder=responder, prefix_cache_block=args.block) as server:
+            with redirect_stdout(io.StringIO()):
+                run(get_client(base_url=server.base_url, api_key="mock"))
+        return telemetry.snapshot()[span_name]["cached_ratio"]
+
+    previous = get_telemetry()
+    print(f"{'workers':>8} {'as written':>11} {'prefix layout':>14}")
+    for n in args.subtasks:
+        ratios = [
+            cached_ratio(lambda client: FlexibleOrchestrator(
+                "Plan {task}", WORKER_PROMPT, n_workers=1, prefix_layout=prefix_layout, client=client
+            ).process(str(n), context={"rules": rules}), "orchestrator.worker")
+            for prefix_layout in (False, True)
+        ]
+        print(f"{n:>8} {ratios[0]:>11.0%} {ratios[1]:>14.0%}")
+
+    print(f"\nloop, {args.rounds} rounds")
+    print(f"{'span':>14} {'as written':>11} {'prefix layout':>14}")
+    for span_name in ("loop.generate", "loop.evaluate"):
+        ratios = [
+            cached_ratio(lambda client: loop(task, f"Evaluate.\n{rules}", f"Generate.\n{rules}",
+                                             prefix_layout=prefix_layout, client=client), span_name)
+            for prefix_layout in (False, True)
+        ]
+        print(f"{span_name:>14} {ratios[0]:>11.0%} {ratios[1]:>14.0%}")
+    set_telemetry(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# End-to-end route latency with and without speculative handler calls, and the extra tokens they cost.
+from contextlib import redirect_stdout
+import argparse
+import time
+import io
+
+from basic_workflow import route
+from benchmarks.hedging import percentile
+from benchmarks.prerouting import KEYWORDS, ROUTES, tickets
+from llm import get_client
+from mock_llm_server import MockLLMServer, last_user_message
+from prerouter import KeywordRouter, NaiveBayesRouter, PreRouter, Speculation
+from telemetry import Telemetry, get_telemetry, set_telemetry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tickets", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=0.1, help="mock latency per request in seconds")
+    args = parser.parse_args()
+
+    labels = {}
+
+    def oracle(body):
+        prompt = last_user_message(body)
+        text = prompt.rpartition("Input: ")[2]
+        if "<selection>" in prompt:
+            return f"<reasoning>Matches the {labels[text]} vocabulary.</reasoning><selection>{labels[text]}</selection>"
+        return "Thanks for reaching out. " * 20
+
+    def prior() -> PreRouter:
+        # Threshold above 1: the local routers never decide on their own and only rank the candidates.
+        return PreRouter([KeywordRouter(KEYWORDS), NaiveBayesRouter(min_examples=10)], threshold=1.1)
+
+    configs = {
+        "selector, then handler": (prior(), None),
+        "speculate top-1": (prior(), Speculation(top_k=1)),
+        "speculate top-2": (prior(), Speculation(top_k=2, min_confidence=0.1)),
+        "top-1, 2k token budget": (prior(), Speculation(top_k=1, token_budget=2000)),
+    }
+
+    print(f"{'mode':>24} {'p50 ms':>7} {'p95 ms':>7} {'hit rate':>9} {'extra tokens':>13}")
+    previous = get_telemetry()
+    # Latency only, no per-token delay: the mock applies token delays to streams alone, which would make the
+    # streamed speculative calls look slower than the blocking handler call they replace.
+    with MockLLMServer(responder=oracle, latency=args.latency) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        for name, (prerouter, speculation) in configs.items():
+            telemetry = Telemetry()
+            set_telemetry(telemetry)
+            latencies = []
+            for text, label in tickets(args.tickets, repeat=0.0):
+                labels[text] = label
+                start = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    route(text, ROUTES, prerouter=prerouter, speculation=speculation, client=client)
+                latencies.append(time.perf_counter() - start)
+            time.sleep(0.5)  # Let cancelled calls finish and charge their tokens.
+
+            stats = speculation.stats() if speculation is not None else {"hit_rate": 0.0, "wasted_tokens": 0}
+            used = telemetry.counter("llm_tokens_total", type="prompt") + telemetry.counter("llm_tokens_total", type="completion")
+            print(
+                f"{name:>24} {percentile(latencies, 0.5) * 1000:>7.0f} {percentile(latencies, 0.95) * 1000:>7.0f} "
+                f"{stats['hit_rate']:>8.0%} {stats['wasted_tokens'] / used:>12.1%}"
+            )
+    set_telemetry(previous)
+
+
+if __name__ == "__main__":
+    main()
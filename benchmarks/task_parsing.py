@@ -0,0 +1,77 @@
+# Microbenchmark: the old line-based parse_tasks vs the single-pass tokenizer on large orchestrator outputs,
+# clean (one tag per line) and messy (multi-line and one-line tasks, attributes, missing closing tags).
+import argparse
+import random
+import timeit
+
+from orchestrator_workers_workflow import parse_tasks
+
+
+def line_based_parse_tasks(tasks_str: str):
+    """parse_tasks before the tokenizer: one tag per line, sliced at fixed offsets."""
+    tasks = []
+    current_task = {}
+    for line in tasks_str.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('<task>'):
+            current_task = {}
+        elif line.startswith('<type>'):
+            current_task["type"] = line[6:-7].strip()
+        elif line.startswith("<description>"):
+            current_task["description"] = line[12:-13].strip()
+        elif line.startswith("</task>"):
+            if "description" in current_task:
+                if "type" not in current_task:
+                    current_task["type"] = "default"
+                tasks.append(current_task)
+    return tasks
+
+
+def clean_output(n: int, rng: random.Random):
+    descriptions = [f"Write section {i} " + "with care " * rng.randint(5, 40) for i in range(n)]
+    blocks = "".join(f"    <task>\n    <type>t{i}</type>\n    <description>{d.strip()}</description>\n    </task>\n"
+                     for i, d in enumerate(descriptions))
+    return f"<tasks>\n{blocks}</tasks>", [d.strip() for d in descriptions]
+
+
+def messy_output(n: int, rng: random.Random):
+    descriptions, blocks = [], []
+    for i in range(n):
+        description = f"Write section {i}\n" + "with <b>care</b>\n" * rng.randint(2, 20)
+        descriptions.append(description.strip())
+        layout = rng.randrange(4)
+        if layout == 0:  # Everything on one line.
+            blocks.append(f"<task><type>t{i}</type><description>{description}</description></task>")
+        elif layout == 1:  # Attributes and a multi-line description.
+            blocks.append(f'<task id="s{i}" type="t{i}">\n  <description>\n{description}\n  </description>\n</task>')
+        elif layout == 2:  # Missing </type> and </task>.
+            blocks.append(f"<task>\n<type>t{i}\n<description>{description}</description>")
+        else:  # Upper case tags with chatter in between.
+            blocks.append(f"Next:\n<TASK>\n<TYPE>t{i}</TYPE>\n<DESCRIPTION>{description}</DESCRIPTION>\n</TASK>")
+    return "<tasks>\n" + "\n".join(blocks) + "\n</tasks>", descriptions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'output':>6} {'tasks':>6} {'size':>8} {'line-based us':>14} {'correct':>8} {'tokenizer us':>13} {'correct':>8}")
+    for name, make in (("clean", clean_output), ("messy", messy_output)):
+        for n in args.tasks:
+            text, expected = make(n, random.Random(n))
+            cells = []
+            for parse in (line_based_parse_tasks, parse_tasks):
+                seconds = min(timeit.repeat(lambda: parse(text), number=args.repeat, repeat=3)) / args.repeat
+                found = [t["description"] for t in parse(text)]
+                correct = sum(1 for a, b in zip(found, expected) if a == b) if len(found) == len(expected) else \
+                    len(set(found) & set(expected))
+                cells.append(f"{seconds * 1e6:>14.0f} {correct:>8}")
+            print(f"{name:>6} {n:>6} {len(text) // 1024:>6}KB {cells[0]} {cells[1][1:]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Per-step checkpoints for chain: each step's output is stored under a hash of the chain input,
+# the call settings and every prompt up to that step, so a rerun only pays for the steps that changed.
+from typing import Any, Dict, List, NamedTuple, Optional
+import threading
+import hashlib
+import sqlite3
+import json
+import time
+
+# llm_call keyword arguments that change how a request is sent, not what the model answers.
+TRANSPORT_KWARGS = frozenset({"client", "cache", "coalesce", "retry", "hedge", "deadline"})
+
+
+def _digest(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chain_key(input: str, **llm_kwargs: Any) -> str:
+    """
+    Identify a chain run by its input and the settings that affect the model's answers.
+
+    Args:
+        input (str): The input to the first prompt.
+        **llm_kwargs: The keyword arguments passed to chain; transport settings such as client are ignored.
+
+    Returns:
+        str: A hex sha256 digest, the `run` of every checkpoint of this chain.
+    """
+    settings = {k: v for k, v in llm_kwargs.items() if k not in TRANSPORT_KWARGS}
+    return _digest("chain", input, settings)
+
+
+def step_key(parent: str, prompt: str) -> str:
+    """Key of the step running prompt after the step (or chain run) keyed parent."""
+    return _digest(parent, prompt)
+
+
+class Checkpoint(NamedTuple):
+    """One stored step output."""
+    key: str
+    run: str
+    step: int
+    prompt: str
+    output: str
+    created: float
+
+
+class ChainCheckpoints:
+    """SQLite store of chain step outputs. Memory only when no path is given."""
+
+    def __init__(self, path: str = ":memory:"):
+        """
+        Open or create the store.
+
+        Args:
+            path (str, optional): SQLite file holding the checkpoints.
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "key TEXT PRIMARY KEY, run TEXT NOT NULL, step INTEGER NOT NULL, "
+            "prompt TEXT NOT NULL, output TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS checkpoints_run ON checkpoints (run, step)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the stored output of the step keyed key, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT output FROM checkpoints WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, run: str, step: int, prompt: str, output: str) -> None:
+        """Store the output of one step."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, run, step, prompt, output, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, run, step, prompt, output, time.time()),
+            )
+            self._db.commit()
+
+    def list(self, run: Optional[str] = None) -> List[Checkpoint]:
+        """
+        List stored checkpoints, oldest run first and in step order.
+
+        Args:
+            run (str, optional): Only the checkpoints of this chain run (see chain_key).
+
+        Returns:
+            List[Checkpoint]: The matching checkpoints.
+        """
+        query = "SELECT key, run, step, prompt, output, created FROM checkpoints"
+        args: tuple = ()
+        if run is not None:
+            query += " WHERE run = ?"
+            args = (run,)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY created, step", args).fetchall()
+        return [Checkpoint(*row) for row in rows]
+
+    def clear(self, run: Optional[str] = None, from_step: int = 0) -> int:
+        """
+        Delete checkpoints so the next chain recomputes those steps.
+
+        Args:
+            run (str, optional): Only the checkpoints of this chain run. All runs when omitted.
+            from_step (int, optional): Keep the steps before this one.
+
+        Returns:
+            int: The number of checkpoints deleted.
+        """
+        query = "DELETE FROM checkpoints WHERE step >= ?"
+        args: tuple = (from_step,)
+        if run is not None:
+            query += " AND run = ?"
+            args += (run,)
+        with self._lock:
+            deleted = self._db.execute(query, args).rowcount
+            self._db.commit()
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of stored checkpoints."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self) -> None:
+        """Close the SQLite connection."""
+        with self._lock:
+            self._db.close()
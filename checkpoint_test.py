@@ -0,0 +1,57 @@
+from basic_workflow import chain
+from checkpoint import ChainCheckpoints, chain_key
+from llm import get_client
+from mock_llm_server import MockLLMServer
+from retry import RetryPolicy
+import pytest
+
+STEPS = ["Extract", "Normalize", "Sort", "Format"]
+
+def _step_responder(fail_on=None):
+    def respond(body):
+        step = body["messages"][-1]["content"].splitlines()[0]
+        if step == fail_on:
+            raise ValueError("step failed")
+        return f"{step} done"
+    return respond
+
+def test_resume_after_failure(tmp_path):
+    checkpoints = ChainCheckpoints(str(tmp_path / "chain.sqlite"))
+    with MockLLMServer(responder=_step_responder(fail_on="Sort"), keep_requests=True) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        with pytest.raises(Exception):
+            chain("report", STEPS, checkpoints=checkpoints, client=client, retry=RetryPolicy(max_attempts=1))
+        assert [c.step for c in checkpoints.list()] == [0, 1]
+
+        server.responder = _step_responder()
+        server.requests.clear()
+        assert chain("report", STEPS, checkpoints=checkpoints, client=client) == "Format done"
+        # Only the failed step and the one after it hit the model.
+        assert [r["messages"][-1]["content"].splitlines()[0] for r in server.requests] == ["Sort", "Format"]
+
+def test_edited_prompt_invalidates_later_steps():
+    checkpoints = ChainCheckpoints()
+    with MockLLMServer(responder=_step_responder(), keep_requests=True) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        chain("report", STEPS, checkpoints=checkpoints, client=client)
+        server.requests.clear()
+        chain("report", STEPS[:-1] + ["Tabulate"], checkpoints=checkpoints, client=client)
+        assert len(server.requests) == 1
+
+        # A different input or model is a different run.
+        chain("report", STEPS, checkpoints=checkpoints, client=client, model="qwen-max")
+        assert len(server.requests) == 1 + len(STEPS)
+
+def test_list_and_clear():
+    checkpoints = ChainCheckpoints()
+    with MockLLMServer(responder=_step_responder()) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        chain("a", STEPS, checkpoints=checkpoints, client=client)
+        chain("b", STEPS, checkpoints=checkpoints, client=client)
+
+    run = chain_key("a")
+    assert [c.prompt for c in checkpoints.list(run)] == STEPS
+    assert checkpoints.clear(run, from_step=2) == 2
+    assert [c.step for c in checkpoints.list(run)] == [0, 1]
+    assert checkpoints.clear() == 6
+    assert checkpoints.stats()["entries"] == 0
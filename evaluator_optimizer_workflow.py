@@ -1,12 +1,31 @@
 # In this workflow, one LLM call generates a response while another provides evaluation and feedback in a loop.
-from llm import llm_call, extract_xml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Optional
+import json
+from checkpoint import TRANSPORT_KWARGS
+from llm import llm_call, llm_stream
+from llm_cache import ResponseCache, make_cache_key
+from loop_memory import LoopMemory
+from rate_limiter import estimate_tokens
+from tag_parser import TagStreamExtractor, extract_tags
+from telemetry import bind, get_telemetry, span
 
-def generate(prompt: str, task: str, context: str= "") -> tuple[str, str]:
-    """Generate and improve a solution based on feedback."""
-    full_prompt = f"{prompt}\n{context}\nTask: {task}" if context else f"{prompt}\nTask: {task}"
-    response = llm_call(full_prompt)
-    thoughts = extract_xml(response, "thoughts")
-    result = extract_xml(response, "response")
+def generate(prompt: str, task: str, context: str= "", prefix_layout: bool = False, **llm_kwargs: Any) -> tuple[str, str]:
+    """
+    Generate and improve a solution based on feedback.
+
+    prefix_layout puts the per-round context after the task instead of before it, so consecutive rounds
+    share the prompt and the task as a prefix the provider can cache.
+    """
+    if not context:
+        full_prompt = f"{prompt}\nTask: {task}"
+    elif prefix_layout:
+        full_prompt = f"{prompt}\nTask: {task}\n{context}"
+    else:
+        full_prompt = f"{prompt}\n{context}\nTask: {task}"
+    response = llm_call(full_prompt, **llm_kwargs)
+    tags = extract_tags(response, ["thoughts", "response"])
+    thoughts, result = tags["thoughts"], tags["response"]
 
     print("\n=== GENERATION START ===")
     print(f"Thoughts:\n{thoughts}\n")
@@ -15,12 +34,63 @@ def generate(prompt: str, task: str, context: str= "") -> tuple[str, str]:
 
     return thoughts, result
 
-def evaluate(prompt: str, content: str, task: str) -> tuple[str, str]:
-    """Evaluate if a solution meets requirements."""
-    full_prompt = f"{prompt}\nOriginal task: {task}\nContent to evaluate: {content}"
-    response = llm_call(full_prompt)
-    evaluation = extract_xml(response, "evaluation")
-    feedback = extract_xml(response, "feedback")
+def _normalize(content: str) -> str:
+    # Line endings and trailing whitespace never change a verdict; indentation can, so it is kept.
+    return "\n".join(line.rstrip() for line in content.strip().splitlines())
+
+def _evaluation_key(prompt: str, content: str, task: str, llm_kwargs: dict) -> str:
+    settings = {k: v for k, v in llm_kwargs.items() if k not in TRANSPORT_KWARGS and k != "stats"}
+    model = settings.pop("model", "qwen-plus")
+    return make_cache_key(model, [{"evaluator": prompt, "task": task, "content": _normalize(content)}], **settings)
+
+def _stream_evaluation(full_prompt: str, **llm_kwargs: Any) -> dict[str, str]:
+    extractor = TagStreamExtractor(["evaluation", "feedback"])
+    deltas = llm_stream(full_prompt, **llm_kwargs)
+    try:
+        for delta in deltas:
+            extractor.feed(delta)
+            # A pass needs no feedback: closing the stream cancels the rest of the generation. Anything else
+            # needs all of it, so that stream runs to the end and reports its usage.
+            if extractor.results.get("evaluation", "").strip() == "PASS":
+                break
+    finally:
+        deltas.close()
+    return extractor.close()
+
+def evaluate(
+    prompt: str,
+    content: str,
+    task: str,
+    eval_cache: Optional[ResponseCache] = None,
+    early_exit: bool = False,
+    **llm_kwargs: Any,
+) -> tuple[str, str]:
+    """
+    Evaluate if a solution meets requirements.
+
+    Args:
+        eval_cache (ResponseCache, optional): Verdicts keyed on the evaluator prompt, the task and the content
+            with line endings and trailing whitespace normalized, so a repeated attempt is not evaluated twice.
+            A hit is reported to telemetry as a cache hit of the enclosing span.
+        early_exit (bool, optional): Stream the evaluation and stop as soon as `<evaluation>PASS</evaluation>`
+            is in, without waiting for the feedback. The cut-short call counts in llm_cancelled_total.
+    """
+    key = _evaluation_key(prompt, content, task, llm_kwargs) if eval_cache is not None else None
+    cached = eval_cache.get(key) if eval_cache is not None else None
+    if cached is not None:
+        with get_telemetry().call(llm_kwargs.get("model", "qwen-plus"), kind="stream" if early_exit else "call") as record:
+            record.cache_hit = True
+        evaluation, feedback = json.loads(cached)
+    else:
+        full_prompt = f"{prompt}\nOriginal task: {task}\nContent to evaluate: {content}"
+        if early_exit:
+            tags = _stream_evaluation(full_prompt, **llm_kwargs)
+        else:
+            tags = extract_tags(llm_call(full_prompt, **llm_kwargs), ["evaluation", "feedback"])
+        # The verdict is compared as "PASS" here (early exit), in loop and from the cache alike.
+        evaluation, feedback = tags["evaluation"].strip(), tags["feedback"]
+        if eval_cache is not None:
+            eval_cache.set(key, json.dumps([evaluation, feedback], ensure_ascii=False))
 
     print("=== EVALUATION START ===")
     print(f"Status: {evaluation}")
@@ -29,26 +99,97 @@ def evaluate(prompt: str, content: str, task: str) -> tuple[str, str]:
     
     return evaluation, feedback
 
-def loop(task: str, evaluator_prompt: str, generator_prompt: str) -> tuple[str, list[dict]]:
-    """Keep generating and evaluating until requirements are met."""
-    memory = []
+class LoopLimitExceeded(RuntimeError):
+    """The loop hit max_rounds or its token budget before an attempt passed."""
+
+    def __init__(self, message: str, result: str, chain_of_thought: list[dict]):
+        super().__init__(message)
+        self.result = result
+        self.chain_of_thought = chain_of_thought
+
+def _estimated_tokens(*texts: str) -> int:
+    return sum(estimate_tokens(t) for t in texts)
+
+def loop(
+    task: str,
+    evaluator_prompt: str,
+    generator_prompt: str,
+    n_candidates: int = 1,
+    max_rounds: Optional[int] = None,
+    token_budget: Optional[int] = None,
+    memory: Optional[LoopMemory] = None,
+    eval_cache: Optional[ResponseCache] = None,
+    early_exit: bool = False,
+    prefix_layout: bool = False,
+    **llm_kwargs: Any,
+) -> tuple[str, list[dict]]:
+    """
+    Keep generating and evaluating until requirements are met. llm_kwargs are passed to every llm_call.
+
+    With n_candidates > 1 each round generates that many candidates in parallel, evaluates each as soon as it
+    is generated and returns the first that passes. Candidates only differ if sampling does, so use a
+    non-zero temperature and no response cache.
+
+    Args:
+        n_candidates (int, optional): Candidates generated and evaluated concurrently per round.
+        max_rounds (int, optional): Give up after this many rounds. Defaults to None, which loops until an
+            attempt passes.
+        token_budget (int, optional): Give up before a round that would push the estimated prompt plus
+            completion tokens spent so far over this budget (assuming it costs as much as the last round).
+        memory (LoopMemory, optional): How previous attempts are carried into the next generation, e.g.
+            LoopMemory(keep_last=2, max_prompt_tokens=4000) to stop the context growing every round.
+            Defaults to every attempt verbatim.
+        eval_cache (ResponseCache, optional): Skip evaluating an attempt already evaluated, see evaluate. Hits
+            show up in llm_cache_hits_total{span="loop.evaluate"}.
+        early_exit (bool, optional): Accept a pass without waiting for its feedback, see evaluate. Early exits
+            show up in llm_cancelled_total{span="loop.evaluate"}.
+        prefix_layout (bool, optional): Put the previous attempts after the task in the generator prompt, see
+            generate.
+
+    Raises:
+        LoopLimitExceeded: A limit was hit; carries the last attempt and the chain of thought so far.
+    """
+    memory = memory if memory is not None else LoopMemory(keep_last=None)
     chain_of_thought = []
+    context = ""
+    spent = last_round = 0
+
+    def attempt(round: int, candidate: int) -> tuple[str, str, str, str, int]:
+        with span("loop.generate", round=round, candidate=candidate):
+            thoughts, result = generate(generator_prompt, task, context, prefix_layout, **llm_kwargs)
+        with span("loop.evaluate", round=round, candidate=candidate):
+            evaluation, feedback = evaluate(evaluator_prompt, result, task, eval_cache, early_exit, **llm_kwargs)
+        tokens = _estimated_tokens(generator_prompt, context, task, thoughts, result,
+                                   evaluator_prompt, result, task, evaluation, feedback)
+        return thoughts, result, evaluation, feedback, tokens
+
+    def give_up(reason: str) -> LoopLimitExceeded:
+        return LoopLimitExceeded(reason, memory.attempts[-1] if memory.attempts else "", chain_of_thought)
+
+    executor = ThreadPoolExecutor(max_workers=n_candidates)
+    try:
+        with span("loop", candidates=n_candidates):
+            round = 0
+            while True:
+                if max_rounds is not None and round >= max_rounds:
+                    raise give_up(f"no attempt passed in {max_rounds} rounds")
+                if token_budget is not None and round and spent + last_round > token_budget:
+                    raise give_up(f"token budget of {token_budget} reached after about {spent} tokens")
 
-    thoughts, result = generate(generator_prompt, task)
-    memory.append(result)
-    chain_of_thought.append({"thoughts": thoughts, "result": result})
-
-    while True:
-        evaluation, feedback = evaluate(evaluator_prompt, result, task)
-        if evaluation == "PASS":
-            return result, chain_of_thought
-            
-        context = "\n".join([
-            "Previous attempts:",
-            *[f"- {m}" for m in memory],
-            f"\nFeedback: {feedback}"
-        ])
-        
-        thoughts, result = generate(generator_prompt, task, context)
-        memory.append(result)
-        chain_of_thought.append({"thoughts": thoughts, "result": result})
\ No newline at end of file
+                futures = [executor.submit(bind(attempt), round, i) for i in range(n_candidates)]
+                feedbacks = []
+                last_round = 0
+                for future in as_completed(futures):
+                    thoughts, result, evaluation, feedback, tokens = future.result()
+                    last_round += tokens
+                    memory.add(result)
+                    chain_of_thought.append({"thoughts": thoughts, "result": result})
+                    if evaluation == "PASS":
+                        return result, chain_of_thought
+                    feedbacks.append(feedback)
+                spent += last_round
+                context = memory.render("\n".join(feedbacks))
+                round += 1
+    finally:
+        # Returning on the first PASS abandons the rest of the round; calls already sent finish in the background.
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,199 @@
-from openai import OpenAI
-import re
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass
+from llm_cache import ResponseCache, make_cache_key
+from tag_parser import TagStreamExtractor, tag_pattern
+from singleflight import SingleFlight, AsyncSingleFlight
+from rate_limiter import AdaptiveLimiter, estimate_tokens
+from retry import HedgePolicy, RetryPolicy, acall_with_retry, call_with_retry
+from telemetry import CallRecord, get_telemetry
+import importlib.util
+import threading
+import asyncio
+import weakref
+import httpx
+import time
 import os
 
 # https://www.anthropic.com/engineering/building-effective-agents
 
-def llm_call(prompt: str, system_prompt: str = 'Answer in Chinese', model: str = 'qwen-plus') -> str:
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+_clients: Dict[Tuple[str, str], OpenAI] = {}
+_clients_lock = threading.Lock()
+# Async connection pools are bound to the event loop that opened them, so keep one registry per loop.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+
+# Shared by every llm_call(coalesce=True); read `coalescer.stats()` for the number of calls saved.
+coalescer = SingleFlight()
+async_coalescer = AsyncSingleFlight()
+
+# Retries are done here (with jitter, visible to the limiter), so pooled clients do not retry on their own.
+DEFAULT_RETRY = RetryPolicy()
+
+# Expected completion length used for the tokens/min estimate when max_tokens is not set.
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+# Every LLM request in the process (llm_call, llm_stream, their async variants and the agent loop)
+# goes through this limiter. Quotas come from $DASHSCOPE_RPM / $DASHSCOPE_TPM; see set_limiter.
+_limiter = AdaptiveLimiter(rpm=_env_float("DASHSCOPE_RPM"), tpm=_env_float("DASHSCOPE_TPM"))
+
+
+def get_limiter() -> AdaptiveLimiter:
+    """Return the process-wide rate limiter. Use `get_limiter().snapshot()` for monitoring."""
+    return _limiter
+
+
+def set_limiter(limiter: AdaptiveLimiter) -> None:
+    """Replace the process-wide rate limiter, e.g. with the quotas of another provider account."""
+    global _limiter
+    _limiter = limiter
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], params: Dict[str, Any]) -> int:
+    """Estimate prompt plus completion tokens of a request before sending it."""
+    prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+    return prompt_tokens + params.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 support in httpx needs the optional `h2` package."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _resolve_endpoint(base_url: Optional[str], api_key: Optional[str]) -> Tuple[str, str]:
+    base_url = base_url or os.getenv("DASHSCOPE_BASE_URL", DASHSCOPE_BASE_URL)
+    api_key = api_key or os.getenv("DASHSCOPE_API_KEY", "")
+    return base_url, api_key
+
+
+def get_client(
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    http2: Optional[bool] = None,
+    max_retries: int = 0,
+) -> OpenAI:
+    """
+    Return the process-wide OpenAI client for (base_url, api_key), creating it on first use.
+
+    The client owns a keep-alive connection pool, so reusing it across calls and threads
+    avoids a new TCP/TLS handshake per request. Pool settings only apply when the client
+    is first created; later calls with the same key get the existing client.
+
+    Args:
+        base_url (str, optional): API base url. Defaults to $DASHSCOPE_BASE_URL or DashScope.
+        api_key (str, optional): API key. Defaults to $DASHSCOPE_API_KEY.
+        max_connections (int, optional): Maximum number of open connections in the pool.
+        max_keepalive_connections (int, optional): Maximum number of idle connections kept alive.
+        keepalive_expiry (float, optional): Seconds an idle connection is kept alive.
+        http2 (bool, optional): Use HTTP/2. Defaults to True when `h2` is installed.
+        max_retries (int, optional): Retries the OpenAI client makes on its own. Defaults to 0
+            because llm_call applies its own RetryPolicy.
+
+    Returns:
+        OpenAI: The shared client.
+    """
+    key = _resolve_endpoint(base_url, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if http2 is None:
+                http2 = _http2_available()
+            http_client = DefaultHttpxClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+            )
+            client = OpenAI(base_url=key[0], api_key=key[1], http_client=http_client, max_retries=max_retries)
+            _clients[key] = client
+    return client
+
+
+def get_async_client(
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    http2: Optional[bool] = None,
+    max_retries: int = 0,
+) -> AsyncOpenAI:
+    """
+    Return the AsyncOpenAI client for (base_url, api_key) on the running event loop.
+
+    Same as get_client, but clients are shared per event loop. Must be called from a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    key = _resolve_endpoint(base_url, api_key)
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            if http2 is None:
+                http2 = _http2_available()
+            http_client = DefaultAsyncHttpxClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+            )
+            client = AsyncOpenAI(base_url=key[0], api_key=key[1], http_client=http_client, max_retries=max_retries)
+            clients[key] = client
+    return client
+
+
+def close_clients() -> None:
+    """Close every pooled client and empty the registry."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def _timeout_param(timeout: Optional[float]) -> Dict[str, float]:
+    """Per-request timeout for chat.completions.create; passing None there would disable the timeout."""
+    return {} if timeout is None else {"timeout": timeout}
+
+
+def _build_messages(prompt: str, system_prompt: str) -> List[Dict[str, str]]:
+    messages = []
+    if system_prompt != '':
+        messages.append({'role':'system', 'content': system_prompt})
+    messages.append({'role': 'user', 'content': prompt})
+    return messages
+
+
+def llm_call(
+    prompt: str,
+    system_prompt: str = 'Answer in Chinese',
+    model: str = 'qwen-plus',
+    client: Optional[OpenAI] = None,
+    cache: Optional[ResponseCache] = None,
+    coalesce: bool = False,
+    retry: Optional[RetryPolicy] = None,
+    hedge: Optional[HedgePolicy] = None,
+    deadline: Optional[float] = None,
+    **params: Any,
+) -> str:
     """
     Call the model with the given prompt and returns the response.
 
@@ -12,30 +201,463 @@ def llm_call(prompt: str, system_prompt: str = 'Answer in Chinese', model: str =
         prompt (str): The user prompt to send to the model.
         system_prompt (str, optinal): The system prompt to send to the model. Defaults to "".
         model (str, optinal): The model to use.
+        client (OpenAI, optional): Client to send the request with. Defaults to the pooled client.
+        cache (ResponseCache, optional): Serve and store the response through this cache.
+            Leave unset for calls that must not be cached, e.g. sampling at a high temperature.
+        coalesce (bool, optional): Share one in-flight request with concurrent identical calls
+            (see `coalescer`). Leave off when identical prompts should yield independent samples.
+        retry (RetryPolicy, optional): Retry policy for 429s, timeouts and 5xx. Defaults to DEFAULT_RETRY.
+        hedge (HedgePolicy, optional): Send a duplicate request when the first is slower than the
+            policy's latency quantile and keep the first to finish. Off by default.
+        deadline (float, optional): Seconds the call may take including retries; raises DeadlineExceeded.
+        **params: Extra sampling parameters passed to chat.completions.create (temperature, ...).
 
     Returns:
         str: The response from the model.
     """
 
-    client = OpenAI(
-        api_key=os.getenv("DASHSCOPE_API_KEY"),  
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-        )
-    
-    messages = []
-    if system_prompt != '':
-        messages.append({'role':'system', 'content': system_prompt})
-    messages.append({'role': 'user', 'content': prompt})
-    completion = client.chat.completions.create(
-    model=model,
-    messages=messages,
-    )
-    
-    return completion.choices[0].message.content
+    messages = _build_messages(prompt, system_prompt)
+    key = make_cache_key(model, messages, **params) if cache is not None or coalesce else None
+
+    with get_telemetry().call(model) as record:
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                record.cache_hit = True
+                return cached
+
+        client = client or get_client()
+
+        def attempt(timeout: Optional[float]) -> Any:
+            record.attempts += 1
+            with get_limiter().limit(estimate_request_tokens(messages, params)) as slot:
+                completion = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **_timeout_param(timeout),
+                **params,
+                )
+                slot.record_usage(completion.usage)
+            record.record_usage(completion.usage)
+            return completion
+
+        def create() -> str:
+            completion = call_with_retry(attempt, retry or DEFAULT_RETRY, hedge, deadline)
+            content = completion.choices[0].message.content
+            if cache is not None and content is not None:
+                cache.set(key, content)
+            return content
+
+        if coalesce:
+            content = coalescer.do(f"{client.base_url}|{key}", create)
+            # Callers that shared another caller's request sent nothing themselves.
+            record.coalesced = record.attempts == 0
+            return content
+        return create()
+
+
+async def allm_call(
+    prompt: str,
+    system_prompt: str = 'Answer in Chinese',
+    model: str = 'qwen-plus',
+    client: Optional[AsyncOpenAI] = None,
+    cache: Optional[ResponseCache] = None,
+    coalesce: bool = False,
+    retry: Optional[RetryPolicy] = None,
+    hedge: Optional[HedgePolicy] = None,
+    deadline: Optional[float] = None,
+    **params: Any,
+) -> str:
+    """
+    Async variant of llm_call. Uses the per-loop pooled AsyncOpenAI client and `async_coalescer`.
+    Losing hedged requests are cancelled rather than abandoned.
+    """
+    messages = _build_messages(prompt, system_prompt)
+    key = make_cache_key(model, messages, **params) if cache is not None or coalesce else None
+
+    with get_telemetry().call(model) as record:
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                record.cache_hit = True
+                return cached
+
+        client = client or get_async_client()
+
+        async def attempt(timeout: Optional[float]) -> Any:
+            record.attempts += 1
+            async with get_limiter().alimit(estimate_request_tokens(messages, params)) as slot:
+                completion = await client.chat.completions.create(
+                    model=model, messages=messages, **_timeout_param(timeout), **params
+                )
+                slot.record_usage(completion.usage)
+            record.record_usage(completion.usage)
+            return completion
+
+        async def create() -> str:
+            completion = await acall_with_retry(attempt, retry or DEFAULT_RETRY, hedge, deadline)
+            content = completion.choices[0].message.content
+            if cache is not None and content is not None:
+                cache.set(key, content)
+            return content
+
+        if coalesce:
+            content = await async_coalescer.do(f"{client.base_url}|{key}", create)
+            record.coalesced = record.attempts == 0
+            return content
+        return await create()
+
+
+@dataclass
+class StreamStats:
+    """Timing and throughput of one streamed completion. Times come from time.perf_counter()."""
+
+    started: float = 0.0
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    chunks: int = 0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    cancelled: bool = False
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """Seconds from sending the request to the first text delta."""
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Seconds from sending the request to the end of the stream."""
+        return None if self.finished is None else self.finished - self.started
+
+    @property
+    def total_tokens(self) -> Optional[int]:
+        """Prompt plus completion tokens, when the provider reported usage."""
+        if self.prompt_tokens is None or self.completion_tokens is None:
+            return None
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def tokens_per_sec(self) -> Optional[float]:
+        """Generation speed after the first token. Falls back to the delta count when usage is missing."""
+        if self.first_token is None or self.finished is None:
+            return None
+        tokens = self.completion_tokens if self.completion_tokens is not None else self.chunks
+        elapsed = self.finished - self.first_token
+        return tokens / elapsed if elapsed > 0 else None
+
+
+def _record_delta(stats: StreamStats, chunk: Any) -> Optional[str]:
+    """Update stats from a stream chunk and return its text delta, if any."""
+    if getattr(chunk, "usage", None) is not None:
+        stats.prompt_tokens = chunk.usage.prompt_tokens
+        stats.completion_tokens = chunk.usage.completion_tokens
+        details = getattr(chunk.usage, "prompt_tokens_details", None)
+        stats.cached_tokens = getattr(details, "cached_tokens", None)
+    if not chunk.choices:
+        return None
+    delta = chunk.choices[0].delta.content
+    if delta:
+        if stats.first_token is None:
+            stats.first_token = time.perf_counter()
+        stats.chunks += 1
+    return delta or None
+
+
+def _record_stream(record: CallRecord, stats: StreamStats) -> None:
+    """Copy the timing and usage of a finished stream into its telemetry record."""
+    record.ttft = stats.ttft
+    record.latency = stats.duration
+    record.prompt_tokens = stats.prompt_tokens
+    record.completion_tokens = stats.completion_tokens
+    record.cached_tokens = stats.cached_tokens
+    record.cancelled = stats.cancelled
+
+
+def llm_stream(
+    prompt: str,
+    system_prompt: str = 'Answer in Chinese',
+    model: str = 'qwen-plus',
+    client: Optional[OpenAI] = None,
+    cache: Optional[ResponseCache] = None,
+    stats: Optional[StreamStats] = None,
+    retry: Optional[RetryPolicy] = None,
+    deadline: Optional[float] = None,
+    coalesce: bool = False,
+    hedge: Optional[HedgePolicy] = None,
+    **params: Any,
+) -> Iterator[str]:
+    """
+    Call the model with stream=True and yield text deltas as they arrive.
+
+    Closing the generator early (e.g. `break` in the consuming loop) closes the HTTP stream,
+    which stops the generation.
+
+    Args:
+        prompt (str): The user prompt to send to the model.
+        system_prompt (str, optional): The system prompt to send to the model.
+        model (str, optional): The model to use.
+        client (OpenAI, optional): Client to send the request with. Defaults to the pooled client.
+        cache (ResponseCache, optional): On a hit the cached response is yielded as a single delta;
+            a fully consumed stream is stored.
+        stats (StreamStats, optional): Filled in with time-to-first-token and tokens/sec.
+        retry (RetryPolicy, optional): Retry policy for opening the stream. Defaults to DEFAULT_RETRY;
+            a stream that fails after yielding text is not retried.
+        deadline (float, optional): Seconds allowed for opening the stream (including retries), also
+            used as the read timeout while streaming.
+        coalesce, hedge: Accepted so llm_call keyword arguments can be passed through; streams are
+            neither coalesced nor hedged.
+        **params: Extra sampling parameters passed to chat.completions.create.
+
+    Yields:
+        str: Text deltas of the response.
+    """
+    messages = _build_messages(prompt, system_prompt)
+    stats = stats if stats is not None else StreamStats()
+    stats.started = time.perf_counter()
+
+    with get_telemetry().call(model, kind="stream") as record:
+        try:
+            if cache is not None:
+                key = make_cache_key(model, messages, **params)
+                cached = cache.get(key)
+                if cached is not None:
+                    stats.first_token = stats.finished = time.perf_counter()
+                    stats.chunks = 1
+                    record.cache_hit = True
+                    yield cached
+                    return
+
+            client = client or get_client()
+            limiter = get_limiter()
+            estimated_tokens = estimate_request_tokens(messages, params)
+            params.setdefault("stream_options", {"include_usage": True})
+
+            def open_stream(timeout: Optional[float]) -> Any:
+                record.attempts += 1
+                slot = limiter.acquire(estimated_tokens)
+                try:
+                    return slot, client.chat.completions.create(
+                        model=model, messages=messages, stream=True, **_timeout_param(timeout), **params
+                    )
+                except BaseException as e:
+                    limiter.release(slot, e)
+                    raise
+
+            slot, stream = call_with_retry(open_stream, retry or DEFAULT_RETRY, deadline=deadline)
+            parts = []
+            error = None
+            try:
+                try:
+                    for chunk in stream:
+                        delta = _record_delta(stats, chunk)
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                finally:
+                    stream.close()
+            except BaseException as e:
+                error = e
+                # The consumer closed the stream before it ended, e.g. an early exit once it had what it needed.
+                stats.cancelled = isinstance(e, GeneratorExit)
+                raise
+            finally:
+                stats.finished = time.perf_counter()
+                slot.tokens_used = stats.total_tokens
+                limiter.release(slot, error)
+
+            if cache is not None:
+                cache.set(key, "".join(parts))
+        finally:
+            _record_stream(record, stats)
+
+
+async def allm_stream(
+    prompt: str,
+    system_prompt: str = 'Answer in Chinese',
+    model: str = 'qwen-plus',
+    client: Optional[AsyncOpenAI] = None,
+    cache: Optional[ResponseCache] = None,
+    stats: Optional[StreamStats] = None,
+    retry: Optional[RetryPolicy] = None,
+    deadline: Optional[float] = None,
+    coalesce: bool = False,
+    hedge: Optional[HedgePolicy] = None,
+    **params: Any,
+) -> AsyncIterator[str]:
+    """Async variant of llm_stream. Uses the per-loop pooled AsyncOpenAI client by default."""
+    messages = _build_messages(prompt, system_prompt)
+    stats = stats if stats is not None else StreamStats()
+    stats.started = time.perf_counter()
+
+    with get_telemetry().call(model, kind="stream") as record:
+        try:
+            if cache is not None:
+                key = make_cache_key(model, messages, **params)
+                cached = cache.get(key)
+                if cached is not None:
+                    stats.first_token = stats.finished = time.perf_counter()
+                    stats.chunks = 1
+                    record.cache_hit = True
+                    yield cached
+                    return
+
+            client = client or get_async_client()
+            limiter = get_limiter()
+            estimated_tokens = estimate_request_tokens(messages, params)
+            params.setdefault("stream_options", {"include_usage": True})
+
+            async def open_stream(timeout: Optional[float]) -> Any:
+                record.attempts += 1
+                slot = await limiter.aacquire(estimated_tokens)
+                try:
+                    return slot, await client.chat.completions.create(
+                        model=model, messages=messages, stream=True, **_timeout_param(timeout), **params
+                    )
+                except BaseException as e:
+                    limiter.release(slot, e)
+                    raise
+
+            slot, stream = await acall_with_retry(open_stream, retry or DEFAULT_RETRY, deadline=deadline)
+            parts = []
+            error = None
+            try:
+                try:
+                    async for chunk in stream:
+                        delta = _record_delta(stats, chunk)
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                finally:
+                    await stream.close()
+            except BaseException as e:
+                error = e
+                # The consumer closed the stream before it ended, e.g. an early exit once it had what it needed.
+                stats.cancelled = isinstance(e, GeneratorExit)
+                raise
+            finally:
+                stats.finished = time.perf_counter()
+                slot.tokens_used = stats.total_tokens
+                limiter.release(slot, error)
+
+            if cache is not None:
+                cache.set(key, "".join(parts))
+        finally:
+            _record_stream(record, stats)
+
+
+def _extract_cache_key(prompt: str, system_prompt: str, model: str, extractor: TagStreamExtractor,
+                       llm_kwargs: Dict[str, Any]) -> str:
+    # The stream is cut short, so the truncated text is cached under its own key rather than
+    # letting llm_stream skip storing it (or llm_call later read it back as a full response).
+    params = {k: v for k, v in llm_kwargs.items()
+              if k not in ('client', 'stats', 'retry', 'deadline', 'coalesce', 'hedge')}
+    return make_cache_key(model, _build_messages(prompt, system_prompt),
+                          extract_until=sorted(extractor.required), **params)
+
+
+def _extract_cached(cached: str, model: str, extractor: TagStreamExtractor) -> Dict[str, str]:
+    with get_telemetry().call(model, kind="stream") as record:
+        record.cache_hit = True
+    extractor.feed(cached)
+    return extractor.close()
+
+
+def llm_extract(
+    prompt: str,
+    tags: List[str],
+    required: Optional[List[str]] = None,
+    on_tag: Optional[Callable[[str, str], None]] = None,
+    system_prompt: str = 'Answer in Chinese',
+    model: str = 'qwen-plus',
+    **llm_kwargs: Any,
+) -> Dict[str, str]:
+    """
+    Stream a completion and return the requested XML tags, stopping as soon as the required ones are in.
+
+    The rest of the generation is cancelled by closing the stream, so the tail of the response
+    costs neither latency nor output tokens.
+
+    Args:
+        prompt (str): The user prompt to send to the model.
+        tags (List[str]): The XML tags to extract.
+        required (List[str], optional): Tags to wait for before cancelling. Defaults to all tags.
+        on_tag (Callable[[str, str], None], optional): Called with (tag, content) as each tag closes.
+        system_prompt (str, optional): The system prompt to send to the model.
+        model (str, optional): The model to use.
+        **llm_kwargs: Extra keyword arguments for llm_stream (client, cache, stats, sampling parameters).
+
+    Returns:
+        Dict[str, str]: Content per tag, "" for tags that were not found.
+    """
+    extractor = TagStreamExtractor(tags, required=required, on_tag=on_tag)
+    cache = llm_kwargs.pop('cache', None)
+    if cache is not None:
+        key = _extract_cache_key(prompt, system_prompt, model, extractor, llm_kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            return _extract_cached(cached, model, extractor)
+
+    deltas = llm_stream(prompt, system_prompt, model, **llm_kwargs)
+    try:
+        for delta in deltas:
+            extractor.feed(delta)
+            if extractor.done:
+                break
+    finally:
+        deltas.close()
+
+    if cache is not None:
+        cache.set(key, extractor.text)
+    return extractor.close()
+
+
+async def allm_extract(
+    prompt: str,
+    tags: List[str],
+    required: Optional[List[str]] = None,
+    on_tag: Optional[Callable[[str, str], None]] = None,
+    system_prompt: str = 'Answer in Chinese',
+    model: str = 'qwen-plus',
+    **llm_kwargs: Any,
+) -> Dict[str, str]:
+    """Async variant of llm_extract, streaming through allm_stream."""
+    extractor = TagStreamExtractor(tags, required=required, on_tag=on_tag)
+    cache = llm_kwargs.pop('cache', None)
+    if cache is not None:
+        key = _extract_cache_key(prompt, system_prompt, model, extractor, llm_kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            return _extract_cached(cached, model, extractor)
+
+    deltas = allm_stream(prompt, system_prompt, model, **llm_kwargs)
+    try:
+        async for delta in deltas:
+            extractor.feed(delta)
+            if extractor.done:
+                break
+    finally:
+        await deltas.aclose()
+
+    if cache is not None:
+        cache.set(key, extractor.text)
+    return extractor.close()
+
+
+def print_stream(deltas: Iterable[str]) -> str:
+    """Print text deltas as they arrive and return the full text."""
+    parts = []
+    for delta in deltas:
+        print(delta, end="", flush=True)
+        parts.append(delta)
+    print()
+    return "".join(parts)
+
 
 def extract_xml(text: str, tag: str) -> str:
     """
-    Extracts the content of the specified XML tag from the given text. Used for parsing structured responses 
+    Extracts the content of the specified XML tag from the given text. Used for parsing structured responses
 
     Args:
         text (str): The text containing the XML.
@@ -44,5 +666,5 @@ def extract_xml(text: str, tag: str) -> str:
     Returns:
         str: The content of the specified XML tag, or an empty string if the tag is not found.
     """
-    match = re.search(f'<{tag}>(.*?)</{tag}>', text, re.DOTALL)
-    return match.group(1) if match else ""
\ No newline at end of file
+    match = tag_pattern(tag).search(text)
+    return match.group(1) if match else ""
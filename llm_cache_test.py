@@ -0,0 +1,60 @@
+from llm import llm_call, get_client
+from llm_cache import ResponseCache, make_cache_key
+from basic_workflow import chain
+from mock_llm_server import MockLLMServer
+import time
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+def test_key_covers_model_and_params():
+    key = make_cache_key("qwen-plus", MESSAGES, temperature=0)
+    assert key == make_cache_key("qwen-plus", MESSAGES, temperature=0)
+    assert key != make_cache_key("qwen-max", MESSAGES, temperature=0)
+    assert key != make_cache_key("qwen-plus", MESSAGES, temperature=1)
+
+def test_memory_lru_eviction():
+    cache = ResponseCache(max_memory_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "b" is now least recently used
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_expiry():
+    cache = ResponseCache(ttl=0.05)
+    cache.set("a", "1")
+    assert cache.get("a") == "1"
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_disk_tier_persists_and_caps(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path=path, max_disk_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.set("c", "3")
+    cache.close()
+
+    reopened = ResponseCache(path=path)
+    assert reopened.get("a") is None
+    assert reopened.get("c") == "3"
+    assert reopened.stats()["disk_hits"] == 1
+    assert reopened.stats()["disk_entries"] == 2
+
+def test_llm_call_opt_in_cache():
+    cache = ResponseCache()
+    with MockLLMServer() as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        steps = ["Step one", "Step two"]
+        first = chain("input", steps, client=client, cache=cache)
+        second = chain("input", steps, client=client, cache=cache)
+        assert first == second
+        assert server.request_count == 2
+        assert cache.stats()["hits"] == 2
+
+        llm_call("input", client=client)
+        llm_call("input", client=client)
+        assert server.request_count == 4
@@ -1,4 +1,7 @@
-from llm import llm_call
+from llm import llm_call, llm_stream, allm_stream, llm_extract, get_client, get_async_client, StreamStats
+from mock_llm_server import MockLLMServer
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 def test_llm():
     """
@@ -11,4 +14,55 @@ def test_llm():
     system_prompt = "我是Kong Hang的助手"
     msg = llm_call("你是谁？", system_prompt)
     print(msg)
-    assert msg.startswith(system_prompt)
\ No newline at end of file
+    assert msg.startswith(system_prompt)
+
+def test_get_client_is_shared():
+    """One client per (base_url, api_key), shared across threads."""
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: get_client("http://127.0.0.1:1/v1", "k1"), range(16)))
+    assert all(c is clients[0] for c in clients)
+    assert get_client("http://127.0.0.1:1/v1", "k2") is not clients[0]
+
+def test_llm_call_with_pooled_client():
+    with MockLLMServer() as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        assert llm_call("hello", client=client) == "echo: hello"
+        assert llm_call("again", client=client) == "echo: again"
+        assert server.request_count == 2
+
+def test_llm_stream_records_ttft():
+    with MockLLMServer(token_delay=0.01) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        stats = StreamStats()
+        deltas = list(llm_stream("one two three", client=client, stats=stats))
+        assert "".join(deltas) == "echo: one two three"
+        assert len(deltas) > 1
+        assert 0 < stats.ttft <= stats.duration
+        assert stats.completion_tokens == 4
+        assert stats.tokens_per_sec > 0
+
+def test_llm_stream_early_close():
+    with MockLLMServer(token_delay=0.01) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        stats = StreamStats()
+        for delta in llm_stream(" ".join(["word"] * 200), client=client, stats=stats):
+            break
+        assert stats.chunks == 1
+        assert stats.duration < 1.0
+
+def test_allm_stream():
+    async def collect(base_url):
+        client = get_async_client(base_url=base_url, api_key="mock")
+        return [delta async for delta in allm_stream("async hello", client=client)]
+
+    with MockLLMServer() as server:
+        assert "".join(asyncio.run(collect(server.base_url))) == "echo: async hello"
+
+def test_llm_extract_stops_after_required_tags():
+    tail = " ".join(["filler"] * 500)
+    with MockLLMServer(responder=lambda body: f"<selection>billing</selection>\n<feedback>{tail}</feedback>") as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        stats = StreamStats()
+        tags = llm_extract("route me", ["selection", "feedback"], required=["selection"], client=client, stats=stats)
+        assert tags == {"selection": "billing", "feedback": ""}
+        assert stats.chunks < 10
@@ -0,0 +1,121 @@
+# Compacted memory of previous attempts for the evaluator-optimizer loop. Appending every attempt in full makes
+# each prompt longer than the last, so total tokens grow quadratically with the number of rounds.
+from typing import Any, Callable, List, Optional
+import difflib
+
+from llm import llm_call
+from rate_limiter import estimate_tokens
+
+SUMMARY_PROMPT = """
+Summarize these earlier attempts at a task in a few sentences: what each tried and what was wrong with it.
+Keep details that a next attempt must not repeat. Output only the summary.
+""".strip()
+
+
+def llm_summarizer(**llm_kwargs: Any) -> Callable[[str], str]:
+    """
+    Build a summarize callable for LoopMemory that asks the model.
+
+    Args:
+        **llm_kwargs: Keyword arguments for llm_call, e.g. a cheaper model.
+
+    Returns:
+        Callable[[str], str]: Maps the text to summarize to the summary.
+    """
+    return lambda text: llm_call(f"{SUMMARY_PROMPT}\n\n{text}", **llm_kwargs)
+
+
+def _diff(previous: str, current: str) -> str:
+    lines = difflib.unified_diff(previous.splitlines(), current.splitlines(), lineterm="", n=1)
+    return "\n".join(list(lines)[2:])  # Drop the ---/+++ file headers.
+
+
+class LoopMemory:
+    """
+    Previous attempts rendered into the generator's context: the last keep_last verbatim, older ones as diffs
+    against their predecessor (or folded into a running summary), all under an optional token ceiling.
+    """
+
+    def __init__(
+        self,
+        keep_last: Optional[int] = 2,
+        max_prompt_tokens: Optional[int] = None,
+        summarize: Optional[Callable[[str], str]] = None,
+    ):
+        """
+        Initialize an empty memory.
+
+        Args:
+            keep_last (int, optional): Attempts kept verbatim. None keeps every attempt verbatim, which is
+                what loop does without a memory.
+            max_prompt_tokens (int, optional): Ceiling on the estimated tokens of the rendered context. The
+                oldest entries are dropped first; the latest attempt is truncated only as a last resort.
+            summarize (Callable[[str], str], optional): Fold attempts older than keep_last into a running
+                summary instead of keeping diffs, e.g. llm_summarizer(model="qwen-turbo"). Each attempt is
+                summarized once, when it ages out.
+        """
+        self.keep_last = keep_last
+        self.max_prompt_tokens = max_prompt_tokens
+        self.summarize = summarize
+        self.attempts: List[str] = []
+        self.summary = ""
+        self._summarized = 0
+
+    def add(self, attempt: str) -> None:
+        """Remember one attempt."""
+        self.attempts.append(attempt)
+        if self.summarize is None or self.keep_last is None:
+            return
+        aged = self.attempts[self._summarized:len(self.attempts) - self.keep_last]
+        if aged:
+            text = "\n".join([f"Summary so far: {self.summary}" if self.summary else "", *[f"Attempt: {a}" for a in aged]])
+            self.summary = self.summarize(text.strip())
+            self._summarized += len(aged)
+
+    def _entries(self, start: int, with_summary: bool) -> List[str]:
+        # The first attempt shown is always verbatim, so every diff has its base in the context.
+        recent = start if self.keep_last is None else max(start, len(self.attempts) - self.keep_last)
+        entries = [f"Summary of earlier attempts: {self.summary}"] if with_summary and self.summary else []
+        for i in range(start, len(self.attempts)):
+            attempt = self.attempts[i]
+            if start < i < recent:
+                diff = _diff(self.attempts[i - 1], attempt)
+                # A diff only helps when it is shorter than the attempt itself.
+                if len(diff) < len(attempt):
+                    attempt = f"Changes from the previous attempt:\n{diff}"
+            entries.append(attempt)
+        return entries
+
+    def render(self, feedback: str) -> str:
+        """
+        Build the context for the next generation.
+
+        Args:
+            feedback (str): The evaluator's latest feedback.
+
+        Returns:
+            str: The previous attempts and the feedback, within max_prompt_tokens when set.
+        """
+        def text(entries: List[str]) -> str:
+            return "\n".join(["Previous attempts:", *[f"- {e}" for e in entries], f"\nFeedback: {feedback}"])
+
+        start, with_summary = self._summarized, True
+        entries = self._entries(start, with_summary)
+        if self.max_prompt_tokens is None:
+            return text(entries)
+        # Over the ceiling: drop the summary, then the oldest attempts, then shorten the latest one.
+        while estimate_tokens(text(entries)) > self.max_prompt_tokens:
+            if with_summary and self.summary:
+                with_summary = False
+            elif start < len(self.attempts) - 1:
+                start += 1
+            else:
+                break
+            entries = self._entries(start, with_summary)
+        while entries and entries[-1] and estimate_tokens(text(entries)) > self.max_prompt_tokens:
+            entries[-1] = entries[-1][:len(entries[-1]) * 3 // 4]
+        return text(entries)
+
+    def tokens(self, feedback: str = "") -> int:
+        """Estimated tokens of the rendered context."""
+        return estimate_tokens(self.render(feedback))
@@ -0,0 +1,68 @@
+from evaluator_optimizer_workflow import LoopLimitExceeded, loop
+from llm import get_client
+from loop_memory import LoopMemory
+from mock_llm_server import MockLLMServer
+from rate_limiter import estimate_tokens
+import itertools
+import pytest
+
+CODE = "\n".join(f"    line {i}" for i in range(40))
+
+def _attempt(n):
+    return CODE.replace("line 7", f"line 7 (revision {n})")
+
+def test_unbounded_memory_keeps_every_attempt_verbatim():
+    memory = LoopMemory(keep_last=None)
+    memory.add("a")
+    memory.add("b")
+    assert memory.render("fix") == "Previous attempts:\n- a\n- b\n\nFeedback: fix"
+
+def test_older_attempts_become_diffs():
+    memory = LoopMemory(keep_last=2)
+    for n in range(6):
+        memory.add(_attempt(n))
+    text = memory.render("fix")
+    assert text.count("line 39") == 3  # The first attempt and the last two.
+    assert text.count("Changes from the previous attempt:") == 3
+    assert "-    line 7 (revision 1)\n+    line 7 (revision 2)" in text
+
+def test_ceiling_and_summary():
+    calls = []
+
+    def summarize(text):
+        calls.append(text)
+        return f"{text.count('Attempt:')} more attempts failed"
+
+    memory = LoopMemory(keep_last=1, summarize=summarize, max_prompt_tokens=150)
+    for n in range(4):
+        memory.add(_attempt(n))
+    # Each attempt is folded into the summary once, as it ages out.
+    assert len(calls) == 3 and calls[-1].startswith("Summary so far:")
+    assert memory.tokens("fix") <= 150
+
+    memory.max_prompt_tokens = 20
+    text = memory.render("fix")
+    assert "Summary" not in text and memory.tokens("fix") <= 20
+
+def _generator_prompt_tokens(memory):
+    rounds = itertools.count()
+
+    def responder(body):
+        prompt = body["messages"][-1]["content"]
+        if "Content to evaluate:" in prompt:
+            return "<evaluation>NEEDS_IMPROVEMENT</evaluation><feedback>Again.</feedback>"
+        return f"<thoughts>t</thoughts><response>{_attempt(next(rounds))}</response>"
+
+    with MockLLMServer(responder=responder, keep_requests=True) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        with pytest.raises(LoopLimitExceeded):
+            loop("task", "Evaluate", "Generate", max_rounds=8, memory=memory, client=client)
+    prompts = [r["messages"][-1]["content"] for r in server.requests]
+    return [estimate_tokens(p) for p in prompts if "Content to evaluate:" not in p]
+
+def test_loop_prompt_stops_growing():
+    full = _generator_prompt_tokens(None)
+    compacted = _generator_prompt_tokens(LoopMemory(keep_last=2, max_prompt_tokens=400))
+    assert len(full) == len(compacted) == 8
+    assert max(compacted) <= 400 + estimate_tokens("Generate\nTask: task") + 1
+    assert compacted[-1] < full[-1] / 2
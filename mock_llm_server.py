@@ -0,0 +1,536 @@
+# A local stand-in for the OpenAI-compatible chat.completions endpoint, used by tests and benchmarks.
+# Point the workflows at it with DASHSCOPE_BASE_URL=http://127.0.0.1:8000/v1 after `python mock_llm_server.py`.
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.parser import BytesParser
+from typing import Any, Callable, Dict, List, Optional, Pattern, Sequence, Tuple, Union
+import email.policy
+import itertools
+import threading
+import random
+import json
+import sys
+import time
+import re
+
+# A reply is the assistant text, or a dict with "content" and/or "tool_calls"
+# ([{"name": ..., "arguments": {...}}]) for tool-calling responses.
+Reply = Union[str, Dict[str, Any]]
+Responder = Callable[[Dict[str, Any]], Reply]
+
+
+def echo_responder(body: Dict[str, Any]) -> str:
+    """Reply with the content of the last message."""
+    return f"echo: {body['messages'][-1]['content']}"
+
+
+def last_user_message(body: Dict[str, Any]) -> str:
+    """Text of the last user message in a request body."""
+    for message in reversed(body.get("messages", [])):
+        if message.get("role") == "user":
+            content = message.get("content") or ""
+            if isinstance(content, list):
+                return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+            return content
+    return ""
+
+
+class ScriptedResponder:
+    """
+    Reply from a script.
+
+    Rules are (regex, reply) pairs searched in the last user message; the first match wins and
+    its reply may be a callable taking the request body. Requests matching no rule consume
+    `replies` in order, then fall back to `fallback`.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Sequence[Tuple[str, Union[Reply, Responder]]]] = None,
+        replies: Optional[Sequence[Reply]] = None,
+        fallback: Responder = echo_responder,
+    ):
+        self.rules: List[Tuple[Pattern[str], Union[Reply, Responder]]] = [
+            (re.compile(pattern, re.DOTALL), reply) for pattern, reply in (rules or [])
+        ]
+        self._replies = list(replies or [])
+        self._lock = threading.Lock()
+        self.fallback = fallback
+
+    def __call__(self, body: Dict[str, Any]) -> Reply:
+        prompt = last_user_message(body)
+        for pattern, reply in self.rules:
+            if pattern.search(prompt):
+                return reply(body) if callable(reply) else reply
+        with self._lock:
+            if self._replies:
+                return self._replies.pop(0)
+        return self.fallback(body)
+
+
+def long_tail_latency(base: float, slow: float, slow_fraction: float) -> Callable[[], float]:
+    """Latency sampler: usually around base seconds, but slow seconds for a slow_fraction of requests."""
+    def sample() -> float:
+        if random.random() < slow_fraction:
+            return slow
+        return random.uniform(0.8 * base, 1.2 * base)
+    return sample
+
+
+def _count_tokens(text: str) -> int:
+    """Rough whitespace token count, good enough for usage numbers."""
+    return len(text.split())
+
+
+def _split_tokens(text: str) -> List[str]:
+    """Split text into whitespace-delimited pieces that concatenate back to the text."""
+    return re.findall(r"\s*\S+\s*", text) or [text]
+
+
+def _normalize_reply(reply: Reply, ids: "itertools.count[int]") -> Tuple[str, List[Dict[str, Any]]]:
+    """Split a reply into its text and OpenAI-format tool calls."""
+    if isinstance(reply, str):
+        return reply, []
+    tool_calls = []
+    for call in reply.get("tool_calls", []):
+        arguments = call.get("arguments", {})
+        tool_calls.append({
+            "id": call.get("id", f"call_{next(ids)}"),
+            "type": "function",
+            "function": {
+                "name": call["name"],
+                "arguments": arguments if isinstance(arguments, str) else json.dumps(arguments),
+            },
+        })
+    return reply.get("content") or "", tool_calls
+
+
+def _completion_payload(
+    body: Dict[str, Any],
+    completion_id: str,
+    content: str,
+    tool_calls: List[Dict[str, Any]],
+    usage: Dict[str, int],
+) -> Dict[str, Any]:
+    """A non-streamed chat.completion response."""
+    message: Dict[str, Any] = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["content"] = content or None
+        message["tool_calls"] = tool_calls
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if tool_calls else "stop",
+        }],
+        "usage": usage,
+    }
+
+
+def _file_object(file_id: str, stored: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(stored["content"]),
+        "created_at": stored["created_at"],
+        "filename": stored["filename"],
+        "purpose": stored["purpose"],
+        "status": "processed",
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, payload: Any) -> None:
+        line = payload if isinstance(payload, str) else json.dumps(payload)
+        data = f"data: {line}\n\n".encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_completion(
+        self,
+        body: Dict[str, Any],
+        completion_id: str,
+        content: str,
+        tool_calls: List[Dict[str, Any]],
+        usage: Dict[str, int],
+    ) -> None:
+        mock = self.server.mock
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        base = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+        }
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        try:
+            self._send_chunk(chunk({"role": "assistant", "content": ""}))
+            if content:
+                for piece in _split_tokens(content):
+                    if mock.token_delay:
+                        time.sleep(mock.token_delay)
+                    self._send_chunk(chunk({"content": piece}))
+            for index, call in enumerate(tool_calls):
+                self._send_chunk(chunk({"tool_calls": [{"index": index, **call}]}))
+            self._send_chunk(chunk({}, "tool_calls" if tool_calls else "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._send_chunk({**base, "choices": [], "usage": usage})
+            self._send_chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early.
+            self.close_connection = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length)
+        mock = self.server.mock
+        path = self.path.split("?")[0].rstrip("/")
+
+        if path.endswith("/files"):
+            self._upload_file(data)
+            return
+        if path.endswith("/batches"):
+            self._send_json(200, mock._create_batch(json.loads(data)))
+            return
+        if path.endswith("/cancel") and path.split("/")[-2] in mock.batches:
+            self._send_json(200, mock._cancel_batch(path.split("/")[-2]))
+            return
+        if not path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        body = json.loads(data or b"{}")
+        if not mock._admit(body):
+            self._send_json(mock.error_status, {"error": {
+                "message": "Rate limit exceeded (mock)",
+                "type": "rate_limit_error" if mock.error_status == 429 else "server_error",
+            }})
+            return
+        try:
+            self._complete(body)
+        finally:
+            mock._finish()
+
+    def _complete(self, body: Dict[str, Any]) -> None:
+        mock = self.server.mock
+        latency = mock.latency() if callable(mock.latency) else mock.latency
+        if latency:
+            time.sleep(latency)
+        try:
+            completion_id, content, tool_calls, usage = mock._reply(body)
+        except Exception as e:
+            self._send_json(500, {"error": {"message": f"Responder failed: {e}", "type": "server_error"}})
+            return
+        if body.get("stream"):
+            self._stream_completion(body, completion_id, content, tool_calls, usage)
+            return
+        self._send_json(200, _completion_payload(body, completion_id, content, tool_calls, usage))
+
+    def do_GET(self):
+        mock = self.server.mock
+        parts = self.path.split("?")[0].rstrip("/").split("/")
+        if len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content" and parts[-2] in mock.files:
+            data = mock.files[parts[-2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif len(parts) >= 2 and parts[-2] == "files" and parts[-1] in mock.files:
+            self._send_json(200, _file_object(parts[-1], mock.files[parts[-1]]))
+        elif len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in mock.batches:
+            self._send_json(200, mock.batches[parts[-1]])
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _upload_file(self, data: bytes) -> None:
+        """Handle the multipart upload of POST /files."""
+        message = BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + data
+        )
+        fields = {
+            part.get_param("name", header="content-disposition"): part
+            for part in message.iter_parts()
+        }
+        upload = fields["file"]
+        mock = self.server.mock
+        file_id = f"file-mock-{next(mock._ids)}"
+        mock.files[file_id] = {
+            "content": upload.get_payload(decode=True),
+            "filename": upload.get_filename() or "upload.jsonl",
+            "purpose": fields["purpose"].get_payload(decode=True).decode(),
+            "created_at": int(time.time()),
+        }
+        self._send_json(200, _file_object(file_id, mock.files[file_id]))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    mock: "MockLLMServer"
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading a stream early (llm_extract) reset the connection; that is not an error.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class MockLLMServer:
+    """Serve chat.completions on a local port in a background thread."""
+
+    def __init__(
+        self,
+        responder: Optional[Responder] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Union[float, Callable[[], float]] = 0.0,
+        token_delay: float = 0.0,
+        capacity: Optional[int] = None,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        keep_requests: bool = False,
+        batch_delay: float = 0.0,
+        prefix_cache_block: int = 0,
+    ):
+        """
+        Initialize the server.
+
+        Args:
+            responder (Callable, optional): Maps the request body to a Reply: the text, or a dict with
+                "content" and "tool_calls". Defaults to an echo; see ScriptedResponder.
+            host (str, optional): Interface to bind.
+            port (int, optional): Port to bind. Defaults to a free port.
+            latency (float or Callable[[], float], optional): Seconds to wait before responding, or a
+                sampler called per request (e.g. long_tail_latency).
+            token_delay (float, optional): Seconds to wait before each streamed token.
+            capacity (int, optional): Concurrent requests served; requests beyond it get `error_status`.
+            error_rate (float, optional): Fraction of requests randomly rejected with `error_status`.
+            error_status (int, optional): HTTP status of injected errors. Defaults to 429.
+            keep_requests (bool, optional): Keep every request body in `requests` for inspection.
+            batch_delay (float, optional): Seconds a batch stays queued before it is processed.
+            prefix_cache_block (int, optional): Simulate provider prompt caching: report as
+                `prompt_tokens_details.cached_tokens` the longest prefix of the messages seen in an earlier
+                request, in whole blocks of this many tokens. 0 disables it.
+        """
+        self.responder = responder or echo_responder
+        self.latency = latency
+        self.token_delay = token_delay
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.keep_requests = keep_requests
+        self.requests: List[Dict[str, Any]] = []
+        self.batch_delay = batch_delay
+        self.prefix_cache_block = prefix_cache_block
+        self._prefixes: set = set()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.request_count = 0
+        self.rejected_count = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.mock = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _admit(self, body: Dict[str, Any]) -> bool:
+        """Count the request and decide whether to serve it or inject an error."""
+        with self._lock:
+            self.request_count += 1
+            if self.keep_requests:
+                self.requests.append(body)
+            over_capacity = self.capacity is not None and self.in_flight >= self.capacity
+            if over_capacity or (self.error_rate and random.random() < self.error_rate):
+                self.rejected_count += 1
+                return False
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def _finish(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _reply(self, body: Dict[str, Any]) -> Tuple[str, str, List[Dict[str, Any]], Dict[str, int]]:
+        """Run the responder: (completion id, content, tool calls, usage)."""
+        content, tool_calls = _normalize_reply(self.responder(body), self._ids)
+        prompt_tokens = sum(_count_tokens(str(m.get("content") or "")) for m in body.get("messages", []))
+        completion_tokens = _count_tokens(content) + sum(
+            _count_tokens(call["function"]["arguments"]) for call in tool_calls
+        )
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if self.prefix_cache_block:
+            usage["prompt_tokens_details"] = {"cached_tokens": self._cached_prefix(body.get("messages", []))}
+        return f"chatcmpl-mock-{next(self._ids)}", content, tool_calls, usage
+
+    def _cached_prefix(self, messages: List[Dict[str, Any]]) -> int:
+        """Prompt tokens in the leading blocks an earlier request already sent; this request's blocks are remembered."""
+        # Where each message starts is part of the prefix, so it is marked by a (role,) token that is not counted.
+        tokens = [token for m in messages for token in ((m.get("role"),), *str(m.get("content") or "").split())]
+        block_size, cached, key, hit = self.prefix_cache_block, 0, None, True
+        with self._lock:
+            for start in range(0, len(tokens) - block_size + 1, block_size):
+                block = tuple(tokens[start:start + block_size])
+                key = hash((key, block))
+                hit = hit and key in self._prefixes
+                if hit:
+                    cached += sum(1 for token in block if isinstance(token, str))
+                self._prefixes.add(key)
+        return cached
+
+    def _create_batch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a batch over an uploaded JSONL file and process it in the background."""
+        batch_id = f"batch_mock_{next(self._ids)}"
+        batch = self.batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window", "24h"),
+            "metadata": request.get("metadata"),
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        threading.Thread(target=self._run_batch, args=(batch_id,), daemon=True).start()
+        return dict(batch)
+
+    def _cancel_batch(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.batches[batch_id]
+        if batch["status"] in ("validating", "in_progress"):
+            batch["status"] = "cancelling"
+        return dict(batch)
+
+    def _store_file(self, lines: List[Dict[str, Any]], filename: str) -> Optional[str]:
+        if not lines:
+            return None
+        file_id = f"file-mock-{next(self._ids)}"
+        self.files[file_id] = {
+            "content": "".join(json.dumps(line) + "\n" for line in lines).encode(),
+            "filename": filename,
+            "purpose": "batch_output",
+            "created_at": int(time.time()),
+        }
+        return file_id
+
+    def _run_batch(self, batch_id: str) -> None:
+        """Answer every line of the batch input; failures go to the error file."""
+        batch = self.batches[batch_id]
+        time.sleep(self.batch_delay)
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]]["content"].splitlines() if line.strip()]
+        batch["request_counts"]["total"] = len(lines)
+        if batch["status"] == "validating":
+            batch.update(status="in_progress", in_progress_at=int(time.time()))
+
+        outputs: List[Dict[str, Any]] = []
+        errors: List[Dict[str, Any]] = []
+        for line in lines:
+            if batch["status"] == "cancelling":
+                break
+            record = {"id": f"batch_req_{next(self._ids)}", "custom_id": line["custom_id"], "error": None}
+            if not self._admit(line["body"]):
+                record["response"] = {"status_code": self.error_status, "body": {"error": {"message": "Rate limit exceeded (mock)"}}}
+                errors.append(record)
+                batch["request_counts"]["failed"] += 1
+                continue
+            try:
+                completion_id, content, tool_calls, usage = self._reply(line["body"])
+            finally:
+                self._finish()
+            record["response"] = {
+                "status_code": 200,
+                "request_id": completion_id,
+                "body": _completion_payload(line["body"], completion_id, content, tool_calls, usage),
+            }
+            outputs.append(record)
+            batch["request_counts"]["completed"] += 1
+
+        now = int(time.time())
+        batch.update(
+            output_file_id=self._store_file(outputs, f"{batch_id}_output.jsonl"),
+            error_file_id=self._store_file(errors, f"{batch_id}_error.jsonl"),
+        )
+        if batch["status"] == "cancelling":
+            batch.update(status="cancelled", cancelled_at=now)
+        else:
+            batch.update(status="completed", completed_at=now)
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the mock LLM server.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds before each streamed token")
+    parser.add_argument("--capacity", type=int, default=None, help="concurrent requests served before rejecting")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests rejected")
+    parser.add_argument("--error-status", type=int, default=429)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        port=args.port,
+        latency=args.latency,
+        token_delay=args.token_delay,
+        capacity=args.capacity,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    print(f"Mock LLM server listening on {server.base_url}")
+    server._httpd.serve_forever()
@@ -0,0 +1,39 @@
+from llm import llm_call, get_client
+from mock_llm_server import MockLLMServer, ScriptedResponder
+import json
+
+def test_scripted_rules_and_replies():
+    script = ScriptedResponder(
+        rules=[(r"^weather", "sunny"), (r"^upper", lambda body: body["messages"][-1]["content"].upper())],
+        replies=["first", "second"],
+    )
+    with MockLLMServer(responder=script) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        assert llm_call("weather today?", client=client) == "sunny"
+        assert llm_call("upper case", client=client) == "UPPER CASE"
+        assert [llm_call("next", client=client) for _ in range(3)] == ["first", "second", "echo: next"]
+
+def test_tool_calls():
+    reply = {"content": "", "tool_calls": [{"name": "calculator", "arguments": {"expression": "1+1"}}]}
+    with MockLLMServer(responder=ScriptedResponder(rules=[("add", reply)])) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        completion = client.chat.completions.create(model="mock", messages=[{"role": "user", "content": "add 1 and 1"}])
+        choice = completion.choices[0]
+        assert choice.finish_reason == "tool_calls"
+        assert choice.message.tool_calls[0].function.name == "calculator"
+        assert json.loads(choice.message.tool_calls[0].function.arguments) == {"expression": "1+1"}
+
+        stream = client.chat.completions.create(
+            model="mock", messages=[{"role": "user", "content": "add 1 and 1"}], stream=True
+        )
+        calls = [call for chunk in stream if chunk.choices for call in (chunk.choices[0].delta.tool_calls or [])]
+        assert [call.function.name for call in calls] == ["calculator"]
+
+def test_keep_requests():
+    with MockLLMServer(keep_requests=True) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        llm_call("hello", system_prompt="be brief", client=client)
+        assert server.requests[0]["messages"] == [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "content": "hello"},
+        ]
@@ -1,99 +1,500 @@
 # In this workflow, a central LLM dynamically breaks down tasks, delegates them to worker LLMs, and synthesizes their results.
-from typing import Dict, List, Optional
-from llm import llm_call, extract_xml
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import time
+import re
+from openai import APITimeoutError
+from llm import llm_call, llm_stream, print_stream, extract_xml
+from prompt_template import compile_template
+from retry import DeadlineExceeded
+from tag_parser import extract_tags
+from telemetry import span
 
-def parse_tasks(tasks_str: str) -> List[Dict[str, str]]:
+# Opening, closing or self-closing task and field tags; no other tag changes what the parser does.
+_TAG = re.compile(r"<(?P<closing>/?)\s*(?P<name>task|type|description|id|depends[_-]on)(?![\w.-])"
+                  r"(?P<attributes>[^<>]*?)(?P<empty>/?)\s*>", re.IGNORECASE)
+_ATTRIBUTE = re.compile(r"""([A-Za-z_][\w.-]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>/]+))""")
+_TASK_FIELDS = ("type", "description", "id", "depends_on")
+_ID_SEPARATOR = re.compile(r"[,;\s]+")
+_TASKS_OPEN = re.compile(r"<tasks\b[^<>]*>", re.IGNORECASE)
+_TASKS_CLOSE = re.compile(r"</tasks\s*>", re.IGNORECASE)
+_TASK_CLOSE = re.compile(r"</task\s*>", re.IGNORECASE)
+
+
+def _starts_line(text: str, pos: int) -> bool:
+    # Only the indentation before the tag is scanned, so every character is looked at once at most.
+    while pos > 0 and text[pos - 1] in " \t":
+        pos -= 1
+    return pos == 0 or text[pos - 1] == "\n"
+
+
+def _task_attributes(attributes: str) -> Dict[str, str]:
+    found = {}
+    for name, double, single, bare in _ATTRIBUTE.findall(attributes):
+        name = name.lower().replace("-", "_")
+        if name in _TASK_FIELDS:
+            found[name] = double or single or bare
+    return found
+
+
+def _finish_task(fields: Dict[str, str], tasks: List[Dict[str, Any]], ids: Set[str]) -> None:
+    description = fields.get("description", "").strip()
+    if not description:
+        return
+    type_, task_id, depends_on = fields.get("type"), fields.get("id"), fields.get("depends_on")
+    task_id = " ".join(task_id.split()) if task_id else ""  # Left empty for _number_tasks.
+    if task_id:
+        ids.add(task_id)
+    tasks.append({
+        "type": " ".join(type_.split()) or "default" if type_ else "default",
+        "description": description,
+        "id": task_id,
+        "depends_on": [d for d in _ID_SEPARATOR.split(depends_on) if d] if depends_on else [],
+    })
+
+
+def _number_tasks(tasks: List[Dict[str, Any]], ids: Set[str]) -> None:
+    # Only once every explicit id in the plan is known: a later task may claim any number.
+    for position, task in enumerate(tasks, 1):
+        if not task["id"]:
+            number = position
+            while str(number) in ids:
+                number += 1
+            task["id"] = str(number)
+            ids.add(task["id"])
+
+
+def tasks_section(response: str) -> str:
+    """The content of the `<tasks>` section: up to the end if it was cut off, the whole response if it has none."""
+    opening = _TASKS_OPEN.search(response)
+    if opening is None:
+        return response
+    closing = _TASKS_CLOSE.search(response, opening.end())
+    return response[opening.end():closing.start() if closing else len(response)]
+
+
+def parse_tasks(tasks_str: str) -> List[Dict[str, Any]]:
     """
-    Parse the tasks string into a list of task dictionaries.
+    Parse the tasks string into a list of task dictionaries in one pass over its tags.
+
+    A task may declare an `<id>` and the ids it needs in `<depends_on>` (comma- or space-separated); tasks
+    without an id are numbered by position from "1", skipping the ids other tasks declare. Fields may also
+    be given as attributes of `<task>`, span several lines or sit on one line, and tag names are
+    case-insensitive. Malformed output is
+    tolerated: a `<task>` or field tag at the start of a line closes a task or field left open, tags inside
+    a field's content are kept as text, and a task cut off at the end counts if its description is complete.
+    Tasks without a description are dropped.
     Args:
         tasks_str (str): The tasks string to parse.
     Returns:
-        List[Dict[str, str]]: A list of task dictionaries.
+        List[Dict[str, Any]]: A list of task dictionaries with type, description, id and depends_on.
     """
-    tasks = []
-    current_task = {}
-
-    for line in tasks_str.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-
-        if line.startswith('<task>'):
-            current_task = {}
-        elif line.startswith('<type>'):
-            current_task["type"] = line[6:-7].strip()
-        elif line.startswith("<description>"):
-            current_task["description"] = line[12:-13].strip()
-        elif line.startswith("</task>"):
-            if "description" in current_task:
-                if "type" not in current_task:
-                    current_task["type"] = "default"
-                tasks.append(current_task)
+    ids: Set[str] = set()
+    tasks = _parse_tasks(tasks_str, [], ids)
+    _number_tasks(tasks, ids)
+    return tasks
+
+
+def _parse_tasks(tasks_str: str, tasks: List[Dict[str, Any]], ids: Set[str]) -> List[Dict[str, Any]]:
+    # Appends the tasks found to tasks, adding their ids to ids; tasks without an id get an empty one.
+    task: Optional[Dict[str, str]] = None  # Fields of the open <task>.
+    field: Optional[Tuple[str, int]] = None  # Name and content start of the open field.
+
+    for match in _TAG.finditer(tasks_str):
+        closing, name, attributes, empty = match.groups()
+        name = name.lower().replace("-", "_")
+        if field is not None:
+            # A description may quote task and field tags, unless one starts a line; the short fields never
+            # hold markup, so a task or field tag in them means their closing tag is missing.
+            if not (closing and (name == field[0] or name == "task")):
+                if closing or (field[0] == "description" and not _starts_line(tasks_str, match.start())):
+                    continue
+            task[field[0]] = tasks_str[field[1]:match.start()]
+            field = None
+            if closing and name != "task":
+                continue
 
+        if name == "task":
+            if task is not None:
+                _finish_task(task, tasks, ids)
+                task = None
+            if not closing:
+                task = _task_attributes(attributes) if attributes.strip() else {}
+                if empty:
+                    _finish_task(task, tasks, ids)
+                    task = None
+        elif task is not None and not closing:
+            if empty:
+                task[name] = ""
+            else:
+                field = (name, match.end())
+
+    # Cut off at the end: a field still open may be truncated, so only complete fields count.
+    if task is not None:
+        _finish_task(task, tasks, ids)
     return tasks
 
 
+def check_dependencies(tasks: List[Dict[str, Any]]) -> None:
+    """
+    Check that task ids are unique and that the dependencies form a DAG.
+
+    Raises:
+        ValueError: A duplicate id, a dependency on an unknown id, or a cycle (named in the message).
+    """
+    ids = [t["id"] for t in tasks]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate task ids: {', '.join(duplicates)}")
+    by_id = {t["id"]: t for t in tasks}
+    for t in tasks:
+        unknown = [d for d in t.get("depends_on", []) if d not in by_id]
+        if unknown:
+            raise ValueError(f"Task {t['id']} depends on unknown tasks: {', '.join(unknown)}")
+
+    # Depth-first search; reaching a task that is still on the stack closes a cycle.
+    state: Dict[str, str] = {}
+    stack: List[str] = []
+
+    def visit(task_id: str) -> None:
+        state[task_id] = "visiting"
+        stack.append(task_id)
+        for dep in by_id[task_id].get("depends_on", []):
+            if state.get(dep) == "visiting":
+                cycle = stack[stack.index(dep):] + [dep]
+                raise ValueError(f"Dependency cycle: {' -> '.join(cycle)}")
+            if dep not in state:
+                visit(dep)
+        stack.pop()
+        state[task_id] = "done"
+
+    for task_id in ids:
+        if task_id not in state:
+            visit(task_id)
+
+
+def critical_path(tasks: List[Dict[str, Any]], durations: Dict[str, float]) -> Tuple[float, List[str]]:
+    """
+    Longest chain of dependent tasks by duration: the time the DAG takes with unlimited workers.
+
+    Args:
+        tasks (List[Dict[str, Any]]): Tasks in an order where dependencies may come later (any order).
+        durations (Dict[str, float]): Seconds each task took, by id.
+    Returns:
+        Tuple[float, List[str]]: The total seconds and the task ids along the path.
+    """
+    by_id = {t["id"]: t for t in tasks}
+    finish: Dict[str, Tuple[float, List[str]]] = {}
+
+    def longest(task_id: str) -> Tuple[float, List[str]]:
+        if task_id not in finish:
+            upstream = max((longest(d) for d in by_id[task_id].get("depends_on", [])), default=(0.0, []))
+            finish[task_id] = (upstream[0] + durations.get(task_id, 0.0), upstream[1] + [task_id])
+        return finish[task_id]
+
+    return max((longest(t["id"]) for t in tasks), default=(0.0, []))
+
+
+# Worker prompt fields that differ between the subtasks of one task.
+WORKER_FIELDS = ("task_type", "task_description", "upstream")
+
+# Worker threads when the number of subtasks is not known up front, i.e. while the plan streams.
+MAX_WORKERS = 32
+
+
+class TaskStreamParser:
+    """
+    Incrementally parse the `<task>` blocks of a streamed orchestrator response.
+
+    Each task with an id is returned as soon as its `</task>` arrives, parsed as parse_tasks would parse
+    it; tasks without one are held until close, when the ids their numbers must skip are all known. A
+    `</task>` closes any field or task left open, so only the text since the previous one is parsed: each
+    character is parsed once and scanned for tags a bounded number of times, however long the plan.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self.tasks: List[Dict[str, Any]] = []
+        self._ids: Set[str] = set()
+        self._pending = ""  # Response text not parsed yet: all of it until <tasks>, then since the last </task>.
+        self._in_section = False
+        self._section_closed = False
+        self._search_from = 0  # Offset in _pending before which no tag of interest starts.
+
+    @property
+    def text(self) -> str:
+        """The response received so far."""
+        if len(self._chunks) > 1:
+            self._chunks[:] = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def _skip_scanned(self) -> None:
+        # Resume at the last "<", which may begin a tag split across chunks.
+        last = self._pending.rfind("<", self._search_from)
+        self._search_from = last if last >= 0 else len(self._pending)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Consume the next chunk of the response.
+
+        Args:
+            chunk (str): The next text delta.
+        Returns:
+            List[Dict[str, Any]]: The tasks completed by this chunk.
+        """
+        self._chunks.append(chunk)
+        if self._section_closed:
+            return []
+        self._pending += chunk
+        if not self._in_section:
+            opening = _TASKS_OPEN.search(self._pending, self._search_from)
+            if opening is None:
+                self._skip_scanned()
+                return []
+            self._in_section = True
+            self._pending, self._search_from = self._pending[opening.end():], 0
+
+        section_end = _TASKS_CLOSE.search(self._pending, self._search_from)
+        if section_end is not None:
+            self._section_closed = True
+            self._pending = self._pending[:section_end.start()]
+        closing = None
+        for closing in _TASK_CLOSE.finditer(self._pending, self._search_from):
+            pass
+        if closing is None:
+            self._skip_scanned()
+            return []
+        done = len(self.tasks)
+        _parse_tasks(self._pending[:closing.end()], self.tasks, self._ids)
+        self._pending, self._search_from = self._pending[closing.end():], 0
+        self._skip_scanned()
+        return [t for t in self.tasks[done:] if t["id"]]
+
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        End of stream: number the tasks without an id and return the tasks not returned yet, e.g. a last
+        one cut off before its `</task>`.
+        """
+        done = len(self.tasks)
+        # Without a <tasks> section the whole response is parsed, as parse_tasks(tasks_section(...)) does.
+        _parse_tasks(self._pending, self.tasks, self._ids)
+        self._pending, self._search_from = "", 0
+        new = [t for t in self.tasks[:done] if not t["id"]] + self.tasks[done:]
+        _number_tasks(self.tasks, self._ids)
+        return new
+
+
 class FlexibleOrchestrator:
     """Break down tasks and run them in parallel using worker LLMs."""
     def __init__(self, 
         orchestrator_prompt: str,
-        worker_prompt: str
+        worker_prompt: str,
+        stream: bool = False,
+        n_workers: Optional[int] = None,
+        worker_timeout: Optional[float] = None,
+        stream_tasks: bool = True,
+        prefix_layout: bool = False,
+        **llm_kwargs: Any
     ):
-        """Initialize with prompt templates."""
+        """
+        Initialize with prompt templates.
+        Subtasks run as soon as the subtasks they depend on are done. The worker prompt receives their
+        results as {upstream}; a template without that field gets them appended.
+        stream prints the orchestrator and worker outputs as they are generated; workers then run one at
+        a time so their output does not interleave. Otherwise up to n_workers workers run concurrently
+        (default: all subtasks at once, still subject to the shared rate limiter).
+        worker_timeout is the deadline in seconds of each worker call; a worker that misses it gets an
+        empty result and an "error" entry instead of failing the whole task.
+        stream_tasks streams the plan and starts each subtask as soon as its `</task>` arrives, so the
+        workers overlap with the rest of the plan. It is ignored with stream, whose output would interleave,
+        and when llm_kwargs set hedge or coalesce, which streamed calls do not support: the plan is then
+        requested in one call as without stream_tasks, so those options still apply to it.
+        prefix_layout moves the per-subtask fields of the worker prompt after its static text (see
+        PromptTemplate.layout), so the workers' prompts share a prefix the provider can cache.
+        llm_kwargs are passed to every llm_call (e.g. cache).
+        """
         self.orchestrator_prompt = orchestrator_prompt
         self.worker_prompt = worker_prompt
+        self.stream = stream
+        self.n_workers = n_workers
+        self.worker_timeout = worker_timeout
+        self.stream_tasks = stream_tasks
+        self.prefix_layout = prefix_layout
+        self.llm_kwargs = llm_kwargs
     
-    def _format_prompt(self, template: str, **kwargs) -> str:
-        """Format a prompt template with variables."""
+    def _format_prompt(self, template: str, layout_fields: Optional[Tuple[str, ...]] = None, **kwargs) -> str:
+        """Format a prompt template with variables; with prefix_layout, layout_fields are moved to the end."""
         try:
-            return template.format(**kwargs)
+            compiled = compile_template(template, layout_fields)
+            if layout_fields is not None and self.prefix_layout:
+                return compiled.layout(**kwargs)
+            return compiled.format(**kwargs)
         except KeyError as e:
             raise ValueError(f"Missing required prompt variable: {e}")
 
+    def _call(self, prompt: str, title: str, **overrides: Any) -> str:
+        """Run one LLM call, streaming it to stdout when enabled."""
+        llm_kwargs = {**self.llm_kwargs, **overrides}
+        if not self.stream:
+            return llm_call(prompt, **llm_kwargs)
+        print(f"\n=== {title} (streaming) ===")
+        return print_stream(llm_stream(prompt, **llm_kwargs))
+
+    def _worker_input(self, task: str, task_info: Dict[str, Any], upstream: str, context: Dict[str, str]) -> str:
+        worker_input = self._format_prompt(
+            self.worker_prompt,
+            WORKER_FIELDS,
+            original_task=task,
+            task_type=task_info["type"],
+            task_description=task_info["description"],
+            upstream=upstream,
+            **context
+        )
+        if upstream and "upstream" not in compile_template(self.worker_prompt, WORKER_FIELDS).fields:
+            worker_input += f"\n\nResults of the subtasks this one builds on:\n{upstream}"
+        return worker_input
+
+    def _run_worker(self, task: str, task_info: Dict[str, Any], index: int, context: Dict[str, str],
+                    upstream: str = "") -> Dict[str, Any]:
+        """Run one subtask and return its worker result."""
+        worker_input = self._worker_input(task, task_info, upstream, context)
+        overrides = {"deadline": self.worker_timeout} if self.worker_timeout is not None else {}
+        worker_result = {"id": task_info["id"], "type": task_info["type"], "description": task_info["description"]}
+        with span("orchestrator.worker", task_type=task_info["type"], index=index, task_id=task_info["id"]):
+            try:
+                worker_response = self._call(worker_input, f"WORKER ({task_info['type']})", **overrides)
+            except (DeadlineExceeded, APITimeoutError) as e:
+                worker_result.update(result="", error=f"timed out after {self.worker_timeout}s: {e}")
+                return worker_result
+        worker_result["result"] = extract_xml(worker_response, "response")
+        return worker_result
+
+    def _stream_plan(self, prompt: str, parser: TaskStreamParser) -> Iterator[List[Dict[str, Any]]]:
+        """Stream the orchestrator response, yielding the tasks completed by each delta (often none)."""
+        with span("orchestrator.plan"):
+            deltas = llm_stream(prompt, **self.llm_kwargs)
+            try:
+                for delta in deltas:
+                    yield parser.feed(delta)
+            finally:
+                deltas.close()
+            yield parser.close()
+
+    def _run_tasks(self, task: str, plan: Iterable[List[Dict[str, Any]]], context: Dict[str, str],
+                   n_workers: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, float]]:
+        """
+        Run every subtask whose dependencies are done in parallel, starting while the plan is still arriving.
+
+        Returns:
+            Tuple: The tasks, their results in task order and their durations by id.
+        """
+        tasks: List[Dict[str, Any]] = []
+        index: Dict[str, int] = {}
+        waiting: Dict[str, set] = {}
+        results: Dict[str, Dict[str, Any]] = {}
+        durations: Dict[str, float] = {}
+        running: Dict[Future, str] = {}
+        # Workers started while the plan streams belong to the orchestrator span, not to the plan's.
+        parent = copy_context()
+
+        def run(task_info: Dict[str, Any], upstream: str) -> Dict[str, Any]:
+            start = time.perf_counter()
+            try:
+                return self._run_worker(task, task_info, index[task_info["id"]], context, upstream)
+            finally:
+                durations[task_info["id"]] = time.perf_counter() - start
+
+        def collect(timeout: Optional[float]) -> None:
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+        def submit_ready() -> None:
+            # Skipping a task can make its dependents ready, so repeat until nothing changes.
+            while ready := [i for i, deps in waiting.items() if deps <= results.keys()]:
+                for task_id in ready:
+                    task_info = tasks[index[task_id]]
+                    del waiting[task_id]
+                    failed = [d for d in task_info["depends_on"] if "error" in results[d]]
+                    if failed:
+                        results[task_id] = {key: task_info[key] for key in ("id", "type", "description")}
+                        results[task_id].update(result="", error=f"skipped: depends on failed tasks {', '.join(failed)}")
+                        continue
+                    upstream = "\n".join(f'<result id="{d}">\n{results[d]["result"]}\n</result>'
+                                         for d in task_info["depends_on"])
+                    running[executor.submit(parent.copy().run, run, task_info, upstream)] = task_id
+
+        with ThreadPoolExecutor(max_workers=max(1, n_workers)) as executor:
+            for batch in plan:
+                for task_info in batch:
+                    if task_info["id"] in index:
+                        raise ValueError(f"Duplicate task ids: {task_info['id']}")
+                    index[task_info["id"]] = len(tasks)
+                    tasks.append(task_info)
+                    waiting[task_info["id"]] = set(task_info["depends_on"])
+                if running:
+                    collect(timeout=0)
+                submit_ready()
+            # Dependencies on unknown ids and cycles only show once the whole plan is in.
+            check_dependencies(tasks)
+            while waiting or running:
+                submit_ready()
+                if running:
+                    collect(timeout=None)
+        return tasks, [results[t["id"]] for t in tasks], durations
+
+    def _plan_needs_call(self) -> bool:
+        # llm_stream accepts hedge and coalesce but neither hedges nor coalesces.
+        return self.llm_kwargs.get("hedge") is not None or bool(self.llm_kwargs.get("coalesce"))
+
     def process(self, task: str, context: Optional[Dict[str, str]] = None) -> Dict[str, str]:
-        """Process task by breaking it down and running subtasks in parallel."""
+        """
+        Process task by breaking it down and running subtasks in parallel.
+
+        Returns:
+            Dict[str, str]: The analysis and one worker result per subtask, in task order. A worker that
+                timed out has an empty result and an "error" entry; tasks depending on it are skipped with one.
+
+        Raises:
+            ValueError: The subtasks have duplicate ids, unknown dependencies or a dependency cycle.
+        """
 
         context = context or {}
 
-        # Step 1: Break down the task
-        orchestrator_input = self._format_prompt(
-            self.orchestrator_prompt,
-            task=task,
-            **context
-        )
-        orchestrator_response = llm_call(orchestrator_input)
-
-        # Parse the response to extract tasks
-        analysis = extract_xml(orchestrator_response, "analysis")
-        tasks_xml = extract_xml(orchestrator_response, "tasks")
-        tasks = parse_tasks(tasks_xml)
-
-        print("\n=== ORCHESTRATOR OUTPUT ===")
-        print(f"\nANALYSIS:\n{analysis}")
-        print(f"\nTASKS:\n{tasks}")
-
-        # Step 2: Process each task
-        worker_results = []
-        for task_info in tasks:
-            worker_input = self._format_prompt(
-                self.worker_prompt,
-                original_task=task,
-                task_type=task_info["type"],
-                task_description=task_info["description"],
+        with span("orchestrator") as record:
+            orchestrator_input = self._format_prompt(
+                self.orchestrator_prompt,
+                task=task,
                 **context
             )
-            worker_response = llm_call(worker_input)
-            result = extract_xml(worker_response, "response")
+            # Break down the task and process the subtasks, each as soon as it is planned and its
+            # dependencies are done; results stay in task order
+            if self.stream_tasks and not self.stream and not self._plan_needs_call():
+                parser = TaskStreamParser()
+                plan = self._stream_plan(orchestrator_input, parser)
+                try:
+                    tasks, worker_results, durations = self._run_tasks(task, plan, context, self.n_workers or MAX_WORKERS)
+                finally:
+                    plan.close()
+                orchestrator_response = parser.text
+            else:
+                with span("orchestrator.plan"):
+                    orchestrator_response = self._call(orchestrator_input, "ORCHESTRATOR")
+                tasks = parse_tasks(tasks_section(orchestrator_response))
+                n_workers = 1 if self.stream else self.n_workers or len(tasks)
+                tasks, worker_results, durations = self._run_tasks(task, [tasks], context, n_workers)
+            record.attributes["critical_path_seconds"], record.attributes["critical_path"] = critical_path(tasks, durations)
 
-            worker_results.append({
-                "type": task_info["type"],
-                "description": task_info["description"],
-                "result": result
-            })
+            analysis = extract_tags(orchestrator_response, ["analysis"])["analysis"]
+            print("\n=== ORCHESTRATOR OUTPUT ===")
+            print(f"\nANALYSIS:\n{analysis}")
+            print(f"\nTASKS:\n{tasks}")
 
-            print(f"\n=== WORKER RESULT ({task_info['type']}) ===\n{result}\n")
+            for worker_result in worker_results:
+                print(f"\n=== WORKER RESULT ({worker_result['type']}) ===\n{worker_result['result']}\n")
 
-        return {
-            "analysis": analysis,
-            "worker_results": worker_results,
-        }
\ No newline at end of file
+            return {
+                "analysis": analysis,
+                "worker_results": worker_results,
+            }
\ No newline at end of file
@@ -0,0 +1,193 @@
+from orchestrator_workers_workflow import TaskStreamParser, check_dependencies, parse_tasks, tasks_section
+import random
+import string
+import time
+
+def test_description_is_not_clipped():
+    tasks = parse_tasks("<task>\n<type>formal</type>\n<description>Write a precise version</description>\n</task>")
+    assert tasks == [{"type": "formal", "description": "Write a precise version", "id": "1", "depends_on": []}]
+
+def test_multi_line_and_one_line_tasks():
+    text = """
+    <tasks>
+        <task><type>formal</type><description>Precise
+        and technical</description></task>
+        <task>
+            <type>
+                casual
+            </type>
+            <description>
+                Friendly, with a list:
+                - one
+                - two
+            </description>
+        </task>
+    </tasks>
+    """
+    tasks = parse_tasks(text)
+    assert [t["type"] for t in tasks] == ["formal", "casual"]
+    assert tasks[0]["description"] == "Precise\n        and technical"
+    assert tasks[1]["description"].startswith("Friendly, with a list:\n") and tasks[1]["description"].endswith("- two")
+
+def test_attributes_and_case():
+    text = """
+    <TASK id="outline" type='plan'><Description>Outline it</Description></TASK>
+    <task id=body depends-on="outline"><description>Write it</description></task>
+    <task type="review" description="Check it" depends_on="outline, body"/>
+    <task id="ignored"><id>summary</id><depends_on>body;outline</depends_on><description>Sum up</description></task>
+    """
+    tasks = parse_tasks(text)
+    assert [(t["id"], t["type"], t["depends_on"]) for t in tasks] == [
+        ("outline", "plan", []),
+        ("body", "default", ["outline"]),
+        ("3", "review", ["outline", "body"]),
+        ("summary", "default", ["body", "outline"]),
+    ]
+
+def test_default_ids_skip_ids_in_use():
+    task = lambda attributes, description: f"<task{attributes}><description>{description}</description></task>"
+    assert [t["id"] for t in parse_tasks(task(' id="2"', "a") + task("", "b"))] == ["2", "3"]
+    assert [t["id"] for t in parse_tasks(task(' id="2"', "a") + task(' id="3"', "b") + task("", "c"))] == ["2", "3", "4"]
+    tasks = parse_tasks(task("", "a") + task(' id="2"', "b") + task(' depends_on="2"', "c") + task("", "d"))
+    assert [t["id"] for t in tasks] == ["1", "2", "3", "4"]
+    check_dependencies(tasks)
+    # A later task may claim the number an id-less task would have had.
+    tasks = parse_tasks("<tasks>" + task("", "a") + task(' id="1"', "b") + task("", "c") + "</tasks>")
+    assert [t["id"] for t in tasks] == ["2", "1", "3"]
+    check_dependencies(tasks)
+
+def test_stream_parser_holds_tasks_without_id():
+    text = "<tasks><task><description>a</description></task><task><id>1</id><description>b</description></task></tasks>"
+    parser = TaskStreamParser()
+    assert [t["description"] for t in parser.feed(text)] == ["b"]
+    assert [(t["id"], t["description"]) for t in parser.close()] == [("2", "a")]
+    assert parser.tasks == parse_tasks(tasks_section(text))
+
+def test_markup_inside_description_is_content():
+    text = "<task><description>Use <b>bold</b>, List<int> and a </type> tag; mention <task> inline</description></task>"
+    assert parse_tasks(text)[0]["description"] == "Use <b>bold</b>, List<int> and a </type> tag; mention <task> inline"
+
+def test_malformed_output():
+    text = """
+    Sure! Here are the tasks:
+    <task>
+    <type>formal
+    <description>Missing the closing type tag
+    <task>
+    <description>Missing the closing task tag</description>
+    <task><type>no description</type></task>
+    <task><description>   </description></task>
+    </tasks>
+    <task><type>cut</type><description>Complete description</description><depends_on>1
+    """
+    tasks = parse_tasks(text)
+    assert [(t["type"], t["description"]) for t in tasks] == [
+        ("formal", "Missing the closing type tag"),
+        ("default", "Missing the closing task tag"),
+        ("cut", "Complete description"),
+    ]
+    # A field cut off at the end may be truncated, so it is dropped.
+    assert tasks[-1]["depends_on"] == []
+    assert parse_tasks("<task><description>cut off mid-sen") == []
+    assert parse_tasks("") == parse_tasks("no tags at all") == []
+
+def test_tasks_section():
+    assert tasks_section("<analysis>a <task> in prose</analysis><tasks>\n<task/></tasks> after") == "\n<task/>"
+    assert tasks_section("<Tasks kind='plan'>cut") == "cut"
+    assert tasks_section("<task>bare</task>") == "<task>bare</task>"
+
+def _random_words(rng, n):
+    return " ".join("".join(rng.choices(string.ascii_letters + "&;.,!?()'\"", k=rng.randint(1, 8))) for _ in range(n))
+
+def _render(rng, task):
+    """One task in a random but well-formed layout the parser should read back exactly."""
+    def tag(name):
+        name = rng.choice([name, name.upper(), name.title()]) if name != "depends_on" else rng.choice(["depends_on", "depends-on"])
+        return name
+
+    fields = [("type", task["type"]), ("description", task["description"]), ("id", task["id"]),
+              ("depends_on", rng.choice([", ", ",", " ", "; "]).join(task["depends_on"]))]
+    rng.shuffle(fields)
+    as_attributes = {name for name, value in fields if name != "description" and rng.random() < 0.3}
+    nl = lambda: rng.choice(["", "\n", "\n    ", " ", "\t"])
+    quote = rng.choice(['"', "'"])
+    attributes = "".join(f" {tag(name)}={quote}{value}{quote}" for name, value in fields if name in as_attributes)
+    children = "".join(f"{nl()}<{tag(name)}>{nl()}{value}{nl()}</{tag(name)}>" for name, value in fields
+                       if name not in as_attributes)
+    return f"<{tag('task')}{attributes}>{children}{nl()}</{tag('task')}>"
+
+def test_fuzz_round_trip():
+    rng = random.Random(0)
+    for _ in range(300):
+        tasks = []
+        for i in range(rng.randint(0, 8)):
+            description = _random_words(rng, rng.randint(1, 30))
+            if rng.random() < 0.3:
+                description += "\nwith <b>markup</b> and a\nsecond line"
+            tasks.append({
+                "type": f"type{rng.randint(0, 3)}",
+                "description": description.strip(),
+                "id": f"t{i}",
+                "depends_on": [f"t{j}" for j in range(i) if rng.random() < 0.3],
+            })
+        noise = lambda: rng.choice(["", "\n", "Here is the next one:\n", "<note>ignore me</note>\n", "</type>"])
+        text = "<tasks>" + "".join(noise() + _render(rng, t) + noise() for t in tasks) + "</tasks>"
+        assert parse_tasks(text) == tasks, text
+
+def test_fuzz_mangled_output_never_raises():
+    rng = random.Random(1)
+    base = "".join(_render(rng, {"type": "t", "description": _random_words(rng, 10), "id": f"t{i}", "depends_on": []})
+                   for i in range(20))
+    for _ in range(500):
+        chars = list(base)
+        for _ in range(rng.randint(1, 30)):
+            i = rng.randrange(len(chars))
+            op = rng.random()
+            if op < 0.4:
+                del chars[i]
+            elif op < 0.8:
+                chars.insert(i, rng.choice("<>/\"'= \n"))
+            else:
+                chars[i:i] = list(rng.choice(["<task>", "</task>", "<description>", "</description>", "<type>"]))
+        text = "".join(chars)[:rng.randint(0, len(chars))]
+        for task in parse_tasks(text):
+            assert task["description"] and task["type"] and task["id"]
+            assert all(isinstance(d, str) and d for d in task["depends_on"])
+
+def test_stream_parser_matches_parse_tasks_on_any_chunking():
+    rng = random.Random(2)
+    text = "<analysis>Plan <task> in prose.</analysis>\n<tasks>\n" + "".join(
+        _render(rng, {"type": "t", "description": f"part {i}", "id": f"t{i}", "depends_on": []}) for i in range(10)
+    ) + "\n<task><description>cut off, but complete</description>"
+    for _ in range(50):
+        parser = TaskStreamParser()
+        seen, i = [], 0
+        while i < len(text):
+            n = rng.randint(1, 40)
+            seen.extend(parser.feed(text[i:i + n]))
+            i += n
+        assert len(seen) == 10
+        seen.extend(parser.close())
+        assert seen == parse_tasks(tasks_section(text)) and len(seen) == 11
+
+def test_stream_parser_large_plan_is_linear():
+    def plan(n):
+        return "<analysis>Plan.</analysis>\n<tasks>\n" + "".join(
+            f"<task>\n<id>p{i}</id>\n<description>Write part {i}, in detail</description>\n</task>\n" for i in range(n)
+        ) + "</tasks>\nDone."
+
+    def stream(text):
+        parser, seen = TaskStreamParser(), []
+        start = time.perf_counter()
+        for i in range(0, len(text), 16):
+            seen.extend(parser.feed(text[i:i + 16]))
+        seen.extend(parser.close())
+        return time.perf_counter() - start, seen, parser.text
+
+    small, large = plan(500), plan(4000)
+    small_seconds, _, _ = stream(small)
+    seconds, seen, text = stream(large)
+    assert seen == parse_tasks(tasks_section(large)) and len(seen) == 4000 and seen[-1]["id"] == "p3999"
+    assert text == large
+    # 8x the tasks: about 8x the time when each task is parsed once, 64x when the whole section is re-parsed.
+    assert seconds < 25 * max(small_seconds, 0.001)
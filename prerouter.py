@@ -0,0 +1,380 @@
+# Local pre-routing for route: decide the obvious inputs without the selector LLM call and fall back to
+# the model only when no local router is confident. Every LLM decision is fed back to train the local ones.
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import unicodedata
+import threading
+import math
+import json
+import time
+import os
+import re
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WORDS = re.compile(r"[a-z0-9_]+|[^\W\d_a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Case-fold, drop punctuation and collapse whitespace, so trivially different inputs compare equal."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Latin words as-is; runs of other scripts (e.g. Chinese, which has no spaces) as characters and bigrams."""
+    tokens = []
+    for word in _WORDS.findall(normalize(text)):
+        if word.isascii():
+            tokens.append(word)
+        else:
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class RouteDecision(NamedTuple):
+    """A local routing decision: the route key, a confidence in [0, 1] and the router that made it."""
+    route: str
+    confidence: float
+    source: str
+
+
+class KeywordRouter:
+    """Aho-Corasick matcher over per-route keywords: one pass over the input however many keywords there are."""
+
+    name = "keyword"
+
+    def __init__(self, keywords: Dict[str, Iterable[str]]):
+        """
+        Build the automaton.
+
+        Args:
+            keywords (Dict[str, Iterable[str]]): Route key -> keywords or phrases that indicate it.
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, int, bool]]] = [[]]
+        for route, words in keywords.items():
+            for word in words:
+                self._insert(normalize(word), route)
+        self._link()
+
+    def _insert(self, word: str, route: str) -> None:
+        state = 0
+        for char in word:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        # Latin keywords only match whole words ("bill" must not fire on "billion").
+        self._out[state].append((route, len(word), word[-1].isascii() and word[-1].isalnum()))
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                # Children of the root fail back to the root, not to themselves.
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+    def matches(self, text: str) -> Iterator[Tuple[str, int, int]]:
+        """Yield (route, start, end) for every keyword occurrence in the normalized text."""
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for route, length, whole_word in self._out[state]:
+                start = end - length
+                if whole_word and ((start > 0 and text[start - 1].isalnum() and text[start - 1].isascii())
+                                   or (end < len(text) and text[end].isalnum() and text[end].isascii())):
+                    continue
+                yield route, start, end
+
+    def rank(self, input: str, routes: Dict[str, str]) -> List[RouteDecision]:
+        """Every route with keyword hits, most hits first; confidence is the route's share of all hits."""
+        hits: Dict[str, int] = {}
+        for route, _, _ in self.matches(normalize(input)):
+            if route in routes:
+                hits[route] = hits.get(route, 0) + 1
+        total = sum(hits.values())
+        return sorted((RouteDecision(r, n / total, self.name) for r, n in hits.items()), key=lambda d: -d.confidence)
+
+    def predict(self, input: str, routes: Dict[str, str]) -> Optional[RouteDecision]:
+        """Pick the route with the most keyword hits."""
+        ranked = self.rank(input, routes)
+        return ranked[0] if ranked else None
+
+
+class NaiveBayesRouter:
+    """Multinomial naive Bayes over tokenize() features, trained incrementally on past routing decisions."""
+
+    name = "classifier"
+
+    def __init__(self, min_examples: int = 20, alpha: float = 1.0):
+        """
+        Initialize an empty model.
+
+        Args:
+            min_examples (int, optional): Make no predictions until this many decisions have been learned.
+            alpha (float, optional): Additive smoothing of token counts.
+        """
+        self.min_examples = min_examples
+        self.alpha = alpha
+        self.examples = 0
+        self._routes: Dict[str, int] = {}
+        self._tokens: Dict[str, Dict[str, int]] = {}
+        self._totals: Dict[str, int] = {}
+        self._vocabulary: set = set()
+
+    def learn(self, input: str, route: str) -> None:
+        """Add one decision to the model."""
+        self.examples += 1
+        self._routes[route] = self._routes.get(route, 0) + 1
+        counts = self._tokens.setdefault(route, {})
+        for token in tokenize(input):
+            counts[token] = counts.get(token, 0) + 1
+            self._totals[route] = self._totals.get(route, 0) + 1
+            self._vocabulary.add(token)
+
+    def rank(self, input: str, routes: Dict[str, str]) -> List[RouteDecision]:
+        """Every known route, most probable first; confidence is the posterior probability."""
+        candidates = [r for r in routes if r in self._routes]
+        if self.examples < self.min_examples or not candidates:
+            return []
+        tokens = tokenize(input)
+        vocabulary = len(self._vocabulary) + 1
+        scores = {}
+        for route in candidates:
+            counts, total = self._tokens[route], self._totals.get(route, 0)
+            score = math.log(self._routes[route] / self.examples)
+            for token in tokens:
+                score += math.log((counts.get(token, 0) + self.alpha) / (total + self.alpha * vocabulary))
+            scores[route] = score
+        best = max(scores.values())
+        evidence = sum(math.exp(score - best) for score in scores.values())
+        ranked = [RouteDecision(r, math.exp(score - best) / evidence, self.name) for r, score in scores.items()]
+        return sorted(ranked, key=lambda d: -d.confidence)
+
+    def predict(self, input: str, routes: Dict[str, str]) -> Optional[RouteDecision]:
+        """Return the most probable known route."""
+        ranked = self.rank(input, routes)
+        return ranked[0] if ranked else None
+
+
+class DecisionCache:
+    """LRU map from normalized input to the route the selector chose for it."""
+
+    name = "cache"
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    def learn(self, input: str, route: str) -> None:
+        key = normalize(input)
+        self._entries[key] = route
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def predict(self, input: str, routes: Dict[str, str]) -> Optional[RouteDecision]:
+        key = normalize(input)
+        route = self._entries.get(key)
+        if route is None or route not in routes:
+            return None
+        self._entries.move_to_end(key)
+        return RouteDecision(route, 1.0, self.name)
+
+
+class PreRouter:
+    """Cascade of local routers in front of the LLM selector, with counters of what it saved."""
+
+    def __init__(
+        self,
+        routers: Optional[List[Any]] = None,
+        threshold: float = 0.9,
+        log_path: Optional[str] = None,
+    ):
+        """
+        Initialize the cascade.
+
+        Args:
+            routers (List, optional): Objects with predict(input, routes) -> Optional[RouteDecision] and,
+                optionally, learn(input, route); tried in order. Defaults to a DecisionCache followed by a
+                NaiveBayesRouter. Put a KeywordRouter first to route on known terms from the start.
+            threshold (float, optional): Minimum confidence for a local decision; below it the LLM decides.
+            log_path (str, optional): JSONL file of LLM decisions. Existing entries train the routers on
+                startup and new decisions are appended, so learning carries over between runs.
+        """
+        self.routers = routers if routers is not None else [DecisionCache(), NaiveBayesRouter()]
+        self.threshold = threshold
+        self.log_path = log_path
+        self.local: Dict[str, int] = {}
+        self.fallbacks = 0
+        self.selector_seconds = 0.0
+        self.local_seconds = 0.0
+        self._lock = threading.Lock()
+        if log_path is not None and os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._learn(entry["input"], entry["route"])
+
+    def _learn(self, input: str, route: str) -> None:
+        for router in self.routers:
+            learn = getattr(router, "learn", None)
+            if learn is not None:
+                learn(input, route)
+
+    def decide(self, input: str, routes: Dict[str, str]) -> Optional[RouteDecision]:
+        """Return the first local decision at or above the threshold, or None to ask the LLM."""
+        start = time.perf_counter()
+        with self._lock:
+            try:
+                for router in self.routers:
+                    decision = router.predict(input, routes)
+                    if decision is not None and decision.confidence >= self.threshold:
+                        self.local[decision.source] = self.local.get(decision.source, 0) + 1
+                        return decision
+                return None
+            finally:
+                self.local_seconds += time.perf_counter() - start
+
+    def rank(self, input: str, routes: Dict[str, str]) -> List[RouteDecision]:
+        """
+        Candidate routes from every router, best confidence first, whatever the threshold. Routers with a
+        rank method contribute all their candidates, the others their single prediction.
+        """
+        best: Dict[str, RouteDecision] = {}
+        with self._lock:
+            for router in self.routers:
+                rank = getattr(router, "rank", None)
+                if rank is not None:
+                    decisions = rank(input, routes)
+                else:
+                    decision = router.predict(input, routes)
+                    decisions = [decision] if decision is not None else []
+                for decision in decisions:
+                    if decision.route not in best or decision.confidence > best[decision.route].confidence:
+                        best[decision.route] = decision
+        return sorted(best.values(), key=lambda d: -d.confidence)
+
+    def record(self, input: str, route: str, latency: float) -> None:
+        """Learn from a decision the LLM selector made in latency seconds."""
+        with self._lock:
+            self.fallbacks += 1
+            self.selector_seconds += latency
+            self._learn(input, route)
+            if self.log_path is not None:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"input": input, "route": route}, ensure_ascii=False) + "\n")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarize the cascade.
+
+        Returns:
+            Dict[str, Any]: Local decisions per router, LLM fallbacks, the fraction of selector calls
+                avoided and the estimated seconds saved (avoided calls at the mean observed selector latency,
+                minus the time spent in the local routers).
+        """
+        with self._lock:
+            local = sum(self.local.values())
+            total = local + self.fallbacks
+            mean_selector = self.selector_seconds / self.fallbacks if self.fallbacks else 0.0
+            return {
+                "decisions": total,
+                "local": dict(self.local),
+                "llm": self.fallbacks,
+                "avoided_ratio": local / total if total else 0.0,
+                "mean_selector_latency": mean_selector,
+                "latency_saved": local * mean_selector - self.local_seconds,
+            }
+
+
+class Speculation:
+    """
+    Policy and counters for speculative routing: start the handler call for the likeliest routes while the
+    selector is still deciding, keep the one it picks and cancel the rest.
+    """
+
+    def __init__(self, top_k: int = 1, min_confidence: float = 0.3, token_budget: Optional[int] = None):
+        """
+        Initialize the policy.
+
+        Args:
+            top_k (int, optional): Handler calls started per route, i.e. the extra calls a miss can cost.
+            min_confidence (float, optional): Only speculate on candidates at least this likely.
+            token_budget (int, optional): Stop speculating once the cancelled calls have used this many
+                tokens in total. Unlimited when omitted.
+        """
+        self.top_k = top_k
+        self.min_confidence = min_confidence
+        self.token_budget = token_budget
+        self.speculated = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+        self.over_budget = 0
+        self.wasted_tokens = 0
+        self._selected: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def candidates(self, input: str, routes: Dict[str, str], prerouter: Optional[PreRouter] = None) -> List[str]:
+        """
+        Pick the routes to speculate on: the pre-router's ranking, topped up with how often the selector
+        has chosen each route so far.
+        """
+        with self._lock:
+            if self.token_budget is not None and self.wasted_tokens >= self.token_budget:
+                self.over_budget += 1
+                return []
+            total = sum(self._selected.get(r, 0) for r in routes)
+            prior = [RouteDecision(r, self._selected.get(r, 0) / total, "prior") for r in routes] if total else []
+        ranked = (prerouter.rank(input, routes) if prerouter is not None else []) + sorted(prior, key=lambda d: -d.confidence)
+        chosen: List[str] = []
+        for decision in ranked:
+            if decision.confidence >= self.min_confidence and decision.route not in chosen:
+                chosen.append(decision.route)
+        return chosen[:self.top_k]
+
+    def settle(self, speculated: List[str], selected: str) -> None:
+        """Count one routed input: whether the selector picked a speculated route."""
+        with self._lock:
+            self._selected[selected] = self._selected.get(selected, 0) + 1
+            if not speculated:
+                return
+            self.speculated += 1
+            if selected in speculated:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.cancelled += sum(1 for route in speculated if route != selected)
+
+    def waste(self, tokens: int) -> None:
+        """Charge the tokens used by a cancelled handler call against the budget."""
+        with self._lock:
+            self.wasted_tokens += tokens
+
+    def stats(self) -> Dict[str, Any]:
+        """Return speculation counts, the hit rate and the tokens spent on cancelled calls."""
+        with self._lock:
+            return {
+                "speculated": self.speculated,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / self.speculated if self.speculated else 0.0,
+                "cancelled_calls": self.cancelled,
+                "wasted_tokens": self.wasted_tokens,
+                "over_budget": self.over_budget,
+            }
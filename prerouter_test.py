@@ -0,0 +1,106 @@
+from basic_workflow import aroute, route
+from llm import get_async_client, get_client
+from mock_llm_server import MockLLMServer, ScriptedResponder
+from prerouter import DecisionCache, KeywordRouter, NaiveBayesRouter, PreRouter, Speculation, normalize
+import asyncio
+import random
+import time
+
+ROUTES = {"billing": "Billing team", "technical": "Tech team"}
+
+def test_keyword_matches_agree_with_brute_force():
+    keywords = {"a": ["他", "他们", "们的"], "b": ["的钱", "钱"]}
+    router = KeywordRouter(keywords)
+    rng = random.Random(0)
+    for _ in range(200):
+        text = "".join(rng.choice("他们的钱包") for _ in range(12))
+        expected = sorted(
+            (route, i, i + len(word))
+            for route, words in keywords.items() for word in words
+            for i in range(len(text)) if text.startswith(word, i)
+        )
+        assert sorted(router.matches(text)) == expected
+
+def test_keyword_router_whole_words_and_confidence():
+    router = KeywordRouter({"billing": ["refund", "invoice"], "technical": ["error", "log in"]})
+    assert router.predict("Off by a billion", ROUTES) is None
+    assert router.predict("Refund the invoice!", ROUTES).confidence == 1.0
+    assert router.predict("Can't LOG  IN: error on the invoice page", ROUTES).route == "technical"
+    assert router.predict("refund", {"technical": ""}) is None
+
+def test_classifier_and_cache_learn_from_decisions():
+    classifier = NaiveBayesRouter(min_examples=4)
+    cache = DecisionCache()
+    for text, route in [("我被多扣费了", "billing"), ("发票开错了", "billing"),
+                        ("应用一打开就崩溃", "technical"), ("登录时报错", "technical")]:
+        classifier.learn(text, route)
+        cache.learn(text, route)
+    assert classifier.predict("扣费两次，请退款", ROUTES).route == "billing"
+    assert classifier.predict("打开后崩溃报错", ROUTES).route == "technical"
+    assert cache.predict("  登录时报错！", ROUTES).route == "technical"
+    assert normalize("Hello,  World!") == "hello world"
+
+def test_route_skips_selector_when_confident(tmp_path):
+    responder = ScriptedResponder(rules=[
+        (r"(?s)<selection>.*Input: .*charge", "<reasoning>Money.</reasoning><selection>billing</selection>"),
+        (r"(?s)<selection>", "<reasoning>Bug.</reasoning><selection>technical</selection>"),
+    ])
+    log_path = str(tmp_path / "decisions.jsonl")
+    prerouter = PreRouter(threshold=0.9, log_path=log_path)
+    with MockLLMServer(responder=responder, keep_requests=True) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        route("Unexpected charge on my card", ROUTES, prerouter=prerouter, client=client)
+        route("unexpected charge on my card.", ROUTES, prerouter=prerouter, client=client)
+        selector_calls = sum("<selection>" in r["messages"][-1]["content"] for r in server.requests)
+    assert selector_calls == 1
+    stats = prerouter.stats()
+    assert stats["local"] == {"cache": 1} and stats["llm"] == 1 and stats["avoided_ratio"] == 0.5
+
+    # Logged decisions train a fresh cascade.
+    assert PreRouter(log_path=log_path).decide("Unexpected charge on my card", ROUTES).route == "billing"
+
+def _selector(body):
+    prompt = body["messages"][-1]["content"]
+    if "<selection>" in prompt:
+        team = "technical" if "crash" in prompt else "billing"
+        return f"<reasoning>Obvious.</reasoning><selection>{team}</selection>"
+    return f"handled by {prompt.splitlines()[0]} with a reasonably long answer"
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_speculative_route_hit_miss_and_budget():
+    speculation = Speculation(top_k=1, min_confidence=0.5, token_budget=1)
+    with MockLLMServer(responder=_selector, token_delay=0.01) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        # No prior yet: nothing to speculate on.
+        assert route("charge", ROUTES, speculation=speculation, client=client) == "handled by Billing team with a reasonably long answer"
+        assert speculation.stats()["speculated"] == 0
+
+        # The selector has only ever picked billing, so billing is started alongside it.
+        assert route("another charge", ROUTES, speculation=speculation, client=client).startswith("handled by Billing team")
+        assert speculation.stats()["hits"] == 1
+
+        assert route("app crash", ROUTES, speculation=speculation, client=client).startswith("handled by Tech team")
+        assert speculation.stats()["misses"] == 1 and speculation.stats()["cancelled_calls"] == 1
+        assert _wait_for(lambda: speculation.stats()["wasted_tokens"] > 0)
+
+        # The cancelled call used up the token budget.
+        route("charge again", ROUTES, speculation=speculation, client=client)
+        assert speculation.stats()["over_budget"] == 1 and speculation.stats()["speculated"] == 2
+
+def test_async_speculative_route_uses_prerouter_ranking():
+    prerouter = PreRouter([KeywordRouter({"billing": ["refund"], "technical": ["crash"]})], threshold=1.1)
+    speculation = Speculation(top_k=2, min_confidence=0.4)
+
+    async def main(base_url):
+        client = get_async_client(base_url=base_url, api_key="mock")
+        return await aroute("refund after crash", ROUTES, prerouter=prerouter, speculation=speculation, client=client)
+
+    with MockLLMServer(responder=_selector, token_delay=0.01) as server:
+        assert asyncio.run(main(server.base_url)).startswith("handled by Tech team")
+    stats = speculation.stats()
+    assert stats["hits"] == 1 and stats["cancelled_calls"] == 1
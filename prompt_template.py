@@ -0,0 +1,98 @@
+# Prompt templates parsed once and laid out for provider-side prompt caching, which only reuses work for a
+# byte-identical prefix: everything before the first value that changes between calls.
+from functools import lru_cache
+from string import Formatter
+from typing import Any, FrozenSet, Iterable, List, Optional, Tuple
+
+_FORMATTER = Formatter()
+
+
+def _root(name: str) -> str:
+    # "{task.title}" and "{items[0]}" take their value from the task and items arguments.
+    return name.split(".")[0].split("[")[0]
+
+
+class PromptTemplate:
+    """A str.format template split into literal text and named fields."""
+
+    def __init__(self, template: str, dynamic: Optional[Iterable[str]] = None):
+        """
+        Parse the template.
+
+        Args:
+            template (str): A str.format template with named fields, e.g. "Task: {task}".
+            dynamic (Iterable[str], optional): Fields whose values change from call to call (per worker, per
+                round). Defaults to every field.
+
+        Raises:
+            ValueError: The template is malformed or has positional fields.
+        """
+        self.template = template
+        # (literal text, field name, format spec, conversion) with the field name None after the last field.
+        self.segments: List[Tuple[str, Optional[str], str, Optional[str]]] = list(_FORMATTER.parse(template))
+        names = [name for _, name, _, _ in self.segments if name is not None]
+        # Nested fields in a format spec, e.g. w in "{x:>{w}}", are filled from the same values.
+        names += [name for _, _, spec, _ in self.segments if spec and "{" in spec
+                  for _, name, _, _ in _FORMATTER.parse(spec) if name is not None]
+        if any(name == "" or name.isdigit() for name in names):
+            raise ValueError(f"Prompt templates take named fields only: {template[:60]!r}")
+        self.fields: FrozenSet[str] = frozenset(_root(name) for name in names)
+        self.dynamic: FrozenSet[str] = self.fields if dynamic is None else frozenset(dynamic) & self.fields
+
+    def _value(self, name: str, spec: str, conversion: Optional[str], values: dict) -> str:
+        value, _ = _FORMATTER.get_field(name, (), values)
+        if "{" in spec:
+            spec = _FORMATTER.vformat(spec, (), values)
+        return _FORMATTER.format_field(_FORMATTER.convert_field(value, conversion), spec)
+
+    def format(self, **values: Any) -> str:
+        """Same as template.format(**values), without parsing the template again."""
+        parts = []
+        for literal, name, spec, conversion in self.segments:
+            parts.append(literal)
+            if name is not None:
+                parts.append(self._value(name, spec, conversion, values))
+        return "".join(parts)
+
+    def prefix(self, **values: Any) -> str:
+        """The text before the first dynamic field: what every call with the same static values shares."""
+        parts = []
+        for literal, name, spec, conversion in self.segments:
+            parts.append(literal)
+            if name is None or _root(name) in self.dynamic:
+                break
+            parts.append(self._value(name, spec, conversion, values))
+        return "".join(parts)
+
+    def layout(self, **values: Any) -> str:
+        """
+        Render with the dynamic values moved to the end, so the whole static text is a shared prefix.
+
+        Dynamic fields are replaced by a reference to an XML block that follows the template, e.g.
+        "Style: {task_type}" becomes "Style: (see <task_type> below)". A template with no static text after
+        its first dynamic field renders exactly as format does.
+        """
+        static, dynamic, seen = [], [], False
+        for literal, name, spec, conversion in self.segments:
+            if seen and literal.strip():
+                break
+            seen = seen or (name is not None and _root(name) in self.dynamic)
+        else:
+            return self.format(**values)
+
+        for literal, name, spec, conversion in self.segments:
+            static.append(literal)
+            if name is None:
+                continue
+            if _root(name) in self.dynamic:
+                static.append(f"(see <{name}> below)")
+                dynamic.append(f"<{name}>\n{self._value(name, spec, conversion, values)}\n</{name}>")
+            else:
+                static.append(self._value(name, spec, conversion, values))
+        return "".join(static).rstrip() + "\n\n" + "\n".join(dict.fromkeys(dynamic))
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str, dynamic: Optional[Tuple[str, ...]] = None) -> PromptTemplate:
+    """Compiled PromptTemplate for template (cached), e.g. to format the same prompt for many workers."""
+    return PromptTemplate(template, dynamic)
@@ -0,0 +1,46 @@
+from prompt_template import PromptTemplate, compile_template
+import pytest
+
+WORKER = """Generate content based on:
+Task: {original_task}
+Style: {task_type}
+Guidelines: {task_description!r:>5}
+
+Return your response in <response></response> tags. Audience: {audience[0]}."""
+
+VALUES = dict(original_task="Write an ad", task_type="formal", task_description="Be precise", audience=["adults"])
+
+def test_format_matches_str_format():
+    for template in [WORKER, "", "no fields", "{a}{b}", "{{literal}} {a:>4} {b!s}", "{obj.real} {items[1]}",
+                     "a {x:>{w}} b", "{x:{fill}^{w}}|{a:{w}.{p}f}"]:
+        values = dict(VALUES, a=1, b="two", obj=3, items=["x", "y"], x="1", w=5, fill="*", p=2)
+        assert PromptTemplate(template).format(**values) == template.format(**values)
+    with pytest.raises(KeyError):
+        PromptTemplate(WORKER).format(original_task="x")
+    with pytest.raises(ValueError):
+        PromptTemplate("{} and {0}")
+    assert PromptTemplate("{x:>{w}}").fields == {"x", "w"}
+
+def test_fields_and_prefix():
+    template = PromptTemplate(WORKER, dynamic=["task_type", "task_description", "unknown"])
+    assert template.fields == {"original_task", "task_type", "task_description", "audience"}
+    assert template.dynamic == {"task_type", "task_description"}
+    assert template.prefix(**VALUES) == "Generate content based on:\nTask: Write an ad\nStyle: "
+    assert PromptTemplate("{a} then text").prefix(a=1) == ""
+
+def test_layout_moves_dynamic_fields_last():
+    template = PromptTemplate(WORKER, dynamic=["task_type", "task_description"])
+    rendered = [template.layout(**dict(VALUES, task_type=t, task_description=d))
+                for t, d in [("formal", "Be precise"), ("casual", "Be friendly")]]
+    static = rendered[0].split("\n\n<task_type>\n")[0]
+    assert static.startswith("Generate content based on:\nTask: Write an ad\nStyle: (see <task_type> below)")
+    assert static.rstrip().endswith("Audience: adults.") and rendered[1].startswith(static)
+    assert rendered[0].endswith("<task_type>\nformal\n</task_type>\n<task_description>\n'Be precise'\n</task_description>")
+
+    # Nothing static follows the dynamic fields: already laid out, rendered as is.
+    trailing = PromptTemplate("Rules.\nInput: {input}", dynamic=["input"])
+    assert trailing.layout(input="x") == "Rules.\nInput: x"
+
+def test_compile_template_is_cached():
+    assert compile_template(WORKER) is compile_template(WORKER)
+    assert compile_template(WORKER, ("task_type",)) is not compile_template(WORKER)
@@ -0,0 +1,219 @@
+# Client-side rate limiting for provider quotas: token buckets for requests/min and tokens/min,
+# plus an AIMD concurrency limit that backs off on 429s and timeouts.
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+import threading
+import asyncio
+import time
+
+import httpx
+import openai
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used before the real usage is known (about 3 characters per token)."""
+    return max(1, len(text) // 3)
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """True for errors that mean the provider is saturated: 429s and timeouts."""
+    return isinstance(error, (openai.RateLimitError, openai.APITimeoutError, httpx.TimeoutException))
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at `rate` per second up to `capacity`. Not thread-safe."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken (0 if it can be taken now)."""
+        self._refill(now)
+        # A request larger than the bucket could never fit; let it through once the bucket is full.
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        """Remove amount, possibly going into debt when the real usage exceeds the estimate."""
+        self.tokens -= amount
+
+    def give(self, amount: float) -> None:
+        """Return amount, e.g. when the estimate was higher than the real usage."""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+@dataclass
+class LimiterSlot:
+    """A granted request slot. Set `tokens_used` once the real usage is known."""
+
+    estimated_tokens: int
+    tokens_used: Optional[int] = None
+
+    def record_usage(self, usage: Any) -> None:
+        """Take the real token count from a completion's `usage`, if present."""
+        total = getattr(usage, "total_tokens", None)
+        if total is not None:
+            self.tokens_used = total
+
+
+class AdaptiveLimiter:
+    """
+    Shared limiter for all LLM calls in the process.
+
+    Requests wait until a concurrency slot is free and the requests/min and tokens/min buckets
+    have room. The concurrency limit follows AIMD: it grows by about one per limit's worth of
+    successes and is multiplied by `decrease_factor` on 429s and timeouts.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        initial_concurrency: int = 16,
+        min_concurrency: int = 1,
+        max_concurrency: int = 256,
+        decrease_factor: float = 0.5,
+        backoff_cooldown: float = 1.0,
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            rpm (float, optional): Requests per minute. Unlimited when omitted.
+            tpm (float, optional): Tokens per minute. Unlimited when omitted.
+            initial_concurrency (int, optional): Starting concurrency limit.
+            min_concurrency (int, optional): Floor of the concurrency limit.
+            max_concurrency (int, optional): Ceiling of the concurrency limit.
+            decrease_factor (float, optional): Multiplier applied to the limit on overload.
+            backoff_cooldown (float, optional): Seconds after a decrease during which further
+                overload signals (from the same burst) do not decrease again.
+        """
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.decrease_factor = decrease_factor
+        self.backoff_cooldown = backoff_cooldown
+        self.request_bucket = TokenBucket(rpm / 60.0, rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm / 60.0, tpm) if tpm else None
+
+        self.concurrency_limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.in_flight = 0
+        self.successes = 0
+        self.overloads = 0
+        self.errors = 0
+        self.wait_time = 0.0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a slot and return 0, or return how long to wait before trying again. Holds the lock."""
+        if self.in_flight >= int(self.concurrency_limit):
+            return 0.05
+        now = time.monotonic()
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        if self.request_bucket is not None:
+            self.request_bucket.take(1)
+        if self.token_bucket is not None:
+            self.token_bucket.take(tokens)
+        self.in_flight += 1
+        return 0.0
+
+    def acquire(self, tokens: int = 0) -> LimiterSlot:
+        """Block until a request estimated at `tokens` may be sent."""
+        start = time.monotonic()
+        with self._cond:
+            while (wait := self._try_acquire(tokens)) > 0:
+                self._cond.wait(timeout=wait)
+            self.wait_time += time.monotonic() - start
+        return LimiterSlot(tokens)
+
+    async def aacquire(self, tokens: int = 0) -> LimiterSlot:
+        """Async variant of acquire; waits on the event loop instead of blocking the thread."""
+        start = time.monotonic()
+        while True:
+            with self._cond:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    self.wait_time += time.monotonic() - start
+                    return LimiterSlot(tokens)
+            await asyncio.sleep(min(wait, 0.05))
+
+    def release(self, slot: LimiterSlot, error: Optional[BaseException] = None) -> None:
+        """Return the slot, settle the token estimate and adapt the concurrency limit."""
+        with self._cond:
+            self.in_flight -= 1
+            if self.token_bucket is not None and slot.tokens_used is not None:
+                difference = slot.tokens_used - slot.estimated_tokens
+                if difference > 0:
+                    self.token_bucket.take(difference)
+                else:
+                    self.token_bucket.give(-difference)
+
+            if error is None:
+                self.successes += 1
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+            elif is_overload_error(error):
+                self.overloads += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.backoff_cooldown:
+                    self._last_decrease = now
+                    self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * self.decrease_factor)
+            elif isinstance(error, Exception):
+                # Cancellation and generator close are neither success nor failure.
+                self.errors += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def limit(self, tokens: int = 0) -> Iterator[LimiterSlot]:
+        """Hold a slot for the duration of one request."""
+        slot = self.acquire(tokens)
+        try:
+            yield slot
+        except BaseException as e:
+            self.release(slot, e)
+            raise
+        self.release(slot)
+
+    @asynccontextmanager
+    async def alimit(self, tokens: int = 0) -> AsyncIterator[LimiterSlot]:
+        """Async variant of limit."""
+        slot = await self.aacquire(tokens)
+        try:
+            yield slot
+        except BaseException as e:
+            self.release(slot, e)
+            raise
+        self.release(slot)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current state for monitoring."""
+        with self._cond:
+            now = time.monotonic()
+            state: Dict[str, Any] = {
+                "concurrency_limit": int(self.concurrency_limit),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "overloads": self.overloads,
+                "errors": self.errors,
+                "wait_time": self.wait_time,
+            }
+            for name, bucket in (("requests", self.request_bucket), ("tokens", self.token_bucket)):
+                if bucket is not None:
+                    bucket._refill(now)
+                    state[f"{name}_available"] = bucket.tokens
+            return state
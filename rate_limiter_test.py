@@ -0,0 +1,63 @@
+from rate_limiter import AdaptiveLimiter
+from concurrent.futures import ThreadPoolExecutor
+from llm import llm_call, get_client, get_limiter, set_limiter
+from mock_llm_server import MockLLMServer
+import openai
+import httpx
+import pytest
+
+@pytest.fixture
+def limiter():
+    original = get_limiter()
+    limiter = AdaptiveLimiter(initial_concurrency=16, backoff_cooldown=0.0)
+    set_limiter(limiter)
+    yield limiter
+    set_limiter(original)
+
+def test_request_bucket():
+    limiter = AdaptiveLimiter(rpm=6)
+    for _ in range(6):
+        limiter.release(limiter.acquire())
+    with limiter._cond:
+        assert limiter._try_acquire(0) > 0
+    assert limiter.snapshot()["requests_available"] < 1
+
+def test_token_bucket_settles_estimates():
+    limiter = AdaptiveLimiter(tpm=600)
+    slot = limiter.acquire(500)
+    with limiter._cond:
+        assert limiter._try_acquire(200) > 0
+    slot.tokens_used = 100
+    limiter.release(slot)
+    limiter.release(limiter.acquire(200))
+
+def test_aimd():
+    limiter = AdaptiveLimiter(initial_concurrency=8, backoff_cooldown=0.0)
+    limiter.release(limiter.acquire(), httpx.ReadTimeout("slow"))
+    assert limiter.snapshot()["concurrency_limit"] == 4
+    for _ in range(40):
+        limiter.release(limiter.acquire())
+    assert limiter.snapshot()["concurrency_limit"] >= 8
+    limiter.release(limiter.acquire(), ValueError("not an overload"))
+    assert limiter.snapshot()["concurrency_limit"] >= 8
+    assert limiter.snapshot()["errors"] == 1
+
+def test_backs_off_on_mock_429s(limiter):
+    with MockLLMServer(latency=0.05, capacity=4) as server:
+        client = get_client(base_url=server.base_url, api_key="mock", max_retries=0)
+
+        def call(i):
+            try:
+                return llm_call(f"request {i}", client=client)
+            except openai.RateLimitError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(call, range(64)))
+
+    state = limiter.snapshot()
+    assert server.rejected_count > 0
+    assert state["overloads"] == server.rejected_count
+    assert state["successes"] == sum(r is not None for r in results)
+    assert state["concurrency_limit"] < 16
+    assert state["in_flight"] == 0
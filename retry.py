@@ -0,0 +1,276 @@
+# Retry, hedging and deadline handling for LLM requests.
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Optional, Tuple, TypeVar
+import threading
+import asyncio
+import random
+import time
+
+import httpx
+import openai
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    httpx.TimeoutException,
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call did not complete within its deadline, including retries."""
+
+
+class LatencyTracker:
+    """Rolling window of observed request latencies."""
+
+    def __init__(self, window: int = 1000):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The q-quantile (0..1) of the window, or None when empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+@dataclass
+class RetryPolicy:
+    """Retry retryable errors with full-jitter exponential backoff."""
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, attempt: int) -> float:
+        """Backoff before retry number attempt (0-based): uniform in [0, min(max_delay, base_delay * 2**attempt)]."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def is_retryable(self, error: BaseException) -> bool:
+        return isinstance(error, RETRYABLE_ERRORS)
+
+
+@dataclass
+class HedgePolicy:
+    """
+    Send a duplicate request when the first one is slower than usual and keep whichever finishes first.
+
+    The hedge fires after `delay` seconds, or by default after the `quantile` of the latencies
+    seen so far (once `min_samples` are in), so only about 1 - quantile of calls are duplicated.
+    """
+
+    delay: Optional[float] = None
+    quantile: float = 0.95
+    min_samples: int = 20
+    tracker: LatencyTracker = field(default_factory=LatencyTracker)
+    hedges: int = 0
+    hedge_wins: int = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is not enough latency history."""
+        if self.delay is not None:
+            return self.delay
+        if len(self.tracker) < self.min_samples:
+            return None
+        return self.tracker.quantile(self.quantile)
+
+
+
+
+def _remaining(deadline_at: Optional[float]) -> Optional[float]:
+    if deadline_at is None:
+        return None
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("LLM call deadline exceeded")
+    return remaining
+
+
+def _timed(fn: Callable[[Optional[float]], T], timeout: Optional[float], hedge: Optional[HedgePolicy]) -> T:
+    start = time.monotonic()
+    result = fn(timeout)
+    if hedge is not None:
+        hedge.tracker.observe(time.monotonic() - start)
+    return result
+
+
+def _start_attempt(fn: Callable[[Optional[float]], T], timeout: Optional[float], hedge: HedgePolicy) -> Tuple["Future[T]", threading.Event]:
+    """Run one hedged attempt on a thread of its own; the event is set once it is running."""
+    # Not a shared pool: a capped pool would queue attempts under load while their hedge timers run.
+    future: "Future[T]" = Future()
+    running = threading.Event()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        running.set()
+        try:
+            future.set_result(_timed(fn, timeout, hedge))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="llm-hedge", daemon=True).start()
+    return future, running
+
+
+def _hedge_wait(delay: float, deadline_at: Optional[float]) -> float:
+    """How long to wait for the primary before hedging: the hedge delay, capped by the deadline."""
+    remaining = _remaining(deadline_at)
+    return delay if remaining is None else min(delay, remaining)
+
+
+def _hedged_attempt(fn: Callable[[Optional[float]], T], hedge: HedgePolicy, deadline_at: Optional[float]) -> T:
+    """Run fn, adding a duplicate after the hedge delay; return the first success.
+
+    Sync requests cannot be interrupted, so the losing request is abandoned: it finishes (or times
+    out) on its own thread and its result is discarded.
+    """
+    delay = hedge.hedge_delay()
+    if delay is None:
+        return _timed(fn, _remaining(deadline_at), hedge)
+
+    primary, running = _start_attempt(fn, _remaining(deadline_at), hedge)
+    # The hedge delay counts from when the primary is actually sent.
+    running.wait(timeout=_remaining(deadline_at))
+    done, _ = wait([primary], timeout=_hedge_wait(delay, deadline_at))
+    if done:
+        return primary.result()
+
+    hedge.hedges += 1
+    backup, _ = _start_attempt(fn, _remaining(deadline_at), hedge)
+    pending = {primary, backup}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, timeout=_remaining(deadline_at), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded("LLM call deadline exceeded")
+        for future in done:
+            if future.exception() is None:
+                for loser in pending:
+                    loser.cancel()
+                if future is backup:
+                    hedge.hedge_wins += 1
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_retry(
+    fn: Callable[[Optional[float]], T],
+    retry: Optional[RetryPolicy] = None,
+    hedge: Optional[HedgePolicy] = None,
+    deadline: Optional[float] = None,
+) -> T:
+    """
+    Call fn(timeout) with retries, optional hedging and an overall deadline.
+
+    Args:
+        fn (Callable[[Optional[float]], T]): One attempt; receives the seconds left before the deadline
+            (None without a deadline) to use as its request timeout.
+        retry (RetryPolicy, optional): Retry policy. No retries when omitted.
+        hedge (HedgePolicy, optional): Hedging policy. No hedging when omitted.
+        deadline (float, optional): Seconds the whole call, including retries, may take.
+
+    Returns:
+        T: The result of the first successful attempt.
+    """
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    max_attempts = retry.max_attempts if retry is not None else 1
+    for attempt in range(max_attempts):
+        try:
+            if hedge is not None:
+                return _hedged_attempt(fn, hedge, deadline_at)
+            return _timed(fn, _remaining(deadline_at), hedge)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if retry is None or attempt == max_attempts - 1 or not retry.is_retryable(e):
+                raise
+            delay = retry.delay(attempt)
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                raise DeadlineExceeded("LLM call deadline exceeded") from e
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+async def _atimed(fn: Callable[[Optional[float]], Awaitable[T]], timeout: Optional[float], hedge: Optional[HedgePolicy]) -> T:
+    start = time.monotonic()
+    result = await fn(timeout)
+    if hedge is not None:
+        hedge.tracker.observe(time.monotonic() - start)
+    return result
+
+
+async def _ahedged_attempt(fn: Callable[[Optional[float]], Awaitable[T]], hedge: HedgePolicy, deadline_at: Optional[float]) -> T:
+    """Async variant of _hedged_attempt; the losing request is cancelled."""
+    delay = hedge.hedge_delay()
+    if delay is None:
+        return await _atimed(fn, _remaining(deadline_at), hedge)
+
+    primary = asyncio.ensure_future(_atimed(fn, _remaining(deadline_at), hedge))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=_hedge_wait(delay, deadline_at))
+        if not done:
+            hedge.hedges += 1
+            tasks.add(asyncio.ensure_future(_atimed(fn, _remaining(deadline_at), hedge)))
+
+        error: Optional[BaseException] = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=_remaining(deadline_at), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded("LLM call deadline exceeded")
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        hedge.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def acall_with_retry(
+    fn: Callable[[Optional[float]], Awaitable[T]],
+    retry: Optional[RetryPolicy] = None,
+    hedge: Optional[HedgePolicy] = None,
+    deadline: Optional[float] = None,
+) -> T:
+    """Async variant of call_with_retry; fn returns an awaitable and losing hedges are cancelled."""
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    max_attempts = retry.max_attempts if retry is not None else 1
+    for attempt in range(max_attempts):
+        try:
+            if hedge is not None:
+                return await _ahedged_attempt(fn, hedge, deadline_at)
+            return await asyncio.wait_for(_atimed(fn, _remaining(deadline_at), hedge), timeout=_remaining(deadline_at))
+        except DeadlineExceeded:
+            raise
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded("LLM call deadline exceeded") from e
+        except Exception as e:
+            if retry is None or attempt == max_attempts - 1 or not retry.is_retryable(e):
+                raise
+            delay = retry.delay(attempt)
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                raise DeadlineExceeded("LLM call deadline exceeded") from e
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
@@ -0,0 +1,104 @@
+from retry import DeadlineExceeded, HedgePolicy, RetryPolicy, acall_with_retry, call_with_retry
+from llm import llm_call, get_client
+from mock_llm_server import MockLLMServer
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import pytest
+import httpx
+import time
+
+FAST_RETRY = RetryPolicy(max_attempts=5, base_delay=0.001, max_delay=0.01)
+
+def test_retries_retryable_errors():
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise httpx.ReadTimeout("slow")
+        return "ok"
+
+    assert call_with_retry(flaky, FAST_RETRY) == "ok"
+    assert len(attempts) == 3
+
+def test_does_not_retry_other_errors():
+    attempts = []
+
+    def broken(timeout):
+        attempts.append(timeout)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        call_with_retry(broken, FAST_RETRY)
+    assert len(attempts) == 1
+
+def test_deadline():
+    def slow(timeout):
+        time.sleep(timeout)
+        raise httpx.ReadTimeout("slow")
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        call_with_retry(slow, FAST_RETRY, deadline=0.1)
+    assert time.monotonic() - start < 0.5
+
+def test_hedge_takes_faster_duplicate():
+    calls = []
+
+    def first_is_slow(timeout):
+        calls.append(timeout)
+        time.sleep(0.5 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    hedge = HedgePolicy(delay=0.05)
+    start = time.monotonic()
+    assert call_with_retry(first_is_slow, hedge=hedge) == 2
+    assert time.monotonic() - start < 0.3
+    assert (hedge.hedges, hedge.hedge_wins) == (1, 1)
+
+def test_hedge_no_needless_hedges_under_concurrency():
+    def fast(timeout):
+        time.sleep(0.1)
+        return "ok"
+
+    hedge = HedgePolicy(delay=0.3)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=200) as executor:
+        results = list(executor.map(lambda _: call_with_retry(fast, hedge=hedge), range(200)))
+    # Every call is faster than the hedge delay, so none is duplicated however many run at once.
+    assert results == ["ok"] * 200 and hedge.hedges == 0
+    assert time.monotonic() - start < 0.3
+
+def test_hedge_waits_for_latency_history():
+    hedge = HedgePolicy(min_samples=3)
+    for _ in range(3):
+        assert hedge.hedge_delay() is None
+        call_with_retry(lambda timeout: "ok", hedge=hedge)
+    assert hedge.hedge_delay() is not None
+
+def test_async_hedge_cancels_loser():
+    cancelled = []
+
+    async def first_is_slow(timeout, calls=[]):
+        calls.append(timeout)
+        try:
+            await asyncio.sleep(0.5 if len(calls) == 1 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return len(calls)
+
+    async def main():
+        result = await acall_with_retry(first_is_slow, hedge=HedgePolicy(delay=0.05))
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == 2
+    assert cancelled == [True]
+
+def test_llm_call_retries_mock_errors():
+    with MockLLMServer(error_rate=0.5, error_status=503) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        for i in range(5):
+            assert llm_call(f"try {i}", client=client, retry=RetryPolicy(max_attempts=20, base_delay=0.001)) == f"echo: try {i}"
+        assert server.request_count >= 5
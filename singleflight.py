@@ -0,0 +1,101 @@
+# Request coalescing: concurrent callers with the same key share one in-flight call.
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+import threading
+import asyncio
+import weakref
+
+
+class SingleFlight:
+    """
+    Thread-based request coalescing.
+
+    The first caller for a key runs the function; callers arriving while it is in flight
+    wait for and share its result (or exception). Nothing is kept once the call finishes,
+    so unlike a cache this only deduplicates concurrent bursts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run fn(*args, **kwargs) unless a call with the same key is already in flight.
+
+        Args:
+            key (str): Identifies byte-identical requests.
+            fn (Callable): The function to run.
+
+        Returns:
+            Any: The result of the (possibly shared) call.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many calls ran and how many were saved by sharing."""
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio request coalescing, the event-loop counterpart of SingleFlight.
+
+    The shared call runs in its own task, so cancelling one waiting caller does not
+    cancel the request for the others. Calls are only shared within one event loop.
+    """
+
+    def __init__(self):
+        self._calls: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Task[Any]]]" = weakref.WeakKeyDictionary()
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """
+        Await fn(*args, **kwargs) unless a call with the same key is already in flight.
+
+        Args:
+            key (str): Identifies byte-identical requests.
+            fn (Callable): The coroutine function to run.
+
+        Returns:
+            Any: The result of the (possibly shared) call.
+        """
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            task = calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many calls ran and how many were saved by sharing."""
+        in_flight = sum(len(calls) for calls in list(self._calls.values()))
+        return {"calls": self.calls, "shared": self.shared, "in_flight": in_flight}
@@ -0,0 +1,73 @@
+from singleflight import SingleFlight, AsyncSingleFlight
+from concurrent.futures import ThreadPoolExecutor
+from llm import llm_call, allm_call, get_client, get_async_client, coalescer
+from mock_llm_server import MockLLMServer
+import threading
+import asyncio
+import pytest
+import time
+
+def test_threads_share_one_call():
+    flight = SingleFlight()
+    barrier = threading.Barrier(8)
+    runs = []
+
+    def slow():
+        runs.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    def caller(_):
+        barrier.wait()
+        return flight.do("key", slow)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(caller, range(8)))
+    assert results == ["result"] * 8
+    assert len(runs) == 1
+    assert flight.stats() == {"calls": 1, "shared": 7, "in_flight": 0}
+
+def test_threads_share_exceptions():
+    flight = SingleFlight()
+
+    def boom():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("key", boom)
+    assert flight.stats()["in_flight"] == 0
+
+def test_asyncio_share_one_call():
+    flight = AsyncSingleFlight()
+    runs = []
+
+    async def slow(value):
+        runs.append(value)
+        await asyncio.sleep(0.05)
+        return value
+
+    async def main():
+        return await asyncio.gather(*[flight.do("a", slow, "A") for _ in range(5)], flight.do("b", slow, "B"))
+
+    assert asyncio.run(main()) == ["A"] * 5 + ["B"]
+    assert sorted(runs) == ["A", "B"]
+    assert flight.stats() == {"calls": 2, "shared": 4, "in_flight": 0}
+
+def test_llm_call_coalesce():
+    with MockLLMServer(latency=0.2) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        saved = coalescer.stats()["shared"]
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(lambda _: llm_call("same", client=client, coalesce=True), range(6)))
+        assert results == ["echo: same"] * 6
+        assert server.request_count < 6
+        assert coalescer.stats()["shared"] - saved == 6 - server.request_count
+
+def test_allm_call_coalesce():
+    async def main(base_url):
+        client = get_async_client(base_url=base_url, api_key="mock")
+        return await asyncio.gather(*[allm_call("same", client=client, coalesce=True) for _ in range(6)])
+
+    with MockLLMServer(latency=0.1) as server:
+        assert asyncio.run(main(server.base_url)) == ["echo: same"] * 6
+        assert server.request_count == 1
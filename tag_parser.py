@@ -0,0 +1,166 @@
+# Parsing helpers for the XML-tagged responses the workflows ask the model for.
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+import re
+
+
+@lru_cache(maxsize=256)
+def tag_pattern(tag: str) -> Pattern[str]:
+    """Compiled pattern matching the first `<tag>...</tag>` block (cached)."""
+    return re.compile(f'<{re.escape(tag)}>(.*?)</{re.escape(tag)}>', re.DOTALL)
+
+
+@lru_cache(maxsize=256)
+def _tags_pattern(tags: Tuple[str, ...]) -> Pattern[str]:
+    """Compiled pattern matching any opening or closing tag in tags (cached)."""
+    names = "|".join(re.escape(tag) for tag in sorted(tags, key=len, reverse=True))
+    return re.compile(f'<(/?)({names})>')
+
+
+def parse_tags(text: str, tags: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Extract every occurrence of several XML tags in one linear scan.
+
+    Handles repeated tags (several <task> blocks) and nesting (<task> inside <tasks>).
+    Opening and closing tags are paired like brackets; unmatched ones are ignored.
+
+    Args:
+        text (str): The text containing the XML.
+        tags (Iterable[str]): The XML tags to extract.
+
+    Returns:
+        Dict[str, List[str]]: For each tag, the contents of all its blocks in document order.
+    """
+    tags = tuple(dict.fromkeys(tags))
+    if not tags:
+        return {}
+    found: Dict[str, List[Tuple[int, str]]] = {tag: [] for tag in tags}
+    open_at: Dict[str, List[int]] = {tag: [] for tag in tags}
+
+    for match in _tags_pattern(tags).finditer(text):
+        closing, tag = match.groups()
+        if not closing:
+            open_at[tag].append(match.end())
+        elif open_at[tag]:
+            start = open_at[tag].pop()
+            found[tag].append((start, text[start:match.start()]))
+
+    # Inner blocks of a self-nested tag close first; restore document order.
+    return {tag: [content for _, content in sorted(blocks)] for tag, blocks in found.items()}
+
+
+def extract_tags(text: str, tags: Iterable[str]) -> Dict[str, str]:
+    """
+    Extract the first block of each tag in one scan; "" for tags that are not found.
+
+    Args:
+        text (str): The text containing the XML.
+        tags (Iterable[str]): The XML tags to extract.
+
+    Returns:
+        Dict[str, str]: The content of the first block of each tag.
+    """
+    return {tag: blocks[0] if blocks else "" for tag, blocks in parse_tags(text, tags).items()}
+
+
+class TagStreamExtractor:
+    """
+    Incrementally extract XML tags from a streamed response.
+
+    Each tag resolves as soon as its closing tag arrives, with the same result as
+    llm.extract_xml on the full text: the content between the first `<tag>` and the
+    next `</tag>`. Feed chunks with `feed`; once `done` is True every required tag is
+    in and the rest of the generation can be cancelled.
+    """
+
+    def __init__(
+        self,
+        tags: Iterable[str],
+        required: Optional[Iterable[str]] = None,
+        on_tag: Optional[Callable[[str, str], None]] = None,
+    ):
+        """
+        Initialize the extractor.
+
+        Args:
+            tags (Iterable[str]): Tags to extract.
+            required (Iterable[str], optional): Tags that must be found before `done`. Defaults to all tags.
+            on_tag (Callable[[str, str], None], optional): Called with (tag, content) when a tag closes.
+        """
+        self.tags = list(tags)
+        self.required = set(self.tags if required is None else required)
+        self.on_tag = on_tag
+        self.results: Dict[str, str] = {}
+        self._buffer = ""
+        self._futures: Dict[str, Future] = {tag: Future() for tag in self.tags}
+        # Per tag: where the content starts once the opening tag is seen, and where to resume searching.
+        self._content_start: Dict[str, Optional[int]] = {tag: None for tag in self.tags}
+        self._search_from: Dict[str, int] = {tag: 0 for tag in self.tags}
+
+    @property
+    def done(self) -> bool:
+        """True once every required tag has closed."""
+        return self.required.issubset(self.results)
+
+    def future(self, tag: str) -> Future:
+        """Future resolving to the tag's content ("" if the stream ends without it)."""
+        return self._futures[tag]
+
+    def _scan(self, tag: str) -> Optional[str]:
+        buffer = self._buffer
+        start = self._content_start[tag]
+        if start is None:
+            opening = f"<{tag}>"
+            idx = buffer.find(opening, self._search_from[tag])
+            if idx < 0:
+                # Keep enough overlap to catch a tag split across chunks.
+                self._search_from[tag] = max(0, len(buffer) - len(opening) + 1)
+                return None
+            start = self._content_start[tag] = idx + len(opening)
+            self._search_from[tag] = start
+
+        closing = f"</{tag}>"
+        idx = buffer.find(closing, self._search_from[tag])
+        if idx < 0:
+            self._search_from[tag] = max(start, len(buffer) - len(closing) + 1)
+            return None
+        return buffer[start:idx]
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """
+        Consume the next chunk of the response.
+
+        Args:
+            chunk (str): The next text delta.
+
+        Returns:
+            List[Tuple[str, str]]: (tag, content) pairs that closed in this chunk.
+        """
+        self._buffer += chunk
+        closed = []
+        for tag in self.tags:
+            if tag in self.results:
+                continue
+            content = self._scan(tag)
+            if content is None:
+                continue
+            self.results[tag] = content
+            closed.append((tag, content))
+            self._futures[tag].set_result(content)
+            if self.on_tag is not None:
+                self.on_tag(tag, content)
+        return closed
+
+    def close(self) -> Dict[str, str]:
+        """End of stream: resolve tags that never closed to "" and return all results."""
+        for tag in self.tags:
+            if tag not in self.results:
+                self.results[tag] = ""
+                self._futures[tag].set_result("")
+        return self.results
+
+    @property
+    def text(self) -> str:
+        """The response text consumed so far."""
+        return self._buffer
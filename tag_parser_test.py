@@ -0,0 +1,67 @@
+from llm import extract_xml
+from tag_parser import TagStreamExtractor, parse_tags, extract_tags
+import random
+
+RESPONSE = """
+<reasoning>
+The ticket mentions an unexpected <b>charge</b>.
+</reasoning>
+<selection>billing</selection>
+<feedback>none</feedback>
+"""
+
+def _chunks(text, rng):
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, 7)
+        yield text[i:i + n]
+        i += n
+
+def test_stream_extractor_matches_extract_xml():
+    rng = random.Random(0)
+    for _ in range(50):
+        extractor = TagStreamExtractor(["reasoning", "selection", "feedback", "missing"])
+        for chunk in _chunks(RESPONSE, rng):
+            extractor.feed(chunk)
+        results = extractor.close()
+        for tag in ["reasoning", "selection", "feedback", "missing"]:
+            assert results[tag] == extract_xml(RESPONSE, tag)
+
+def test_stream_extractor_resolves_early():
+    seen = []
+    extractor = TagStreamExtractor(["reasoning", "selection"], required=["selection"],
+                                   on_tag=lambda tag, content: seen.append(tag))
+    future = extractor.future("selection")
+    consumed = 0
+    for chunk in _chunks(RESPONSE, random.Random(1)):
+        consumed += len(chunk)
+        extractor.feed(chunk)
+        if extractor.done:
+            break
+    assert future.result(timeout=0) == "billing"
+    assert seen == ["reasoning", "selection"]
+    assert consumed < len(RESPONSE)
+
+def test_parse_tags_repeated_and_nested():
+    text = """
+    <analysis>two approaches</analysis>
+    <tasks>
+        <task><type>formal</type><description>Precise
+        and technical</description></task>
+        <task><type>casual</type><description>Friendly</description></task>
+    </tasks>
+    """
+    tags = parse_tags(text, ["analysis", "tasks", "task", "type", "description", "missing"])
+    assert tags["analysis"] == ["two approaches"]
+    assert len(tags["tasks"]) == 1 and "<task>" in tags["tasks"][0]
+    assert len(tags["task"]) == 2
+    assert tags["type"] == ["formal", "casual"]
+    assert tags["description"] == ["Precise\n        and technical", "Friendly"]
+    assert tags["missing"] == []
+
+def test_extract_tags_matches_extract_xml():
+    tags = ["reasoning", "selection", "feedback", "missing"]
+    assert extract_tags(RESPONSE, tags) == {tag: extract_xml(RESPONSE, tag) for tag in tags}
+
+def test_parse_tags_self_nested_in_document_order():
+    assert parse_tags("<a>x<a>y</a>z</a><a>w</a>", ["a"]) == {"a": ["x<a>y</a>z", "y", "w"]}
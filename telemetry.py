@@ -0,0 +1,344 @@
+# Telemetry for LLM calls and workflow steps: per-call records tagged with the enclosing workflow span,
+# aggregated into counters and histograms, exported in Prometheus text format or streamed to JSONL.
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+import threading
+import bisect
+import json
+import time
+
+T = TypeVar("T")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus semantics (`le` upper bounds). Not thread-safe."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations <= bound) pairs, ending with +Inf."""
+        pairs, total = [], 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the q-quantile (0..1) by linear interpolation inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.bounds[-1] if self.bounds else None
+
+
+@dataclass
+class SpanRecord:
+    """One workflow step, e.g. step i of a chain or the selector of a route."""
+
+    name: str
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    parent: Optional[str] = None
+    started: float = 0.0
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class CallRecord:
+    """One LLM request as seen by the caller, tagged with the innermost enclosing span."""
+
+    kind: str
+    model: str
+    span: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    started: float = 0.0
+    latency: Optional[float] = None
+    ttft: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    cache_hit: bool = False
+    coalesced: bool = False
+    cancelled: bool = False
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @property
+    def retries(self) -> int:
+        """Requests sent beyond the first (retries and hedges)."""
+        return max(0, self.attempts - 1)
+
+    def record_usage(self, usage: Any) -> None:
+        """Add a completion's `usage`; hedged duplicates are all billed, so usage accumulates."""
+        if usage is None:
+            return
+        for name in ("prompt_tokens", "completion_tokens"):
+            value = getattr(usage, name, None)
+            if value is not None:
+                setattr(self, name, (getattr(self, name) or 0) + value)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None)
+        if cached is not None:
+            self.cached_tokens = (self.cached_tokens or 0) + cached
+
+
+Record = Union[CallRecord, SpanRecord]
+
+_current_span: ContextVar[Optional[SpanRecord]] = ContextVar("llm_span", default=None)
+
+
+def current_span() -> Optional[SpanRecord]:
+    """The innermost open span in this context."""
+    return _current_span.get()
+
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """Wrap fn to run in a copy of the current context, so spans carry over into executor threads."""
+    context = copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class JsonlSink:
+    """Append every record to a JSONL file as it is completed."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, record: Record) -> None:
+        line = json.dumps({"type": "call" if isinstance(record, CallRecord) else "span", **asdict(record)},
+                          ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Tuple[Tuple[str, Any], ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+_METRICS = {
+    "llm_requests_total": ("counter", "LLM calls by outcome."),
+    "llm_cache_hits_total": ("counter", "LLM calls answered from the response cache."),
+    "llm_cancelled_total": ("counter", "Streamed calls closed by the caller before the model finished."),
+    "llm_retries_total": ("counter", "Requests sent beyond the first per call (retries and hedges)."),
+    "llm_errors_total": ("counter", "Failed LLM calls by exception type."),
+    "llm_tokens_total": ("counter", "Tokens reported in completion usage, including prompt tokens read from the provider's prompt cache."),
+    "llm_request_duration_seconds": ("histogram", "Latency of LLM calls as seen by the caller."),
+    "llm_ttft_seconds": ("histogram", "Time to first token of streamed calls."),
+    "llm_prompt_tokens": ("histogram", "Prompt tokens per call."),
+    "llm_completion_tokens": ("histogram", "Completion tokens per call."),
+    "workflow_span_duration_seconds": ("histogram", "Duration of workflow steps."),
+}
+
+
+class Telemetry:
+    """
+    Collects call and span records.
+
+    Every record updates the in-memory counters and histograms (see `to_prometheus` and
+    `snapshot`) and is passed to each sink, e.g. a JsonlSink.
+    """
+
+    def __init__(self, sinks: Optional[List[Callable[[Record], None]]] = None):
+        self.sinks: List[Callable[[Record], None]] = list(sinks or [])
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], Histogram] = {}
+
+    def add_sink(self, sink: Callable[[Record], None]) -> None:
+        self.sinks.append(sink)
+
+    def reset(self) -> None:
+        """Drop the aggregated metrics."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[SpanRecord]:
+        """Tag the LLM calls made inside the block with this workflow step and time the step."""
+        parent = _current_span.get()
+        record = SpanRecord(name, attributes, parent.name if parent else None, time.time())
+        token = _current_span.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.duration = time.perf_counter() - start
+            _current_span.reset(token)
+            self.record(record)
+
+    @contextmanager
+    def call(self, model: str, kind: str = "call") -> Iterator[CallRecord]:
+        """Time one LLM call; the caller fills in usage, attempts and cache hits on the yielded record."""
+        span = _current_span.get()
+        record = CallRecord(kind, model, span.name if span else None, dict(span.attributes) if span else {}, time.time())
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            if record.latency is None:
+                record.latency = time.perf_counter() - start
+            self.record(record)
+
+    def _inc(self, name: str, labels: Tuple[Tuple[str, Any], ...], amount: float = 1) -> None:
+        self._counters[name, labels] = self._counters.get((name, labels), 0) + amount
+
+    def _observe(self, name: str, labels: Tuple[Tuple[str, Any], ...], value: float, buckets: Sequence[float]) -> None:
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[name, labels] = Histogram(buckets)
+        histogram.observe(value)
+
+    def record(self, record: Record) -> None:
+        """Aggregate a finished record and pass it to the sinks."""
+        with self._lock:
+            if isinstance(record, SpanRecord):
+                self._observe("workflow_span_duration_seconds", (("span", record.name),), record.duration, LATENCY_BUCKETS)
+            else:
+                labels = (("model", record.model), ("kind", record.kind), ("span", record.span or ""))
+                self._inc("llm_requests_total", labels + (("status", "error" if record.error else "ok"),))
+                if record.cache_hit:
+                    self._inc("llm_cache_hits_total", labels)
+                if record.cancelled:
+                    self._inc("llm_cancelled_total", labels)
+                if record.retries:
+                    self._inc("llm_retries_total", labels, record.retries)
+                if record.error:
+                    self._inc("llm_errors_total", labels + (("error", record.error),))
+                self._observe("llm_request_duration_seconds", labels, record.latency, LATENCY_BUCKETS)
+                if record.ttft is not None:
+                    self._observe("llm_ttft_seconds", labels, record.ttft, LATENCY_BUCKETS)
+                for name, value in (("prompt", record.prompt_tokens), ("completion", record.completion_tokens),
+                                    ("cached", record.cached_tokens)):
+                    if value is not None:
+                        self._inc("llm_tokens_total", labels + (("type", name),), value)
+                        if name != "cached":
+                            self._observe(f"llm_{name}_tokens", labels, value, TOKEN_BUCKETS)
+        for sink in self.sinks:
+            sink(record)
+
+    def counter(self, name: str, **labels: Any) -> float:
+        """Sum of a counter over all label sets matching the given labels."""
+        with self._lock:
+            return sum(value for (metric, key), value in self._counters.items()
+                       if metric == name and labels.items() <= dict(key).items())
+
+    def histogram(self, name: str, **labels: Any) -> Histogram:
+        """Merge of a histogram over all label sets matching the given labels."""
+        merged: Optional[Histogram] = None
+        with self._lock:
+            for (metric, key), histogram in self._histograms.items():
+                if metric == name and labels.items() <= dict(key).items():
+                    if merged is None:
+                        merged = Histogram(histogram.bounds)
+                    merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                    merged.count += histogram.count
+                    merged.sum += histogram.sum
+        return merged or Histogram()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-span summary: calls, errors, tokens, the share of prompt tokens cached by the provider and latency percentiles."""
+        with self._lock:
+            spans = sorted({dict(key).get("span", "") for (metric, key) in self._histograms
+                            if metric == "llm_request_duration_seconds"})
+        summary = {}
+        for span in spans:
+            latency = self.histogram("llm_request_duration_seconds", span=span)
+            prompt_tokens = self.counter("llm_tokens_total", span=span, type="prompt")
+            cached_tokens = self.counter("llm_tokens_total", span=span, type="cached")
+            summary[span or "(none)"] = {
+                "calls": latency.count,
+                "errors": self.counter("llm_errors_total", span=span),
+                "cache_hits": self.counter("llm_cache_hits_total", span=span),
+                "cancelled": self.counter("llm_cancelled_total", span=span),
+                "retries": self.counter("llm_retries_total", span=span),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": self.counter("llm_tokens_total", span=span, type="completion"),
+                "cached_tokens": cached_tokens,
+                "cached_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+                "latency_total": latency.sum,
+                "latency_p50": latency.quantile(0.5),
+                "latency_p95": latency.quantile(0.95),
+            }
+        return summary
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help) in _METRICS.items():
+                counters = sorted((key, value) for (metric, key), value in self._counters.items() if metric == name)
+                histograms = sorted(((key, h) for (metric, key), h in self._histograms.items() if metric == name),
+                                    key=lambda item: item[0])
+                if not counters and not histograms:
+                    continue
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in counters:
+                    lines.append(f"{name}{_labels(key)} {value:g}")
+                for key, histogram in histograms:
+                    for bound, count in histogram.cumulative():
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_labels(key, f'le=\"{le}\"')} {count}")
+                    lines.append(f"{name}_sum{_labels(key)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+_telemetry = Telemetry()
+
+
+def get_telemetry() -> Telemetry:
+    """Return the process-wide telemetry that llm_call, llm_stream and the workflows report to."""
+    return _telemetry
+
+
+def set_telemetry(telemetry: Telemetry) -> None:
+    """Replace the process-wide telemetry, e.g. with one that has a JsonlSink attached."""
+    global _telemetry
+    _telemetry = telemetry
+
+
+def span(name: str, **attributes: Any):
+    """Shorthand for get_telemetry().span(name, **attributes)."""
+    return get_telemetry().span(name, **attributes)
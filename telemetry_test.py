@@ -0,0 +1,94 @@
+from basic_workflow import chain, parallel, route
+from llm import llm_call, llm_stream, get_client
+from llm_cache import ResponseCache
+from mock_llm_server import MockLLMServer
+from retry import RetryPolicy
+from telemetry import Histogram, JsonlSink, Telemetry, set_telemetry, get_telemetry
+import openai
+import json
+import pytest
+
+@pytest.fixture
+def telemetry():
+    previous = get_telemetry()
+    telemetry = Telemetry()
+    set_telemetry(telemetry)
+    yield telemetry
+    set_telemetry(previous)
+
+def _support_responder(body):
+    prompt = body["messages"][-1]["content"]
+    if "<selection>" in prompt:
+        return "<reasoning>Mentions a charge.</reasoning>\n<selection>Billing</selection>"
+    return "handled"
+
+def test_histogram_quantiles():
+    histogram = Histogram([1, 2, 4])
+    for value in [0.5, 1.5, 1.5, 3, 10]:
+        histogram.observe(value)
+    assert histogram.cumulative() == [(1, 1), (2, 3), (4, 4), (float("inf"), 5)]
+    assert histogram.count == 5 and histogram.sum == 16.5
+    assert 1 < histogram.quantile(0.5) <= 2
+
+def test_workflow_spans(telemetry):
+    with MockLLMServer(responder=_support_responder) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        chain("text", ["a", "b", "c"], client=client)
+        parallel(["x", "y"], "p", client=client)
+        route("Unexpected charge", {"billing": "Billing team"}, client=client)
+
+    assert telemetry.counter("llm_requests_total", span="chain.step") == 3
+    assert telemetry.counter("llm_requests_total", span="parallel.item") == 2
+    assert telemetry.counter("llm_requests_total", span="route.selector", kind="stream") == 1
+    assert telemetry.counter("llm_requests_total", span="route.handler") == 1
+    assert telemetry.counter("llm_tokens_total", type="completion") > 0
+    assert telemetry.histogram("llm_ttft_seconds", span="route.selector").count == 1
+    assert telemetry.histogram("workflow_span_duration_seconds", span="chain").count == 1
+    assert telemetry.snapshot()["chain.step"]["calls"] == 3
+
+def test_cache_hits_retries_and_errors(telemetry, tmp_path):
+    with MockLLMServer() as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        cache = ResponseCache()
+        llm_call("hello", client=client, cache=cache)
+        llm_call("hello", client=client, cache=cache)
+        assert telemetry.counter("llm_cache_hits_total") == 1
+
+        server.error_rate = 1.0
+        with pytest.raises(openai.RateLimitError):
+            llm_call("fail", client=client, retry=RetryPolicy(max_attempts=3, base_delay=0))
+    assert telemetry.counter("llm_retries_total") == 2
+    assert telemetry.counter("llm_errors_total", error="RateLimitError") == 1
+    assert telemetry.counter("llm_requests_total", status="error") == 1
+
+def test_exporters(telemetry, tmp_path):
+    sink = JsonlSink(str(tmp_path / "telemetry.jsonl"))
+    telemetry.add_sink(sink)
+    with MockLLMServer() as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        chain("text", ["a"], client=client)
+    sink.close()
+
+    records = [json.loads(line) for line in (tmp_path / "telemetry.jsonl").read_text().splitlines()]
+    assert [r["type"] for r in records] == ["call", "span", "span"]
+    assert records[0]["span"] == "chain.step" and records[0]["attributes"] == {"step": 0}
+    assert records[1]["parent"] == "chain"
+
+    text = telemetry.to_prometheus()
+    assert "# TYPE llm_request_duration_seconds histogram" in text
+    assert 'llm_requests_total{model="qwen-plus",kind="call",span="chain.step",status="ok"} 1' in text
+    assert 'le="+Inf"} 1' in text
+
+def test_prefix_cache_ratio(telemetry):
+    static = " ".join(["rule"] * 20)
+    with MockLLMServer(prefix_cache_block=4) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        llm_call(f"{static}\nfirst", client=client)
+        llm_call(f"{static}\nsecond", client=client)
+        "".join(llm_stream(f"{static}\nthird", client=client))
+        llm_call(f"other {static}", client=client)
+    # The default system prompt and the 20 rules are cached (less the last, partial block); the last call shares
+    # only the system prompt.
+    assert telemetry.counter("llm_tokens_total", type="cached") == 22 + 22 + 3
+    stats = telemetry.snapshot()["(none)"]
+    assert stats["cached_tokens"] == 47 and stats["cached_ratio"] == 47 / (4 * 24)
@@ -1,6 +1,15 @@
-from basic_workflow import chain, parallel, route
-from orchestrator_workers_workflow import FlexibleOrchestrator
-from evaluator_optimizer_workflow import loop
+from basic_workflow import chain, chain_many, parallel, parallel_iter, route, achain, aparallel, aroute, set_async_concurrency
+from orchestrator_workers_workflow import FlexibleOrchestrator, TaskStreamParser, parse_tasks
+from evaluator_optimizer_workflow import LoopLimitExceeded, loop
+from llm import get_client, get_async_client
+from llm_cache import ResponseCache
+from mock_llm_server import MockLLMServer
+from retry import HedgePolicy, RetryPolicy
+from telemetry import Telemetry, get_telemetry, set_telemetry
+import itertools
+import asyncio
+import random
+import time
 import pytest
 
 def test_chain():
@@ -271,4 +280,397 @@ def test_evalutor_optimizer():
     </user input>
     """
 
-    loop(task, evaluator_prompt, generator_prompt)
\ No newline at end of file
+    loop(task, evaluator_prompt, generator_prompt)
+
+
+def _orchestrator_responder(body):
+    prompt = body["messages"][-1]["content"]
+    if prompt.startswith("Plan"):
+        tasks = "".join(f"<task>\n<type>{t}</type>\n<description>Part {t}</description>\n</task>\n"
+                        for t in ["a", "b", "slow", "d"])
+        return f"<analysis>Four parts.</analysis>\n<tasks>\n{tasks}</tasks>"
+    part = prompt.rsplit(" ", 1)[-1]
+    time.sleep(2.0 if part == "slow" else 0.2)
+    return f"<response>done {part}</response>"
+
+
+def test_orchestrator_concurrent_workers_offline():
+    with MockLLMServer(responder=_orchestrator_responder) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        orchestrator = FlexibleOrchestrator("Plan {task}", "Do {task_type}", worker_timeout=0.5,
+                                            retry=RetryPolicy(max_attempts=1), client=client)
+        start = time.perf_counter()
+        results = orchestrator.process("x")["worker_results"]
+        # The workers overlap (~0.2s) and the slow one is cut off at its deadline instead of taking 2s.
+        assert time.perf_counter() - start < 1.0
+        assert [r["result"] for r in results] == ["done a", "done b", "", "done d"]
+        assert "timed out" in results[2]["error"] and "error" not in results[0]
+
+        orchestrator = FlexibleOrchestrator("Plan {task}", "Do {task_type}", n_workers=1, client=client)
+        start = time.perf_counter()
+        assert len(orchestrator.process("x")["worker_results"]) == 4
+        assert time.perf_counter() - start > 2.6
+
+
+def _dag_plan(*tasks):
+    return "<analysis>Plan.</analysis>\n<tasks>\n" + "".join(
+        f"<task>\n<id>{i}</id>\n<type>{i}</type>\n<description>Write {i}</description>\n<depends_on>{', '.join(deps)}</depends_on>\n</task>\n"
+        for i, deps in tasks
+    ) + "</tasks>"
+
+
+def test_orchestrator_dependencies_offline():
+    plan = _dag_plan(("outline", []), ("intro", ["outline"]), ("body", ["outline"]), ("summary", ["intro", "body"]))
+    assert [t["depends_on"] for t in parse_tasks(plan)] == [[], ["outline"], ["outline"], ["intro", "body"]]
+
+    def respond(body):
+        prompt = body["messages"][-1]["content"]
+        if prompt.startswith("Plan"):
+            return plan
+        time.sleep(0.2)
+        return f"<response>{prompt.splitlines()[0].split()[-1]} text</response>"
+
+    spans = []
+    previous = get_telemetry()
+    set_telemetry(Telemetry(sinks=[lambda r: spans.append(r) if getattr(r, "name", None) == "orchestrator" else None]))
+    try:
+        with MockLLMServer(responder=respond, keep_requests=True) as server:
+            client = get_client(base_url=server.base_url, api_key="mock")
+            orchestrator = FlexibleOrchestrator("Plan {task}", "Do {task_type}", client=client)
+            start = time.perf_counter()
+            results = orchestrator.process("x")["worker_results"]
+            elapsed = time.perf_counter() - start
+    finally:
+        set_telemetry(previous)
+
+    assert [r["result"] for r in results] == ["outline text", "intro text", "body text", "summary text"]
+    # intro and body run side by side: three levels (~0.6s), not four calls (~0.8s).
+    assert elapsed < 0.75
+    summary_prompt = server.requests[-1]["messages"][-1]["content"]
+    assert '<result id="intro">\nintro text\n</result>' in summary_prompt and "outline text" not in summary_prompt
+    attributes = spans[0].attributes
+    assert attributes["critical_path"][0] == "outline" and attributes["critical_path"][-1] == "summary"
+    assert 0.55 < attributes["critical_path_seconds"] < elapsed
+
+    with MockLLMServer(responder=lambda body: _dag_plan(("a", ["c"]), ("b", ["a"]), ("c", ["b"]))) as server:
+        orchestrator = FlexibleOrchestrator("Plan {task}", "Do {task_type}",
+                                            client=get_client(base_url=server.base_url, api_key="mock"))
+        with pytest.raises(ValueError, match="a -> c -> b -> a"):
+            orchestrator.process("x")
+
+
+def test_task_stream_parser_matches_parse_tasks():
+    plan = _dag_plan(("outline", []), ("intro", ["outline"]), ("summary", ["intro"]))
+    parser = TaskStreamParser()
+    seen = []
+    for char in plan:
+        for t in parser.feed(char):
+            # Each task is out as soon as its closing tag is.
+            assert parser.text.endswith("</task>")
+            seen.append(t)
+    assert seen == parse_tasks(plan)
+
+
+def test_orchestrator_streams_tasks_offline():
+    # The first task's worker can start while the rest of the plan is still being generated.
+    plan = _dag_plan(("a", []), ("b", [])) + "\n<notes>" + "more planning notes " * 30 + "</notes>"
+
+    def respond(body):
+        prompt = body["messages"][-1]["content"]
+        if prompt.startswith("Plan"):
+            if not body.get("stream"):
+                time.sleep(len(plan.split()) * 0.01)  # The mock only delays streamed tokens.
+            return plan
+        time.sleep(0.5)
+        return "<response>ok</response>"
+
+    with MockLLMServer(responder=respond, token_delay=0.01) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        elapsed = {}
+        for stream_tasks in (False, True):
+            orchestrator = FlexibleOrchestrator("Plan {task}", "Do {task_type}", stream_tasks=stream_tasks, client=client)
+            start = time.perf_counter()
+            results = orchestrator.process("x")
+            elapsed[stream_tasks] = time.perf_counter() - start
+            assert [r["result"] for r in results["worker_results"]] == ["ok", "ok"] and results["analysis"] == "Plan."
+    # Plan (~1s) then workers (0.5s), vs workers hidden behind the trailing notes.
+    assert elapsed[True] < elapsed[False] - 0.3
+
+
+def test_orchestrator_plan_keeps_call_only_options_offline():
+    plan = _dag_plan(("a", []), ("b", []))
+    respond = lambda body: plan if body["messages"][-1]["content"].startswith("Plan") else "<response>ok</response>"
+    for options in ({"hedge": HedgePolicy(delay=5)}, {"coalesce": True}, {}):
+        with MockLLMServer(responder=respond, keep_requests=True) as server:
+            client = get_client(base_url=server.base_url, api_key="mock")
+            results = FlexibleOrchestrator("Plan {task}", "Do {task_type}", client=client, **options).process("x")
+        assert [r["result"] for r in results["worker_results"]] == ["ok", "ok"]
+        # Streams are neither hedged nor coalesced, so with those options the plan is one blocking call.
+        assert bool(server.requests[0].get("stream")) == (not options)
+
+
+def test_chain_stream_offline():
+    """Streaming chain returns the same result as the blocking chain."""
+    with MockLLMServer() as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        steps = ["Summarize", "Translate"]
+        assert chain("some text", steps, stream=True, client=client) == chain("some text", steps, client=client)
+
+
+def _support_responder(body):
+    prompt = body["messages"][-1]["content"]
+    if "<selection>" in prompt:
+        return "<reasoning>Mentions a charge.</reasoning>\n<selection>Billing</selection>\nAnything after this is never read."
+    return f"handled by: {prompt.splitlines()[0]}"
+
+
+def test_route_offline():
+    with MockLLMServer(responder=_support_responder) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        routes = {"billing": "Billing team", "technical": "Tech team"}
+        assert route("Unexpected charge on my card", routes, client=client) == "handled by: Billing team"
+
+
+def _jittery_responder(body):
+    prompt = body["messages"][-1]["content"]
+    if prompt.endswith("bad"):
+        raise ValueError("bad input")
+    time.sleep(random.uniform(0, 0.02))
+    return prompt.rsplit(" ", 1)[-1]
+
+
+def test_parallel_iter_offline():
+    pulled = []
+
+    def inputs():
+        for i in range(40):
+            pulled.append(i)
+            yield "bad" if i == 7 else str(i)
+
+    with MockLLMServer(responder=_jittery_responder) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        results = parallel_iter(inputs(), "Echo", n_workers=4, window=4, client=client, retry=RetryPolicy(max_attempts=1))
+        first = next(results)
+        # Inputs are pulled lazily: only the window (plus the one refill) has been read.
+        assert len(pulled) <= 5
+        results = [first, *results]
+        assert server.peak_in_flight <= 4
+
+    assert sorted(r.index for r in results) == list(range(40))
+    failed = [r for r in results if r.error is not None]
+    assert [r.index for r in failed] == [7] and failed[0].output is None
+    assert all(r.output == r.input for r in results if r.error is None)
+
+
+def test_parallel_iter_ordered_offline():
+    with MockLLMServer(responder=_jittery_responder) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        inputs = [str(i) for i in range(30)]
+        results = list(parallel_iter(inputs, "Echo", n_workers=8, ordered=True, reorder_buffer=2, client=client))
+    assert [r.output for r in results] == inputs
+
+
+def test_async_workflows_offline():
+    async def main(base_url):
+        client = get_async_client(base_url=base_url, api_key="mock")
+        routes = {"billing": "Billing team", "technical": "Tech team"}
+        assert await aroute("Unexpected charge on my card", routes, client=client) == "handled by: Billing team"
+        assert await achain("text", ["Summarize"], client=client) == "handled by: Summarize"
+        return await aparallel([str(i) for i in range(20)], "Echo", client=client)
+
+    set_async_concurrency(3)
+    try:
+        with MockLLMServer(responder=_support_responder, latency=0.01) as server:
+            outputs = asyncio.run(main(server.base_url))
+            assert server.peak_in_flight <= 3
+    finally:
+        set_async_concurrency(1000)
+    assert outputs == ["handled by: Echo"] * 20
+
+
+def _pipeline_responder(body):
+    step, _, value = body["messages"][-1]["content"].partition("\nInput: ")
+    if value == "bad":
+        raise ValueError("bad input")
+    time.sleep(0.02)
+    return f"{step}({value})"
+
+
+def test_chain_many_offline():
+    inputs = ["bad" if i == 3 else str(i) for i in range(12)]
+    with MockLLMServer(responder=_pipeline_responder) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        results = list(chain_many(inputs, ["a", "b", "c"], n_workers=[1, 2, 1], client=client, retry=RetryPolicy(max_attempts=1)))
+        # Stages overlap: more than one call in flight, at most one per stage worker.
+        assert 1 < server.peak_in_flight <= 4
+
+    assert sorted(r.index for r in results) == list(range(12))
+    by_index = {r.index: r for r in results}
+    assert by_index[3].error is not None and by_index[3].output is None
+    assert all(by_index[i].output == f"c(b(a({i})))" for i in range(12) if i != 3)
+
+
+def test_chain_many_backpressure_offline():
+    pulled = []
+
+    def inputs():
+        for i in range(200):
+            pulled.append(i)
+            yield str(i)
+
+    with MockLLMServer(keep_requests=True) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        results = chain_many(inputs(), ["a", "b"], n_workers=2, client=client)
+        next(results)
+        time.sleep(1.0)
+        # One input per queue slot and worker, plus the one the feeder holds: the idle consumer stalls the rest.
+        assert len(pulled) <= 3 * 2 + 2 * 2 + 2 and len(server.requests) <= 2 * len(pulled)
+        results.close()
+
+
+def _optimizer_responder(good_at):
+    """Generations are numbered; the good_at-th one passes evaluation."""
+    generations = itertools.count(1)
+
+    def respond(body):
+        prompt = body["messages"][-1]["content"]
+        if "Content to evaluate:" in prompt:
+            time.sleep(0.1)
+            if prompt.endswith("attempt good"):
+                return "<evaluation>PASS</evaluation><feedback>Done.</feedback>"
+            return "<evaluation>NEEDS_IMPROVEMENT</evaluation><feedback>Try again.</feedback>"
+        n = next(generations)
+        time.sleep(0.1)
+        return f"<thoughts>Try {n}.</thoughts><response>attempt {'good' if n == good_at else n}</response>"
+    return respond
+
+
+def test_loop_best_of_n_offline():
+    with MockLLMServer(responder=_optimizer_responder(good_at=3), keep_requests=True) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        result, thoughts = loop("task", "Evaluate", "Generate", client=client)
+        assert result == "attempt good" and len(thoughts) == 3
+        # The later rounds carry the earlier attempts and their feedback.
+        assert "- attempt 2\n\nFeedback: Try again." in server.requests[-2]["messages"][-1]["content"]
+
+    with MockLLMServer(responder=_optimizer_responder(good_at=3)) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        start = time.perf_counter()
+        result, _ = loop("task", "Evaluate", "Generate", n_candidates=3, client=client)
+        # One round of parallel generate + evaluate (~0.2s) instead of three sequential ones (~0.6s).
+        assert result == "attempt good" and time.perf_counter() - start < 0.45
+
+
+def test_loop_prefix_layout_offline():
+    for prefix_layout in (False, True):
+        with MockLLMServer(responder=_optimizer_responder(good_at=2), keep_requests=True) as server:
+            client = get_client(base_url=server.base_url, api_key="mock")
+            loop("task", "Evaluate", "Generate", prefix_layout=prefix_layout, client=client)
+        prompt = server.requests[-2]["messages"][-1]["content"]
+        if prefix_layout:
+            assert prompt.startswith("Generate\nTask: task\nPrevious attempts:")
+        else:
+            # By default the previous attempts come before the task, as they always have.
+            assert prompt.startswith("Generate\nPrevious attempts:") and prompt.endswith("\nTask: task")
+
+def test_loop_limits_offline():
+    with MockLLMServer(responder=_optimizer_responder(good_at=100)) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        with pytest.raises(LoopLimitExceeded) as exc:
+            loop("task", "Evaluate", "Generate", max_rounds=2, client=client)
+        assert exc.value.result == "attempt 2" and len(exc.value.chain_of_thought) == 2
+
+        with pytest.raises(LoopLimitExceeded, match="token budget"):
+            loop("task", "Evaluate", "Generate", n_candidates=2, max_rounds=None, token_budget=60, client=client)
+
+    # No limit by default: like the original loop, it keeps going past any fixed number of rounds.
+    verdicts = iter(["NEEDS_IMPROVEMENT"] * 11 + ["PASS"])
+    respond = lambda body: (f"<evaluation>{next(verdicts)}</evaluation><feedback>Again.</feedback>"
+                            if "Content to evaluate:" in body["messages"][-1]["content"]
+                            else "<thoughts>Go.</thoughts><response>attempt</response>")
+    with MockLLMServer(responder=respond) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        assert len(loop("task", "Evaluate", "Generate", client=client)[1]) == 12
+
+
+def test_loop_eval_cache_and_early_exit_offline():
+    generations = itertools.count(1)
+
+    def respond(body):
+        prompt = body["messages"][-1]["content"]
+        if "Content to evaluate:" in prompt:
+            if prompt.endswith("attempt good"):
+                return "<evaluation>PASS</evaluation><feedback>" + "Looks right. " * 50 + "</feedback>"
+            return "<evaluation>NEEDS_IMPROVEMENT</evaluation><feedback>Try again.</feedback>"
+        # The generator gets stuck on the same attempt, give or take whitespace, before finding a good one.
+        n = next(generations)
+        return f"<thoughts>Try {n}.</thoughts><response>{'attempt good' if n == 4 else 'attempt' + ' ' * n}</response>"
+
+    previous = get_telemetry()
+    telemetry = Telemetry()
+    set_telemetry(telemetry)
+    try:
+        with MockLLMServer(responder=respond, token_delay=0.01, keep_requests=True) as server:
+            client = get_client(base_url=server.base_url, api_key="mock")
+            start = time.perf_counter()
+            result, _ = loop("task", "Evaluate", "Generate", eval_cache=ResponseCache(), early_exit=True, client=client)
+            elapsed = time.perf_counter() - start
+    finally:
+        set_telemetry(previous)
+
+    assert result == "attempt good"
+    evaluations = [r for r in server.requests if "Content to evaluate:" in r["messages"][-1]["content"]]
+    assert len(evaluations) == 2
+    assert telemetry.counter("llm_cache_hits_total", span="loop.evaluate") == 2
+    # The 150-token feedback of the pass is never waited for.
+    assert telemetry.counter("llm_cancelled_total", span="loop.evaluate") == 1
+    assert elapsed < 1.0
+
+
+@pytest.mark.parametrize("early_exit", [False, True])
+def test_loop_pass_with_whitespace_offline(early_exit):
+    def respond(body):
+        prompt = body["messages"][-1]["content"]
+        if "Content to evaluate:" in prompt:
+            return "<evaluation>\n  PASS\n</evaluation><feedback>Fine.</feedback>"
+        return "<thoughts>Go.</thoughts><response>attempt</response>"
+
+    cache = ResponseCache()
+    with MockLLMServer(responder=respond, keep_requests=True) as server:
+        client = get_client(base_url=server.base_url, api_key="mock")
+        assert loop("task", "Evaluate", "Generate", max_rounds=2, eval_cache=cache, early_exit=early_exit,
+                    client=client) == ("attempt", [{"thoughts": "Go.", "result": "attempt"}])
+        # The cached verdict is the normalized one, so a repeat passes too.
+        assert loop("task", "Evaluate", "Generate", max_rounds=2, eval_cache=cache, early_exit=early_exit,
+                    client=client)[0] == "attempt"
+    assert len(server.requests) == 3
+
+def test_orchestrator_prefix_layout_offline():
+    plan = "<tasks>\n" + "".join(f"<task><type>style{i}</type><description>Variant {i}</description></task>\n"
+                                 for i in range(4)) + "</tasks>"
+    worker_prompt = "Write about {original_task}.\nStyle: {task_type}\nGuidelines: {task_description}\n" + \
+        "Follow the house rules: " + " ".join(["rule"] * 40) + "\nAnswer in <response></response> tags."
+
+    def respond(body):
+        return plan if body["messages"][-1]["content"].startswith("Plan") else "<response>ok</response>"
+
+    ratios = {}
+    previous = get_telemetry()
+    try:
+        for prefix_layout in (False, True):
+            telemetry = Telemetry()
+            set_telemetry(telemetry)
+            with MockLLMServer(responder=respond, prefix_cache_block=4, keep_requests=True) as server:
+                client = get_client(base_url=server.base_url, api_key="mock")
+                orchestrator = FlexibleOrchestrator("Plan {task}", worker_prompt, n_workers=1,
+                                                    prefix_layout=prefix_layout, client=client)
+                results = orchestrator.process("bottles")["worker_results"]
+            assert [r["result"] for r in results] == ["ok"] * 4
+            ratios[prefix_layout] = telemetry.snapshot()["orchestrator.worker"]["cached_ratio"]
+    finally:
+        set_telemetry(previous)
+
+    prompts = [r["messages"][-1]["content"] for r in server.requests[1:]]
+    assert all("Style: (see <task_type> below)" in p and "<task_description>\nVariant" in p for p in prompts)
+    # Only the first worker pays for the rules once they precede the per-subtask fields.
+    assert ratios[False] < 0.2 < 0.6 < ratios[True]